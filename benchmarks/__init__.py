@@ -0,0 +1 @@
+"""Offline benchmarks for metadataset; see benchmarks.run."""
@@ -0,0 +1,47 @@
+"""
+Compare two benchmark result files:
+
+    python -m benchmarks.compare old.json new.json [--threshold 0.1]
+
+Exits with status 1 when a benchmark got slower, or used more memory,
+by more than --threshold (a fraction).
+"""
+import argparse
+import json
+import sys
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("old")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="Relative slowdown / memory growth reported as a regression")
+    args = parser.parse_args()
+
+    with open(args.old) as fh:
+        old = json.load(fh)["benchmarks"]
+    with open(args.new) as fh:
+        new = json.load(fh)["benchmarks"]
+
+    regressions = []
+    print(f"{'benchmark':<26}{'old s':>10}{'new s':>10}{'ratio':>8}{'old MB':>10}{'new MB':>10}{'ratio':>8}")
+    for name in [n for n in new if n in old]:
+        o, n = old[name], new[name]
+        t_ratio = n["seconds"] / o["seconds"] if o["seconds"] else float("inf")
+        m_ratio = n["peak_rss_mb"] / o["peak_rss_mb"] if o["peak_rss_mb"] else float("inf")
+        flag = ""
+        if t_ratio > 1 + args.threshold or m_ratio > 1 + args.threshold:
+            regressions.append(name)
+            flag = "  <-- regression"
+        print(f"{name:<26}{o['seconds']:>10.3f}{n['seconds']:>10.3f}{t_ratio:>8.2f}"
+              f"{o['peak_rss_mb']:>10.1f}{n['peak_rss_mb']:>10.1f}{m_ratio:>8.2f}{flag}")
+
+    for name in sorted(set(old) ^ set(new)):
+        print(f"{name:<26}only in {'old' if name in old else 'new'}")
+
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
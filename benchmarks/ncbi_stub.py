@@ -0,0 +1,114 @@
+"""
+A local HTTP server standing in for https://ftp.ncbi.nlm.nih.gov, so the
+downloader can be benchmarked offline. It serves a directory tree (see
+synthetic.write_ncbi_tree), honours single-range 'bytes=N-' requests
+like the real server and can add a fixed latency per request. With
+`max_rps` it answers 429 with a Retry-After header once requests come
+in faster than that, the way a throttling server does.
+"""
+import shutil
+import threading
+import time
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Optional
+
+
+class _Handler(SimpleHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, as with the real server
+    disable_nagle_algorithm = True
+    latency = 0.0
+    throttle = None
+
+    def do_GET(self):
+        if self.latency:
+            time.sleep(self.latency)
+        if self.throttle is not None and not self.throttle.admit():
+            self.send_response(429)
+            self.send_header("Retry-After", "1")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        path = Path(self.translate_path(self.path))
+        if not path.is_file():
+            self.send_error(404)
+            return
+
+        size = path.stat().st_size
+        start = 0
+        range_header = self.headers.get("Range", "")
+        if range_header.startswith("bytes=") and range_header.endswith("-"):
+            start = int(range_header[6:-1])
+            if start >= size:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{size - 1}/{size}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(size - start))
+        self.end_headers()
+
+        with open(path, "rb") as fh:
+            fh.seek(start)
+            shutil.copyfileobj(fh, self.wfile, 1 << 20)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _Throttle:
+    """Token bucket of `rate` requests per second, counting refusals."""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.refused = 0
+        self.lock = threading.Lock()
+
+    def admit(self) -> bool:
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            self.refused += 1
+            return False
+
+
+class NCBIStub:
+    """
+    Serve `root` on 127.0.0.1 from a background thread:
+
+        with NCBIStub(root) as stub:
+            url = f"{stub.url}/genomes/all/..."
+    """
+
+    def __init__(self, root: Path, latency: float = 0.0, max_rps: Optional[float] = None):
+        self.throttle = _Throttle(max_rps) if max_rps else None
+        handler = type("Handler", (_Handler,), {"latency": latency, "throttle": self.throttle})
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), partial(handler, directory=str(root)))
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever,
+                                        kwargs={"poll_interval": 0.05}, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self) -> "NCBIStub":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,395 @@
+"""
+Offline benchmark suite. Synthetic inputs are generated once into
+--workdir (reused while --scale/--seed are unchanged), then every
+benchmark runs in a fresh interpreter so its peak RSS is its own:
+
+    python -m benchmarks.run --out results.json
+    python -m benchmarks.run --only parse_summary,run --scale 0.5
+    python -m benchmarks.compare old.json new.json
+
+Each result holds the best wall time over --repeat runs, throughput in
+items/s and MB/s, the peak RSS after setup and the peak RSS overall.
+"""
+import argparse
+import csv
+import json
+import logging
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, Tuple
+
+from benchmarks import synthetic
+from benchmarks.ncbi_stub import NCBIStub
+
+ROOT = Path(__file__).resolve().parent.parent
+CATEGORY = "bacteria"
+
+# setup(data_dir, tmp_dir) -> run() -> (items, bytes)
+Benchmark = Callable[[Path, Path], Callable[[], Tuple[int, int]]]
+BENCHMARKS: Dict[str, Benchmark] = {}
+
+
+def benchmark(fn: Benchmark) -> Benchmark:
+    BENCHMARKS[fn.__name__] = fn
+    return fn
+
+
+def _peak_rss_mb() -> float:
+    # VmHWM, unlike ru_maxrss on Linux, is not carried over from the parent across exec
+    try:
+        with open("/proc/self/status") as fh:
+            for line in fh:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1 << 20 if sys.platform == "darwin" else 1 << 10), 1)
+
+
+def prepare(data: Path, scale: float, seed: int) -> None:
+    """Generate the synthetic inputs unless `data` already holds them."""
+    params = {"scale": scale, "seed": seed}
+    stamp = data / "params.json"
+    if stamp.exists() and json.loads(stamp.read_text()) == params:
+        return
+
+    shutil.rmtree(data, ignore_errors=True)
+    start = time.perf_counter()
+    logging.info(f"Generating synthetic inputs in {data} (scale {scale})")
+    synthetic.write_summary(data / "assembly_summary.txt", max(1, int(200_000 * scale)), seed)
+    rel_paths = synthetic.write_ncbi_tree(data / "ncbi", max(1, int(16 * scale)), seed, scale)
+    (data / "ncbi_paths.json").write_text(json.dumps(rel_paths))
+    rng = synthetic.np.random.default_rng(seed)
+    synthetic.write_fasta(data / "fungi" / "GCA_700000000.1_ASM1v1_genomic.fna.gz",
+                          synthetic.genome_records(rng, "fungi", "GCA_700000000.1", scale))
+    synthetic.write_process_input(data / "process", CATEGORY, max(1, int(40 * scale)), seed, scale)
+    stamp.write_text(json.dumps(params))
+    logging.info(f"Inputs ready in {time.perf_counter() - start:.1f}s")
+
+
+def _process_files(data: Path):
+    return sorted((data / "process").glob(f"*/{CATEGORY}/*.fna"))
+
+
+def _split_args():
+    cutoffs = [datetime(2015, 1, 1), datetime(2020, 1, 1), datetime(2030, 1, 1)]
+    return cutoffs + [["Complete Genome", "Chromosome"]]
+
+
+@benchmark
+def parse_summary(data: Path, tmp: Path):
+    """Index build + split of assembly_summary.txt, no cached index."""
+    from metadataset.download.summary import parse_summary as parse
+
+    summary = tmp / "assembly_summary.txt"
+    shutil.copy(data / "assembly_summary.txt", summary)
+
+    def run():
+        splits = parse(summary, *_split_args())
+        return sum(len(v) for v in splits.values()), summary.stat().st_size
+    return run
+
+
+@benchmark
+def parse_summary_cached(data: Path, tmp: Path):
+    """Split of assembly_summary.txt from an up-to-date cached index."""
+    from metadataset.download.summary import parse_summary as parse
+
+    summary = tmp / "assembly_summary.txt"
+    shutil.copy(data / "assembly_summary.txt", summary)
+    parse(summary, *_split_args())
+
+    def run():
+        splits = parse(summary, *_split_args())
+        return sum(len(v) for v in splits.values()), summary.stat().st_size
+    return run
+
+
+@benchmark
+def download_split(data: Path, tmp: Path):
+    """Fetch, checksum, gunzip and validate every assembly from the local stub."""
+    from metadataset.download.fetcher import create_session
+    from metadataset.download.splits import download_split as download
+
+    rel_paths = json.loads((data / "ncbi_paths.json").read_text())
+    nbytes = sum(p.stat().st_size for p in (data / "ncbi").rglob("*.fna.gz"))
+
+    def run():
+        with NCBIStub(data / "ncbi", latency=0.02) as stub:
+            entries = [(f"{stub.url}/{rel}", None) for rel in rel_paths]
+            download("train", entries, tmp / "raw", tmp / "meta", CATEGORY, workers=8,
+                     session=create_session(8, max_rps=0))
+        return len(list((tmp / "raw").glob("*.fna"))), nbytes
+    return run
+
+
+@benchmark
+def download_throttled(data: Path, tmp: Path):
+    """download_split against a stub that answers 429 above 20 requests/s, client asking for 40/s."""
+    from metadataset.download.fetcher import create_session
+    from metadataset.download.splits import download_split as download
+
+    rel_paths = json.loads((data / "ncbi_paths.json").read_text())
+    nbytes = sum(p.stat().st_size for p in (data / "ncbi").rglob("*.fna.gz"))
+
+    def run():
+        with NCBIStub(data / "ncbi", latency=0.02, max_rps=20) as stub:
+            entries = [(f"{stub.url}/{rel}", None) for rel in rel_paths]
+            download("train", entries, tmp / "raw", tmp / "meta", CATEGORY, workers=8,
+                     session=create_session(8, max_rps=40))
+        return len(list((tmp / "raw").glob("*.fna"))), nbytes
+    return run
+
+
+@benchmark
+def decompress_and_validate(data: Path, tmp: Path):
+    """Single-pass gunzip + FASTA validation; bytes are decompressed bytes."""
+    import gzip
+    from metadataset.download.decompress import decompress_and_validate as decompress
+
+    sources = [data / "fungi" / "GCA_700000000.1_ASM1v1_genomic.fna.gz"]
+    sources += sorted((data / "ncbi").rglob("*.fna.gz"))
+    copies = []
+    for i, src in enumerate(sources):
+        copies.append(tmp / f"{i}_{src.name}")
+        shutil.copy(src, copies[-1])
+    nbytes = 0
+    for src in sources:
+        with gzip.open(src, "rb") as fh:
+            nbytes += sum(len(b) for b in iter(lambda: fh.read(1 << 22), b""))
+
+    def run():
+        return sum(decompress(p) for p in copies), nbytes
+    return run
+
+
+@benchmark
+def iter_fasta(data: Path, tmp: Path):
+    """Parse the plain process inputs and one gzipped fungal assembly."""
+    from metadataset.preprocess.helpers import iter_fasta as read
+
+    paths = _process_files(data) + [data / "fungi" / "GCA_700000000.1_ASM1v1_genomic.fna.gz"]
+
+    def run():
+        items = nbytes = 0
+        for path in paths:
+            for rec in read(path):
+                items += 1
+                nbytes += len(rec.seq)
+        return items, nbytes
+    return run
+
+
+@benchmark
+def process_sequence(data: Path, tmp: Path):
+    """Quality check, cleaning and MD5 dedup of records already in memory."""
+    from metadataset.preprocess import BioProcessor, PipelineConfig
+    from metadataset.preprocess.helpers import iter_fasta as read
+
+    records = [rec for path in _process_files(data) for rec in read(path)]
+    processor = BioProcessor(PipelineConfig(base_dir=data / "process", out_dir=tmp / "out",
+                                            category=CATEGORY, mash_dedup=False))
+
+    def run():
+        for rec in records:
+            processor.process_sequence(rec)
+        return len(records), sum(len(rec.seq) for rec in records)
+    return run
+
+
+@benchmark
+def run(data: Path, tmp: Path):
+    """The whole `metadataset process` pipeline with default settings."""
+    from metadataset.preprocess import BioProcessor, PipelineConfig
+
+    files = _process_files(data)
+    config = PipelineConfig(base_dir=data / "process", out_dir=tmp / "out", category=CATEGORY)
+
+    def go():
+        BioProcessor(config).run()
+        return len(files), sum(f.stat().st_size for f in files)
+    return go
+
+
+@benchmark
+def write_records(data: Path, tmp: Path):
+    """Write the cleaned records as gzipped .fna.gz files on the background writer threads."""
+    from metadataset.preprocess.helpers import clean_sequence_bytes, iter_fasta as read
+    from metadataset.preprocess.writer import RecordWriter
+
+    records = [(rec.id, rec.description, clean_sequence_bytes(rec.seq))
+               for path in _process_files(data) for rec in read(path)]
+
+    def go():
+        shutil.rmtree(tmp / "out", ignore_errors=True)
+        writer = RecordWriter(threads=4, compression="gzip")
+        for i, (rec_id, desc, seq) in enumerate(records):
+            writer.write(tmp / "out" / f"class{i % 4}" / f"{i}{writer.suffix}", rec_id, desc, seq)
+        writer.close()
+        return len(records), sum(len(seq) for _, _, seq in records)
+    return go
+
+
+@benchmark
+def incremental_delete(data: Path, tmp: Path):
+    """
+    An --incremental run after deleting an input whose records others
+    dropped as duplicates; raises unless its manifest matches a full run.
+    """
+    from metadataset.preprocess import BioProcessor, PipelineConfig
+    from metadataset.preprocess.state import StateStore
+
+    shutil.copytree(data / "process", tmp / "in")
+    config = PipelineConfig(base_dir=tmp / "in", out_dir=tmp / "out", category=CATEGORY, incremental=True)
+    BioProcessor(config).run()
+
+    state = StateStore(tmp / "out" / "metadata", CATEGORY)
+    with open(tmp / "out" / "metadata" / f"{CATEGORY}_manifest.csv", newline="") as fh:
+        rows = list(csv.DictReader(fh))
+    for source in state.files:
+        paths = {row["path"] for row in rows if row["source_file"] == source}
+        if state.dependents(set(state.added_digests(source)), paths, {source}):
+            Path(source).unlink()
+            break
+    else:
+        raise RuntimeError("No input has duplicates in others")
+    BioProcessor(PipelineConfig(base_dir=tmp / "in", out_dir=tmp / "full", category=CATEGORY)).run()
+
+    def manifest(out_dir: Path):
+        with open(out_dir / "metadata" / f"{CATEGORY}_manifest.csv", newline="") as fh:
+            return sorted(tuple(row[k].replace(str(out_dir), "") for k in sorted(row)) for row in csv.DictReader(fh))
+
+    files = _process_files(data)
+
+    def go():
+        BioProcessor(config).run()
+        if manifest(tmp / "out") != manifest(tmp / "full"):
+            raise RuntimeError("Incremental manifest differs from a full run after a deletion")
+        return len(files), sum(f.stat().st_size for f in files)
+    return go
+
+
+@benchmark
+def near_dup(data: Path, tmp: Path):
+    """
+    MinHash sketching + LSH near-duplicate search over cleaned records
+    (the in-process engine that replaced run_mash_dedup).
+    """
+    from metadataset.preprocess import PipelineConfig
+    from metadataset.preprocess.helpers import clean_sequence_bytes, iter_fasta as read
+    from metadataset.preprocess.lsh import NearDuplicateIndex
+    from metadataset.preprocess.minhash import MinHashSketcher
+
+    cfg = PipelineConfig(base_dir=data / "process", out_dir=tmp / "out", category=CATEGORY)
+    seqs = [clean_sequence_bytes(rec.seq) for path in _process_files(data) for rec in read(path)]
+
+    def go():
+        sketcher = MinHashSketcher(cfg.kmer_size, cfg.sketch_size, bins=cfg.lsh_bands * cfg.lsh_rows)
+        index = NearDuplicateIndex(cfg.kmer_size, cfg.sketch_size, cfg.lsh_bands, cfg.lsh_rows)
+        for i, seq in enumerate(seqs):
+            sketch = sketcher.sketch(seq)
+            if index.nearest(sketch, cfg.mash_threshold, {"train"}) is None:
+                index.add(str(i), "train", sketch)
+        return len(seqs), sum(len(s) for s in seqs)
+    return go
+
+
+def run_child(name: str, data: Path) -> dict:
+    """Set up and time one benchmark in this process."""
+    logging.disable(logging.CRITICAL)
+    with tempfile.TemporaryDirectory(prefix=f"bench_{name}_") as tmp:
+        go = BENCHMARKS[name](data, Path(tmp))
+        setup_rss = _peak_rss_mb()
+        start = time.perf_counter()
+        items, nbytes = go()
+        seconds = time.perf_counter() - start
+    return {"seconds": seconds, "items": items, "bytes": nbytes,
+            "setup_rss_mb": setup_rss, "peak_rss_mb": _peak_rss_mb()}
+
+
+def run_benchmark(name: str, data: Path, repeat: int) -> dict:
+    runs = []
+    for _ in range(repeat):
+        out = subprocess.run(
+            [sys.executable, "-m", "benchmarks.run", "--child", name, "--workdir", str(data.parent)],
+            cwd=ROOT, capture_output=True, text=True, check=True,
+        )
+        runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    best = min(r["seconds"] for r in runs)
+    result = {
+        "seconds": round(best, 4),
+        "runs": [round(r["seconds"], 4) for r in runs],
+        "items": runs[0]["items"],
+        "bytes": runs[0]["bytes"],
+        "items_per_s": round(runs[0]["items"] / best, 2) if best else None,
+        "mb_per_s": round(runs[0]["bytes"] / best / (1 << 20), 2) if best else None,
+        "setup_rss_mb": max(r["setup_rss_mb"] for r in runs),
+        "peak_rss_mb": max(r["peak_rss_mb"] for r in runs),
+    }
+    return result
+
+
+def _git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True)
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the metadataset benchmark suite")
+    parser.add_argument("--out", default="benchmark_results.json", help="Where to write the JSON results")
+    parser.add_argument("--workdir", default=str(Path(tempfile.gettempdir()) / "metadataset_bench"),
+                        help="Directory for generated inputs (reused between runs)")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiplier for input sizes")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per benchmark, best time is kept")
+    parser.add_argument("--only", default="", help="Comma-separated benchmark names")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    data = Path(args.workdir) / "data"
+    if args.child:
+        print(json.dumps(run_child(args.child, data)))
+        return
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - [%(levelname)s] - %(message)s")
+    names = [n.strip() for n in args.only.split(",") if n.strip()] or list(BENCHMARKS)
+    unknown = set(names) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))} (have: {', '.join(BENCHMARKS)})")
+
+    prepare(data, args.scale, args.seed)
+
+    results = {}
+    for name in names:
+        results[name] = run_benchmark(name, data, max(1, args.repeat))
+        r = results[name]
+        logging.info(f"{name}: {r['seconds']:.3f}s, {r['mb_per_s']} MB/s, peak {r['peak_rss_mb']} MB")
+
+    report = {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "scale": args.scale,
+        "seed": args.seed,
+        "benchmarks": results,
+    }
+    Path(args.out).write_text(json.dumps(report, indent=2))
+    logging.info(f"Results written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
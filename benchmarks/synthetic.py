@@ -0,0 +1,179 @@
+"""
+Synthetic stand-ins for NCBI data: assembly_summary.txt tables and
+genome FASTA files whose records look like the ones the pipeline sees
+(bacterial chromosomes with plasmids, phages/viruses, large fungal
+chromosomes), including exact and near-duplicate genomes.
+"""
+import gzip
+import hashlib
+from datetime import date
+from pathlib import Path
+from typing import List, Tuple
+
+import numpy as np
+
+# Columns of the NCBI assembly_summary.txt header
+SUMMARY_COLUMNS = [
+    "assembly_accession", "bioproject", "biosample", "wgs_master", "refseq_category",
+    "taxid", "species_taxid", "organism_name", "infraspecific_name", "isolate",
+    "version_status", "assembly_level", "release_type", "genome_rep", "seq_rel_date",
+    "asm_name", "asm_submitter", "gbrs_paired_asm", "paired_asm_comp", "ftp_path",
+    "excluded_from_refseq", "relation_to_type_material", "asm_not_live_date",
+]
+ASSEMBLY_LEVELS = ["Complete Genome", "Chromosome", "Scaffold", "Contig"]
+VERSION_STATUS = ["latest"] * 8 + ["replaced", "suppressed"]
+FASTA_WIDTH = 80  # NCBI wraps genomic FASTA at 80 columns
+
+_BASES = np.frombuffer(b"ACGT", dtype=np.uint8)
+
+Record = Tuple[str, str, bytes]
+
+
+def random_sequence(rng: np.random.Generator, length: int, ambig: float = 0.0) -> bytes:
+    """Uniform random ACGT, with a fraction `ambig` of positions set to N."""
+    seq = _BASES[rng.integers(0, 4, size=length, dtype=np.uint8)]
+    if ambig:
+        seq[rng.random(length) < ambig] = ord("N")
+    return seq.tobytes()
+
+
+def mutate(rng: np.random.Generator, seq: bytes, rate: float) -> bytes:
+    """Copy of `seq` with a fraction `rate` of positions substituted."""
+    arr = np.frombuffer(seq, dtype=np.uint8).copy()
+    pos = np.flatnonzero(rng.random(len(arr)) < rate)
+    arr[pos] = _BASES[rng.integers(0, 4, size=len(pos), dtype=np.uint8)]
+    return arr.tobytes()
+
+
+def genome_records(rng: np.random.Generator, kind: str, accession: str, scale: float = 1.0) -> List[Record]:
+    """
+    Records of one synthetic assembly.
+    :param kind: 'bacteria' (chromosome + plasmids), 'virus' or 'fungi'
+    :param scale: multiplies every sequence length
+    """
+    def length(lo: int, hi: int) -> int:
+        return max(1, int(rng.integers(lo, hi) * scale))
+
+    name = f"Synthetica {kind} strain {accession[4:13]}"
+    records = []
+    if kind == "bacteria":
+        records.append((f"CP{accession[4:13]}.1", "chromosome, complete genome", length(500_000, 2_000_000)))
+        for i in range(int(rng.integers(0, 4))):
+            records.append((f"CP{accession[4:13]}{i}.1", f"plasmid p{i + 1}, complete sequence",
+                            length(5_000, 200_000)))
+    elif kind == "virus":
+        records.append((f"MN{accession[4:13]}.1", "phage, complete genome", length(10_000, 150_000)))
+    elif kind == "fungi":
+        for i in range(int(rng.integers(4, 9))):
+            records.append((f"CM{accession[4:13]}{i}.1", f"chromosome {i + 1}", length(1_000_000, 8_000_000)))
+    else:
+        raise ValueError(f"Unknown genome kind: {kind}")
+
+    return [(rec_id, f"{rec_id} {name} {desc}", random_sequence(rng, n, ambig=0.001))
+            for rec_id, desc, n in records]
+
+
+def format_records(records: List[Record], width: int = FASTA_WIDTH) -> bytes:
+    parts = []
+    for _, description, seq in records:
+        parts.append(b">" + description.encode() + b"\n")
+        parts.extend(seq[i:i + width] + b"\n" for i in range(0, len(seq), width))
+    return b"".join(parts)
+
+
+def write_fasta(path: Path, records: List[Record]) -> int:
+    """Write plain (or, for a .gz path, gzipped) FASTA; returns bytes written."""
+    data = format_records(records)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.suffix == ".gz":
+        with gzip.open(path, "wb", compresslevel=1) as fh:
+            fh.write(data)
+    else:
+        path.write_bytes(data)
+    return len(data)
+
+
+def accession_dir(accession: str, asm_name: str) -> str:
+    """NCBI's all/GCA/123/456/789/<accession>_<asm_name> layout."""
+    digits = accession[4:13]
+    return f"genomes/all/GCA/{digits[0:3]}/{digits[3:6]}/{digits[6:9]}/{accession}_{asm_name}"
+
+
+def write_summary(path: Path, n_rows: int, seed: int = 0,
+                  ftp_root: str = "https://ftp.ncbi.nlm.nih.gov") -> List[str]:
+    """
+    Write an assembly_summary.txt with `n_rows` assemblies; returns their
+    ftp_path column.
+    """
+    rng = np.random.default_rng(seed)
+    levels = rng.integers(0, len(ASSEMBLY_LEVELS), n_rows)
+    statuses = rng.integers(0, len(VERSION_STATUS), n_rows)
+    first, last = date(1995, 1, 1).toordinal(), date(2025, 12, 31).toordinal()
+    ordinals = rng.integers(first, last, n_rows)
+
+    ftp_paths = []
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as fh:
+        fh.write("#   See ftp://ftp.ncbi.nlm.nih.gov/genomes/README_assembly_summary.txt\n")
+        fh.write("#" + "\t".join(SUMMARY_COLUMNS) + "\n")
+        for i in range(n_rows):
+            accession = f"GCA_{i + 1:09d}.1"
+            asm_name = f"ASM{i + 1}v1"
+            ftp_path = f"{ftp_root}/{accession_dir(accession, asm_name)}"
+            ftp_paths.append(ftp_path)
+            # The pipeline parses seq_rel_date as YYYY-MM-DD
+            rel_date = date.fromordinal(int(ordinals[i])).isoformat()
+            fh.write("\t".join([
+                accession, f"PRJNA{i}", f"SAMN{i}", "na", "na", "562", "562",
+                "Synthetica coli", f"strain={i}", "", VERSION_STATUS[statuses[i]],
+                ASSEMBLY_LEVELS[levels[i]], "Major", "Full", rel_date, asm_name,
+                "Synthetic", "na", "na", ftp_path, "", "", "na",
+            ]) + "\n")
+    return ftp_paths
+
+
+def write_ncbi_tree(root: Path, n_assemblies: int, seed: int = 0, scale: float = 1.0) -> List[str]:
+    """
+    Lay out gzipped assemblies plus md5checksums.txt under `root` the way
+    the NCBI FTP tree does; returns their paths relative to `root`.
+    """
+    rng = np.random.default_rng(seed)
+    kinds = ["bacteria", "bacteria", "virus", "fungi"]
+    rel_paths = []
+    for i in range(n_assemblies):
+        accession = f"GCA_{900_000_000 + i:09d}.1"
+        rel = accession_dir(accession, f"ASM{i}v1")
+        directory = root / rel
+        gz_name = f"{directory.name}_genomic.fna.gz"
+        write_fasta(directory / gz_name, genome_records(rng, kinds[i % len(kinds)], accession, scale))
+        md5 = hashlib.md5((directory / gz_name).read_bytes()).hexdigest()
+        (directory / "md5checksums.txt").write_text(f"{md5}  ./{gz_name}\n")
+        rel_paths.append(rel)
+    return rel_paths
+
+
+def write_process_input(base_dir: Path, category: str, n_assemblies: int, seed: int = 0,
+                        scale: float = 1.0, duplicate_rate: float = 0.1,
+                        near_duplicate_rate: float = 0.1) -> None:
+    """
+    Plain FASTA inputs for `metadataset process` under base_dir/<split>/<category>.
+    Some assemblies are exact copies, others lightly mutated copies, of
+    earlier ones so both dedup stages have work to do.
+    """
+    rng = np.random.default_rng(seed)
+    kinds = ["bacteria", "bacteria", "bacteria", "virus"]
+    splits = ["train"] * 8 + ["val", "test"]
+    made: List[List[Record]] = []
+    for i in range(n_assemblies):
+        accession = f"GCA_{800_000_000 + i:09d}.1"
+        draw = rng.random()
+        if made and draw < duplicate_rate:
+            records = made[int(rng.integers(0, len(made)))]
+        elif made and draw < duplicate_rate + near_duplicate_rate:
+            source = made[int(rng.integers(0, len(made)))]
+            records = [(rec_id, desc, mutate(rng, seq, 0.002)) for rec_id, desc, seq in source]
+        else:
+            records = genome_records(rng, kinds[i % len(kinds)], accession, scale)
+        made.append(records)
+        split = splits[i % len(splits)]
+        write_fasta(base_dir / split / category / f"{accession}_genomic.fna", records)
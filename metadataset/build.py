@@ -0,0 +1,224 @@
+import logging
+from collections import defaultdict, deque
+from concurrent.futures import Executor, ThreadPoolExecutor
+from contextlib import closing
+from datetime import datetime
+from itertools import islice
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import requests
+
+from metadataset.download.checksums import fetch_checksums
+from metadataset.download.fetcher import CHUNK_SIZE, create_session, stream_genome
+from metadataset.download.splits import save_paths, write_failed_list
+from metadataset.download.stream import DownloadError, GenomeStream
+from metadataset.download.summary import download_summary, parse_summary
+from metadataset.preprocess import BioProcessor, MultiProcessor, PipelineConfig
+from metadataset.preprocess.core import SPLITS
+from metadataset.utils.io import ensure_dir
+from metadataset.utils.metrics import Metrics
+
+FETCH_BUFFER = 64 << 20
+
+
+def plan_build(category: str,
+               meta_dir: Path,
+               cutoffs: Tuple[datetime, datetime, datetime],
+               allowed_types: List[str],
+               session: requests.Session) -> List[Tuple[str, str]]:
+    """
+    Fetch and split assembly_summary.txt as download does.
+    :return: (split, ftp_path) pairs, ordered like process would order the
+             downloaded files so dedup precedence is the same
+    """
+    summary_file = meta_dir / 'assembly_summary.txt'
+    download_summary(category, summary_file, session)
+    splits = parse_summary(summary_file, *cutoffs, allowed_types)
+
+    plan = []
+    for split in SPLITS:
+        paths = [p for p, _ in splits[split]]
+        save_paths(paths, meta_dir / f'{split}_ftp_paths.txt')
+        logging.info(f'Split {split.upper()}: {len(paths)} genomes')
+        plan.extend((split, p) for p in sorted(paths, key=lambda p: p.split('/')[-1]))
+    return plan
+
+
+def genome_url(ftp_path: str) -> str:
+    return f"{ftp_path}/{ftp_path.split('/')[-1]}_genomic.fna.gz"
+
+
+def fetch_entry(stream: GenomeStream, ftp_path: str, meta_dir: Path, session: requests.Session,
+                metrics: Optional[Metrics] = None) -> None:
+    """Stream the .fna.gz of one assembly into `stream`, checked against NCBI's md5."""
+    try:
+        checksums = fetch_checksums(ftp_path, meta_dir / 'checksums', session)
+        stream_genome(stream, session, expected_md5=checksums.get(stream.url.split('/')[-1]), metrics=metrics)
+    except Exception as e:
+        # The reader must not wait for a stream nobody will finish
+        logging.error(f'Failed to download {stream.url}: {e}')
+        stream.finish(DownloadError(f'failed to download {stream.url}: {e}'))
+
+
+def stream_downloads(pool: Executor,
+                     entries: Iterable[Tuple[str, tuple]],
+                     window: int,
+                     buffer_bytes: int) -> Iterator[GenomeStream]:
+    """
+    A GenomeStream for each (ftp_path, fetch_entry arguments after it) of
+    `entries`, in order. Up to `window` downloads run on `pool` ahead of
+    the reader, sharing `buffer_bytes` of stream buffers; a download
+    whose buffer is full waits for the reader.
+    """
+    pending = deque()
+    current = None
+    try:
+        for ftp_path, args in entries:
+            stream = GenomeStream(genome_url(ftp_path), buffer_bytes=max(CHUNK_SIZE, buffer_bytes // window))
+            pool.submit(fetch_entry, stream, ftp_path, *args)
+            pending.append(stream)
+            if len(pending) >= window:
+                current = pending.popleft()
+                yield current
+        while pending:
+            current = pending.popleft()
+            yield current
+    finally:
+        # Stops the downloads of a run that ended early
+        for stream in [current, *pending]:
+            if stream is not None:
+                stream.close()
+
+
+def _payloads(streams: Iterator[GenomeStream], jobs: int) -> Iterator[Union[GenomeStream, bytes, None]]:
+    # Worker processes cannot read from a stream, so they get each download whole
+    if jobs <= 1:
+        return streams
+    return (stream.read_all() for stream in streams)
+
+
+def track_failures(analyzed: Iterable[tuple], sources: Dict[Path, tuple], failed: Dict[tuple, List[str]]):
+    """
+    Pass analysed files through, noting the genome URL of each one whose
+    download failed or was invalid under failed[(meta_dir, category, split)].
+    :param sources: {input path: (ftp_path, meta_dir, category)}
+    """
+    for item in analyzed:
+        split, fpath, _, stats, _ = item
+        if stats.get('skipped_download_failed') or stats.get('skipped_invalid_fasta'):
+            ftp_path, meta_dir, category = sources[fpath]
+            failed[(meta_dir, category, split)].append(genome_url(ftp_path))
+        yield item
+
+
+def write_failures(failed: Dict[tuple, List[str]], meta_dirs: Dict[str, Path]) -> None:
+    """{category}_{split}_failed.txt of every category and split, as download writes them."""
+    for category, meta_dir in meta_dirs.items():
+        for split in SPLITS:
+            write_failed_list(meta_dir, category, split, failed.get((meta_dir, category, split), []))
+
+
+def _input_paths(config: PipelineConfig, category: str, plan: List[Tuple[str, str]]) -> List[Tuple[str, Path]]:
+    # Records are named after the files process would have read
+    return [(split, config.base_dir / split / category / f"{ftp_path.split('/')[-1]}_genomic.fna")
+            for split, ftp_path in plan]
+
+
+def build_category(config: PipelineConfig,
+                   download_dir: Path,
+                   cutoffs: Tuple[datetime, datetime, datetime],
+                   allowed_types: List[str],
+                   workers: int = 1,
+                   session: Optional[requests.Session] = None,
+                   buffer_bytes: int = FETCH_BUFFER) -> BioProcessor:
+    """
+    Download and process a category in one pipeline. Up to 2 * `workers`
+    downloads are in flight while earlier genomes are parsed, cleaned and
+    deduplicated (on `config.jobs` processes), so network and CPU work
+    overlap. Downloads are parsed from the gzip stream as they arrive,
+    through bounded buffers, and their md5 is checked at the end of the
+    stream; nothing but the processed output and the lists of failed
+    genomes ({category}_{split}_failed.txt, as download writes) is written.
+    :param download_dir: dataset directory of download, for the summary,
+                         split lists and checksum cache; `config.base_dir`
+                         only names the inputs in the manifest
+    :param workers: concurrent downloads
+    :param session: HTTP session, one sized for `workers` is created if None
+    :param buffer_bytes: memory for downloaded data: the stream buffers and,
+                         with `config.jobs` > 1, the whole genomes queued for
+                         the worker processes, each get this much
+    """
+    category = config.category
+    meta_dir = download_dir / 'metadata' / category
+    ensure_dir(meta_dir)
+
+    session = session or create_session(workers)
+    processor = BioProcessor(config)
+    processor.metrics.rates.append('bytes_downloaded')
+
+    with processor.metrics.stage('summary'):
+        plan = plan_build(category, meta_dir, cutoffs, allowed_types, session)
+
+    inputs = _input_paths(config, category, plan)
+    sources = {fpath: (ftp_path, meta_dir, category) for (_, fpath), (_, ftp_path) in zip(inputs, plan)}
+    failed = defaultdict(list)
+
+    processor.open_outputs()
+    # Closing the streams first stops downloads the pool would otherwise wait for
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as fetch_pool, \
+            closing(stream_downloads(fetch_pool, ((p, (meta_dir, session, processor.metrics)) for _, p in plan),
+                                     window=2 * max(1, workers), buffer_bytes=buffer_bytes)) as streams:
+        analyzed = processor.iter_analyzed_gzip(inputs, _payloads(streams, config.jobs), budget=buffer_bytes)
+        processor.commit_all(track_failures(analyzed, sources, failed), len(inputs))
+    write_failures(failed, {category: meta_dir})
+    return processor
+
+
+def build_categories(config: PipelineConfig,
+                     categories: List[str],
+                     download_dir: Path,
+                     cutoffs: Tuple[datetime, datetime, datetime],
+                     allowed_types: List[str],
+                     workers: int = 1,
+                     session: Optional[requests.Session] = None,
+                     buffer_bytes: int = FETCH_BUFFER) -> MultiProcessor:
+    """
+    build_category for several categories as one MultiProcessor run over
+    one HTTP session, download pool and analysis pool. Downloads follow
+    the commit order (split by split across categories), so they keep
+    flowing across category boundaries.
+    """
+    session = session or create_session(workers)
+    run = MultiProcessor(config, categories)
+
+    inputs, sources, meta_dirs = [], {}, {}
+    fetch_args = {}
+    for processor in run.processors:
+        category = processor.cfg.category
+        meta_dir = download_dir / 'metadata' / category
+        ensure_dir(meta_dir)
+        processor.metrics.rates.append('bytes_downloaded')
+        with processor.metrics.stage('summary'):
+            plan = plan_build(category, meta_dir, cutoffs, allowed_types, session)
+        proc_inputs = _input_paths(processor.cfg, category, plan)
+        for (_, fpath), (_, ftp_path) in zip(proc_inputs, plan):
+            sources[fpath] = (ftp_path, meta_dir, category)
+            fetch_args[fpath] = (meta_dir, session, processor.metrics)
+        meta_dirs[category] = meta_dir
+        inputs.append(proc_inputs)
+
+    segments = run.schedule(inputs)
+    failed = defaultdict(list)
+    run.open_outputs()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as fetch_pool, \
+            closing(stream_downloads(fetch_pool,
+                                     ((sources[fpath][0], fetch_args[fpath])
+                                      for _, segment in segments for _, fpath in segment),
+                                     window=2 * max(1, workers), buffer_bytes=buffer_bytes)) as streams:
+        payloads = _payloads(streams, config.jobs)
+        run.commit_all(segments,
+                       lambda processor, segment, pool: track_failures(processor.iter_analyzed_gzip(
+                           segment, islice(payloads, len(segment)), pool, budget=buffer_bytes), sources, failed))
+    write_failures(failed, meta_dirs)
+    return run
@@ -1,34 +1,286 @@
+from metadataset.download.fetcher import create_session
 from metadataset.download.manager import download_category
-from .preprocess import BioProcessor, PipelineConfig, CATEGORY_TO_DOMAIN
+from metadataset.download.ratelimit import MAX_RPS
+from metadataset.download.validate import MIN_CONTIG_LENGTH
+from metadataset.download.verify import verify_category, write_repair_list
+from .build import build_categories, build_category
+from .utils.profiling import profiled
+from .preprocess import BioProcessor, MultiProcessor, PipelineConfig, CATEGORY_TO_DOMAIN, merge_shards
+from .preprocess.classify import validate_rules
+from .preprocess.sharding import parse_shard_spec
+from .preprocess.manifest import ManifestStore, manifest_db_path
+from .reader import manifest_rows, pack_manifest
 
 import sys
+import csv
+import json
 import argparse
 import logging
+from datetime import datetime
 from pathlib import Path
+from typing import List
 
 
-def run_process(args):
-    """Handler for the process command."""
-    cat = args.category.lower()
+def _category(name: str) -> str:
+    """Normalise a category name, exiting on unknown ones."""
+    cat = name.lower()
     if cat == "virus": cat = "viral"
 
     if cat not in CATEGORY_TO_DOMAIN:
         logging.error(f"Invalid category '{cat}'. Must be: {list(CATEGORY_TO_DOMAIN.keys())}")
         sys.exit(1)
+    return cat
+
+
+def _categories(names: str) -> List[str]:
+    """Normalised categories of a comma-separated list, in order, without repeats."""
+    cats = []
+    for name in names.split(","):
+        cat = _category(name.strip())
+        if cat not in cats:
+            cats.append(cat)
+    return cats
+
+
+def _replicon_rules(path: Path) -> dict:
+    """{replicon type: [keywords]} from a JSON file, exiting if it is malformed."""
+    try:
+        rules = json.loads(path.read_text())
+    except (OSError, ValueError) as e:
+        logging.error(f"Cannot read replicon rules from {path}: {e}")
+        sys.exit(1)
+    try:
+        validate_rules(rules)
+    except ValueError as e:
+        logging.error(f"Invalid replicon rules in {path}: {e}")
+        sys.exit(1)
+    return rules
 
-    config = PipelineConfig(
-        base_dir=args.base_dir,
+
+def _pipeline_config(args, cat: str, base_dir: Path) -> PipelineConfig:
+    extra = {}
+    if args.replicon_rules is not None:
+        extra["replicon_rules"] = _replicon_rules(args.replicon_rules)
+    return PipelineConfig(
+        base_dir=base_dir,
         out_dir=args.out_dir,
         category=cat,
         min_len=args.min_len,
         max_ambig=args.max_ambig,
         mash_threshold=args.mash_threshold,
-        keep_unknown=args.keep_unknown
+        mash_dedup=not args.skip_mash,
+        kmer_size=args.kmer_size,
+        sketch_size=args.sketch_size,
+        mash_within_split=args.mash_within_split,
+        lsh_bands=args.lsh_bands,
+        lsh_rows=args.lsh_rows,
+        keep_unknown=args.keep_unknown,
+        jobs=args.jobs,
+        incremental=getattr(args, "incremental", False),
+        dedup_memory_mb=args.dedup_memory_mb,
+        dedup_bloom_mb=args.dedup_bloom_mb,
+        fasta_engine=args.fasta_engine,
+        output_format=args.output_format,
+        shard_size_mb=args.shard_size_mb,
+        output_compression=args.output_compression,
+        writer_threads=args.writer_threads,
+        write_buffer_mb=args.write_buffer_mb,
+        stream_threshold_mb=args.stream_threshold_mb,
+        manifest_db=args.manifest_db,
+        record_stats=args.record_stats or args.tetra,
+        tetra_freqs=args.tetra,
+        progress_interval=args.progress_interval,
+        profile=args.profile,
+        **extra
     )
 
-    logging.info(f"Starting processing for {cat}...")
-    processor = BioProcessor(config)
-    processor.run()
+
+def run_process(args):
+    """Handler for the process command."""
+    cats = _categories(args.category)
+    config = _pipeline_config(args, cats[0], args.base_dir)
+    if args.shard:
+        if len(cats) > 1 or args.incremental:
+            logging.error("--shard takes a single category and no --incremental")
+            sys.exit(1)
+        try:
+            config.shard_index, config.shard_count = parse_shard_spec(args.shard)
+        except ValueError as e:
+            logging.error(str(e))
+            sys.exit(1)
+
+    logging.info(f"Starting processing for {', '.join(cats)}...")
+    processor = BioProcessor(config) if len(cats) == 1 else MultiProcessor(config, cats)
+    with profiled(config.profile):
+        processor.run()
+
+
+def run_merge(args):
+    """Handler for the merge command."""
+    cat = _category(args.category)
+    logging.info(f"Merging {args.shards} shards of {cat}...")
+    try:
+        merge_shards(args.out_dir, cat, args.shards, keep_partial=args.keep_partial)
+    except (FileNotFoundError, ValueError) as e:
+        logging.error(str(e))
+        sys.exit(1)
+
+
+def run_build(args):
+    """Handler for the build command."""
+    cats = _categories(args.category)
+    base_dir = Path(args.base_dir)
+    config = _pipeline_config(args, cats[0], base_dir / "raw")
+    cutoffs = tuple(datetime.strptime(c, "%Y-%m-%d")
+                    for c in (args.train_cutoff, args.val_cutoff, args.test_cutoff))
+    allowed_types = [x.strip() for x in args.assembly_level.split(",")]
+
+    workers = max(1, args.workers)
+    session = create_session(workers, max_rps=args.max_rps, per_host=args.per_host)
+    buffer_bytes = args.fetch_buffer_mb << 20
+
+    logging.info(f"Starting download and processing for {', '.join(cats)}...")
+    with profiled(config.profile):
+        if len(cats) == 1:
+            build_category(config, base_dir, cutoffs, allowed_types, workers, session, buffer_bytes)
+        else:
+            build_categories(config, cats, base_dir, cutoffs, allowed_types, workers, session, buffer_bytes)
+
+
+def run_query(args):
+    """Handler for the query command."""
+    if args.db is not None:
+        db = args.db
+    elif args.out_dir is not None and args.category is not None:
+        cat = args.category.lower()
+        if cat == "virus": cat = "viral"
+        meta_dir = args.out_dir / "metadata"
+        db = manifest_db_path(meta_dir, cat)
+        manifest_csv = meta_dir / f"{cat}_manifest.csv"
+        if not db.exists() and manifest_csv.exists():
+            ManifestStore.from_files(db, manifest_csv, meta_dir / f"{cat}_host_map.json").close()
+    else:
+        logging.error("Give either --db or both --out_dir and --category")
+        sys.exit(1)
+
+    if not db.exists():
+        logging.error(f"No manifest database at {db}; run 'process' with --manifest_db first")
+        sys.exit(1)
+
+    store = ManifestStore(db)
+    if args.count:
+        fields = [f.strip() for f in args.count.split(",")]
+        rows = store.counts(fields)
+        fields.append("n")
+    else:
+        fields = [f.strip() for f in args.fields.split(",")] if args.fields else store.fields
+        rows = store.query(split=args.split, class4=args.class4, replicon_type=args.replicon_type,
+                           host_assembly=args.host_assembly, accession=args.accession,
+                           host_split=args.host_split, limit=args.limit)
+
+    if args.format == "json":
+        for row in rows:
+            print(json.dumps({f: row[f] for f in fields}))
+    else:
+        writer = csv.DictWriter(sys.stdout, fieldnames=fields, extrasaction="ignore",
+                                delimiter="\t" if args.format == "tsv" else ",")
+        writer.writeheader()
+        writer.writerows(rows)
+    store.close()
+
+
+def run_pack(args):
+    """Handler for the pack command."""
+    categories = []
+    for cat in args.category.split(","):
+        cat = cat.strip().lower()
+        if cat == "virus": cat = "viral"
+        categories.append(cat)
+
+    dest_dir = args.dest_dir or args.out_dir / "packed"
+    splits = [args.split] if args.split else ["train", "val", "test"]
+    for split in splits:
+        rows = manifest_rows(args.out_dir, categories, split)
+        pack_manifest(rows, dest_dir / split, args.encoding)
+
+
+def run_download(args):
+    """Handler for the download command."""
+    args.category = ",".join(_categories(args.category))
+    download_category(args)
+
+
+def run_verify(args):
+    """Handler for the verify command; exits with 1 if anything needs repair."""
+    cats = _categories(args.category)
+    session = create_session(1, max_rps=args.max_rps, per_host=args.per_host) if args.fetch_checksums else None
+    rows = []
+    for cat in cats:
+        rows.extend(verify_category(args.base_dir, cat, jobs=max(1, args.jobs), min_length=args.min_len,
+                                    session=session, progress_interval=args.progress_interval))
+
+    out = args.out or args.base_dir / "repair.tsv"
+    write_repair_list(out, rows)
+    if rows:
+        logging.warning(f"{len(rows)} genomes need repair, listed in {out}; "
+                        f"re-fetch them with 'metadataset download --repair {out}'")
+        sys.exit(1)
+    logging.info(f"All genomes of {', '.join(cats)} verified")
+
+
+def _add_processing_args(parser: argparse.ArgumentParser) -> None:
+    """Options shared by 'process' and 'build'."""
+    parser.add_argument("--min_len", type=int, default=1000)
+    parser.add_argument("--max_ambig", type=float, default=0.05)
+    parser.add_argument("--mash_threshold", type=float, default=0.05)
+    parser.add_argument("--skip_mash", action="store_true", help="Disable near-duplicate removal")
+    parser.add_argument("--kmer_size", type=int, default=21, help="MinHash k-mer size (<= 32)")
+    parser.add_argument("--sketch_size", type=int, default=1000, help="MinHash sketch size")
+    parser.add_argument("--mash_within_split", action="store_true",
+                        help="Also cluster near-duplicates inside a split, keeping one per cluster")
+    parser.add_argument("--lsh_bands", type=int, default=128, help="LSH bands over the MinHash signature")
+    parser.add_argument("--lsh_rows", type=int, default=1,
+                        help="Signature bins per LSH band; more than 1 misses pairs near --mash_threshold")
+    parser.add_argument("--keep_unknown", action="store_true")
+    parser.add_argument("--replicon_rules", type=Path, default=None,
+                        help="JSON {replicon type: [keywords]} over the types viral, plasmid and "
+                             "chromosomal, first matching type wins (default: built-in keywords)")
+    parser.add_argument("--jobs", type=int, default=1, help="Worker processes for parsing and cleaning")
+    parser.add_argument("--dedup_memory_mb", type=int, default=0,
+                        help="RAM for the MD5 dedup table before it spills to disk (0 = unlimited)")
+    parser.add_argument("--dedup_bloom_mb", type=int, default=0,
+                        help="Bloom filter in front of a spilled MD5 table")
+    parser.add_argument("--fasta_engine", choices=["native", "biopython"], default="native")
+    parser.add_argument("--output_format", choices=["files", "shards"], default="files",
+                        help="One .fna per record, or packed multi-FASTA shards with .fai indexes")
+    parser.add_argument("--shard_size_mb", type=int, default=256, help="Maximum shard size")
+    parser.add_argument("--output_compression", choices=["none", "gzip", "zstd"], default="none",
+                        help="Compress each record file (.fna.gz / .fna.zst); zstd needs the zstandard package")
+    parser.add_argument("--writer_threads", type=int, default=2,
+                        help="Background threads writing record files (0 = write inline)")
+    parser.add_argument("--write_buffer_mb", type=int, default=64,
+                        help="Sequence queued for the writer threads before processing waits")
+    parser.add_argument("--stream_threshold_mb", type=int, default=32,
+                        help="Clean records longer than this chunk by chunk (0 = never)")
+    parser.add_argument("--progress_interval", type=float, default=30.0,
+                        help="Seconds between progress lines (0 = none)")
+    parser.add_argument("--profile", type=Path, default=None,
+                        help="Write a cProfile of the run, worker processes included, to this file")
+    parser.add_argument("--manifest_db", action="store_true",
+                        help="Also write an indexed SQLite manifest for 'metadataset query'")
+    parser.add_argument("--record_stats", action="store_true",
+                        help="Add length, GC and removed-ambiguity columns to the manifest "
+                             "and write per-assembly aggregates")
+    parser.add_argument("--tetra", action="store_true",
+                        help="Also store tetranucleotide frequencies in <category>_tetra.npz (implies --record_stats)")
+
+
+def _add_rate_args(parser: argparse.ArgumentParser) -> None:
+    """HTTP pacing options shared by 'download' and 'build'."""
+    parser.add_argument("--max_rps", type=float, default=MAX_RPS,
+                        help="Requests per second per host; halved while the server throttles, 0 = no cap")
+    parser.add_argument("--per_host", type=int, default=None,
+                        help="Concurrent connections per host (default: --workers)")
 
 
 def main():
@@ -44,16 +296,25 @@ def main():
     # 2. Register 'download' command
     # -------------------------------------------------------
     dl = subparsers.add_parser('download', help='Download genomes from GenBank')
-    dl.add_argument('--category', required=True, help='Genome category')
+    dl.add_argument('--category', required=True,
+                    help='Genome category, or a comma-separated list downloaded over one session')
     dl.add_argument('--base_dir', required=True, help='Dataset directory')
-    dl.add_argument('--train_cutoff', required=True, help='YYYY-MM-DD')
-    dl.add_argument('--val_cutoff', required=True, help='YYYY-MM-DD')
-    dl.add_argument('--test_cutoff', required=True, help='YYYY-MM-DD')
+    dl.add_argument('--train_cutoff', help='YYYY-MM-DD (required unless --repair)')
+    dl.add_argument('--val_cutoff', help='YYYY-MM-DD (required unless --repair)')
+    dl.add_argument('--test_cutoff', help='YYYY-MM-DD (required unless --repair)')
     dl.add_argument('--assembly_level', default='Complete Genome', help='Comma-separated list')
     dl.add_argument('--seed', type=int, default=None, help='Random seed')
+    dl.add_argument('--workers', type=int, default=1, help='Number of concurrent downloads')
+    _add_rate_args(dl)
+    dl.add_argument('--progress_interval', type=float, default=30.0,
+                    help='Seconds between progress lines (0 = none)')
+    dl.add_argument('--profile', type=Path, default=None,
+                    help='Write a cProfile of the run to this file')
+    dl.add_argument('--repair', type=Path, default=None,
+                    help="Only re-download the accessions of this repair list from 'metadataset verify'")
 
     # Map this command to the download function
-    dl.set_defaults(func=download_category)
+    dl.set_defaults(func=run_download)
 
     # -------------------------------------------------------
     # 3. Register 'process' command
@@ -61,17 +322,114 @@ def main():
     proc_parser = subparsers.add_parser("process", help="Clean, Deduplicate, and Relabel data")
     proc_parser.add_argument("--base_dir", required=True, type=Path, help="Input directory")
     proc_parser.add_argument("--out_dir", required=True, type=Path, help="Output directory")
-    proc_parser.add_argument("--category", required=True, help="Taxonomic category")
-    proc_parser.add_argument("--min_len", type=int, default=1000)
-    proc_parser.add_argument("--max_ambig", type=float, default=0.05)
-    proc_parser.add_argument("--mash_threshold", type=float, default=0.05)
-    proc_parser.add_argument("--keep_unknown", action="store_true")
+    proc_parser.add_argument("--category", required=True,
+                             help="Taxonomic category, or a comma-separated list processed as one run "
+                                  "with cross-category dedup and a combined manifest")
+    proc_parser.add_argument("--incremental", action="store_true",
+                             help="Only process new or changed input files, keeping earlier output")
+    proc_parser.add_argument("--shard", default=None,
+                             help="i/N: process only shard i (from 0) of N size-balanced subsets of the "
+                                  "input files, for 'metadataset merge' to combine")
+    _add_processing_args(proc_parser)
 
     # Map this command to the process function
     proc_parser.set_defaults(func=run_process)
 
     # -------------------------------------------------------
-    # 4. Parse args and Execute
+    # Register 'merge' command
+    # -------------------------------------------------------
+    merge_parser = subparsers.add_parser("merge", help="Combine the outputs of 'process --shard i/N'")
+    merge_parser.add_argument("--out_dir", required=True, type=Path, help="Output directory the shards wrote to")
+    merge_parser.add_argument("--category", required=True, help="Taxonomic category")
+    merge_parser.add_argument("--shards", required=True, type=int, help="Number of shards N")
+    merge_parser.add_argument("--keep_partial", action="store_true",
+                              help="Keep the shards' partial outputs after merging")
+
+    merge_parser.set_defaults(func=run_merge)
+
+    # -------------------------------------------------------
+    # 4. Register 'query' command
+    # -------------------------------------------------------
+    query_parser = subparsers.add_parser("query", help="Select records from a processed manifest")
+    query_parser.add_argument("--db", type=Path, default=None, help="Manifest database")
+    query_parser.add_argument("--out_dir", type=Path, default=None,
+                              help="Processed output directory, locates the database with --category "
+                                   "(built from the manifest CSV if missing)")
+    query_parser.add_argument("--category", default=None, help="Taxonomic category")
+    query_parser.add_argument("--split", default=None)
+    query_parser.add_argument("--class4", default=None)
+    query_parser.add_argument("--replicon_type", default=None)
+    query_parser.add_argument("--host_assembly", default=None)
+    query_parser.add_argument("--accession", default=None)
+    query_parser.add_argument("--host_split", default=None,
+                              help="Only records whose host assembly has records in this split")
+    query_parser.add_argument("--limit", type=int, default=None)
+    query_parser.add_argument("--fields", default=None, help="Comma-separated output columns")
+    query_parser.add_argument("--count", default=None,
+                              help="Comma-separated columns to count records by, instead of listing them")
+    query_parser.add_argument("--format", choices=["tsv", "csv", "json"], default="tsv")
+
+    query_parser.set_defaults(func=run_query)
+
+    # -------------------------------------------------------
+    # Register 'build' command
+    # -------------------------------------------------------
+    build_parser = subparsers.add_parser("build", help="Download and process a category in one pipelined pass")
+    build_parser.add_argument("--category", required=True,
+                              help="Genome category, or a comma-separated list built as one run")
+    build_parser.add_argument("--base_dir", required=True, type=Path,
+                              help="Dataset directory for the summary, split lists and checksum cache")
+    build_parser.add_argument("--out_dir", required=True, type=Path, help="Output directory")
+    build_parser.add_argument("--train_cutoff", required=True, help="YYYY-MM-DD")
+    build_parser.add_argument("--val_cutoff", required=True, help="YYYY-MM-DD")
+    build_parser.add_argument("--test_cutoff", required=True, help="YYYY-MM-DD")
+    build_parser.add_argument("--assembly_level", default="Complete Genome", help="Comma-separated list")
+    build_parser.add_argument("--workers", type=int, default=1, help="Number of concurrent downloads")
+    build_parser.add_argument("--fetch_buffer_mb", type=int, default=64,
+                              help="Memory for downloads, which are parsed as they stream in: their buffers "
+                                   "share this much. With --jobs > 1, whole compressed genomes queued for the "
+                                   "worker processes take up to as much again (at least one genome)")
+    _add_rate_args(build_parser)
+    _add_processing_args(build_parser)
+
+    build_parser.set_defaults(func=run_build)
+
+    # -------------------------------------------------------
+    # 5. Register 'pack' command
+    # -------------------------------------------------------
+    pack_parser = subparsers.add_parser("pack", help="Pack processed records into memory-mappable training buffers")
+    pack_parser.add_argument("--out_dir", required=True, type=Path, help="Processed output directory")
+    pack_parser.add_argument("--category", required=True,
+                             help="Comma-separated categories whose manifests are packed together")
+    pack_parser.add_argument("--split", default=None, help="Pack one split only (default: each split)")
+    pack_parser.add_argument("--dest_dir", type=Path, default=None,
+                             help="Where <split>.seq / <split>.index.npz go (default: <out_dir>/packed)")
+    pack_parser.add_argument("--encoding", choices=["2bit", "uint8"], default="2bit",
+                             help="Four bases per byte, or one code per base")
+
+    pack_parser.set_defaults(func=run_pack)
+
+    # -------------------------------------------------------
+    # 6. Register 'verify' command
+    # -------------------------------------------------------
+    verify_parser = subparsers.add_parser("verify", help="Check downloaded genomes and list those to re-fetch")
+    verify_parser.add_argument("--base_dir", required=True, type=Path, help="Dataset directory")
+    verify_parser.add_argument("--category", required=True, help="Genome category, or a comma-separated list")
+    verify_parser.add_argument("--jobs", type=int, default=1, help="Processes checking files in parallel")
+    verify_parser.add_argument("--min_len", type=int, default=MIN_CONTIG_LENGTH,
+                               help="Shortest acceptable longest contig, in bases")
+    verify_parser.add_argument("--out", type=Path, default=None,
+                               help="Repair list to write (default: <base_dir>/repair.tsv)")
+    verify_parser.add_argument("--fetch_checksums", action="store_true",
+                               help="Download NCBI md5 listings that are not cached yet")
+    _add_rate_args(verify_parser)
+    verify_parser.add_argument("--progress_interval", type=float, default=30.0,
+                               help="Seconds between progress lines (0 = none)")
+
+    verify_parser.set_defaults(func=run_verify)
+
+    # -------------------------------------------------------
+    # 7. Parse args and Execute
     # -------------------------------------------------------
     args = parser.parse_args()
 
@@ -0,0 +1,65 @@
+import logging
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+import requests
+
+from metadataset.download.ratelimit import THROTTLE_STATUSES, backoff_delay
+
+MAX_ATTEMPTS = 3
+RETRY_STATUSES = THROTTLE_STATUSES + (500, 502, 504)
+
+
+def parse_checksums(text: str) -> Dict[str, str]:
+    """
+    Parse an NCBI md5checksums.txt listing into {file name: md5}.
+    """
+    checksums = {}
+    for line in text.splitlines():
+        parts = line.split()
+        if len(parts) != 2:
+            continue
+        md5, name = parts
+        if name.startswith('./'):
+            name = name[2:]
+        checksums[name] = md5.lower()
+    return checksums
+
+
+def fetch_checksums(ftp_path: str,
+                    cache_dir: Path,
+                    session: Optional[requests.Session] = None) -> Dict[str, str]:
+    """
+    Return the per-assembly md5 checksums, using a locally cached copy
+    of md5checksums.txt when one exists.
+    :param ftp_path: assembly directory from assembly_summary.txt
+    :param cache_dir: directory holding cached checksum listings
+    :param session: shared HTTP session
+    :return: {file name: md5}, empty if the listing could not be fetched
+    """
+    accession = ftp_path.split('/')[-1]
+    cached = cache_dir / f'{accession}_md5checksums.txt'
+    if cached.exists():
+        return parse_checksums(cached.read_text())
+
+    url = f"{ftp_path}/md5checksums.txt".replace('ftp://', 'https://')
+    http = session or requests
+    for attempt in range(MAX_ATTEMPTS):
+        try:
+            r = http.get(url, timeout=60)
+            r.raise_for_status()
+            break
+        except requests.exceptions.RequestException as e:
+            # A missing listing will stay missing; throttling and network errors may pass
+            response = getattr(e, 'response', None)
+            if attempt + 1 == MAX_ATTEMPTS or (response is not None and response.status_code not in RETRY_STATUSES):
+                logging.warning(f'Could not fetch checksums for {accession}: {e}')
+                return {}
+            time.sleep(backoff_delay(attempt, e))
+
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    tmp = cached.with_suffix('.tmp')
+    tmp.write_text(r.text)
+    tmp.replace(cached)
+    return parse_checksums(r.text)
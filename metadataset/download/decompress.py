@@ -1,22 +1,29 @@
 import logging
 import gzip
-import shutil
 from pathlib import Path
 
-from metadataset.download.validate import (is_valid_fasta, has_valid_contig)
+from metadataset.download.validate import FastaStreamValidator
+
+CHUNK_SIZE = 1 << 20
+
 
 def decompress_and_validate(gz_path: Path) -> bool:
+    """
+    Gunzip `gz_path` next to itself and validate the FASTA in the same
+    pass, so every byte is read and written exactly once.
+    """
     try:
         out_path = gz_path.with_suffix('')
+        validator = FastaStreamValidator()
 
-        with gzip.open(gz_path, 'rb') as f_in ,open(out_path, 'wb') as f_out:
-            shutil.copyfileobj(f_in , f_out)
+        with gzip.open(gz_path, 'rb') as f_in, open(out_path, 'wb') as f_out:
+            for chunk in iter(lambda: f_in.read(CHUNK_SIZE), b''):
+                f_out.write(chunk)
+                validator.update(chunk)
 
         gz_path.unlink()
 
-        if(out_path.stat().st_size < 500 or
-        not has_valid_contig(out_path) or
-        not is_valid_fasta(out_path)):
+        if not validator.is_valid():
             logging.warning(f'Invalid FASTA file {out_path.name}')
             out_path.unlink()
             return False
@@ -1,40 +1,192 @@
+import hashlib
 import logging
 import requests
 import shutil
 import time
 from pathlib import Path
+from typing import Optional
+
+from requests.adapters import HTTPAdapter
 
 from metadataset.download.decompress import decompress_and_validate
+from metadataset.download.ratelimit import MAX_RPS, RateLimiter, RateLimitedSession, backoff_delay
+from metadataset.download.stream import DownloadError, GenomeStream, ReaderClosed
 from metadataset.download.summary import MAX_RETRIES
+from metadataset.utils.metrics import Metrics
+
+POOL_SIZE = 10
+CHUNK_SIZE = 1 << 16
 
-MAX_RETRIES = 5
-RETRY_DELAY = 5
 
-def download_genome_file(url: str, dest_path: Path) -> bool:
+def create_session(pool_size: int = POOL_SIZE,
+                   max_rps: float = MAX_RPS,
+                   per_host: Optional[int] = None) -> requests.Session:
+    """
+    Create a keep-alive HTTP session whose connection pool can serve
+    `pool_size` concurrent downloads. Requests are paced per host by a
+    shared RateLimiter, and at most `per_host` run against one host at a
+    time; further ones wait for a free connection.
+    :param pool_size: number of concurrent downloads
+    :param max_rps: requests per second per host, 0 = no cap
+    :param per_host: connections per host, `pool_size` if None
+    :return: configured session
+    """
+    session = RateLimitedSession(RateLimiter(max_rps))
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=per_host or pool_size, pool_block=True)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def md5_file(path: Path) -> str:
+    h = hashlib.md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _fetch_to_tmp(http, url: str, tmp: Path, metrics: Optional[Metrics] = None) -> str:
+    """
+    Stream `url` into `tmp`, resuming a partial transfer with a Range
+    request when `tmp` already holds some bytes.
+    :param metrics: counts bytes_downloaded when given
+    :return: md5 of the complete file
+    """
+    h = hashlib.md5()
+    offset = tmp.stat().st_size if tmp.exists() else 0
+    headers = {'Range': f'bytes={offset}-'} if offset else {}
+
+    with http.get(url, stream=True, timeout=60, headers=headers) as r:
+        if offset and r.status_code == 416:
+            # Nothing left to send: the partial file is already complete
+            return md5_file(tmp)
+        r.raise_for_status()
+
+        if offset and r.status_code == 206:
+            logging.info(f'Resuming {tmp.name} at byte {offset}')
+            with open(tmp, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    h.update(chunk)
+            mode = 'ab'
+        else:
+            mode = 'wb'
+
+        with open(tmp, mode) as f:
+            for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
+                f.write(chunk)
+                h.update(chunk)
+                if metrics is not None:
+                    metrics.count('bytes_downloaded', len(chunk))
+
+    return h.hexdigest()
+
+
+def download_genome_file(url: str, dest_path: Path,
+                         session: Optional[requests.Session] = None,
+                         expected_md5: Optional[str] = None,
+                         metrics: Optional[Metrics] = None) -> bool:
     """
     Download a single .fna.gz file and decompress it.
+    Interrupted transfers are resumed from the leftover .tmp file, and a
+    complete .fna.gz left behind by an earlier run is reused as is.
     :param url:
     :param dest_path:
+    :param session: shared HTTP session, a one-off connection is used if None
+    :param expected_md5: checksum from md5checksums.txt, not verified if None
+    :param metrics: run metrics, receives bytes downloaded and fetch/decompress times
     :return:
     """
+    http = session or requests
+    tmp = dest_path.with_suffix('.tmp')
+    if metrics is None:
+        metrics = Metrics('download', interval=0)
+
+    if dest_path.exists():
+        if expected_md5 is None or md5_file(dest_path) == expected_md5:
+            with metrics.stage('decompress'):
+                return decompress_and_validate(dest_path)
+        dest_path.unlink()
+
     for attempt in range(MAX_RETRIES):
         try:
-            tmp = dest_path.with_suffix('.tmp')
+            with metrics.stage('fetch'):
+                digest = _fetch_to_tmp(http, url.replace('ftp://', 'https://'), tmp, metrics)
 
-            with requests.get(url.replace('ftp://', 'https://'),
-                              stream=True,
-                              timeout=60) as r:
-                r.raise_for_status()
-                with open(tmp, 'wb') as f:
-                    for chunk in r.iter_content(chunk_size=8192):
-                        f.write(chunk)
+            if expected_md5 is not None and digest != expected_md5:
+                tmp.unlink()
+                raise ValueError(f'checksum mismatch ({digest} != {expected_md5})')
 
-                shutil.move(tmp, dest_path)
+            shutil.move(tmp, dest_path)
+            with metrics.stage('decompress'):
                 return decompress_and_validate(dest_path)
 
         except Exception as e:
             logging.warning(f'Attempt {attempt + 1} failed for url {url}: {e}')
-            time.sleep(RETRY_DELAY)
+            if attempt + 1 < MAX_RETRIES:
+                time.sleep(backoff_delay(attempt, e))
 
     logging.error(f'Failed to download {url}')
     return False
+
+
+def stream_genome(stream: GenomeStream,
+                  session: Optional[requests.Session] = None,
+                  expected_md5: Optional[str] = None,
+                  metrics: Optional[Metrics] = None) -> None:
+    """
+    Download the .fna.gz at stream.url into `stream`, for pipelines that
+    parse it while it arrives instead of keeping it on disk or in memory.
+    A transfer that breaks off is resumed with a Range request after the
+    bytes the reader already has. The md5 is checked at the end of the
+    stream, so a mismatch surfaces from the reader's last read.
+    :param expected_md5: checksum from md5checksums.txt, not verified if None
+    :param metrics: run metrics, receives bytes downloaded and fetch time
+    """
+    http = session or requests
+    if metrics is None:
+        metrics = Metrics('download', interval=0)
+    url = stream.url.replace('ftp://', 'https://')
+    h = hashlib.md5()
+    offset = 0
+    start = time.perf_counter()
+
+    try:
+        for attempt in range(MAX_RETRIES):
+            try:
+                headers = {'Range': f'bytes={offset}-'} if offset else {}
+                with http.get(url, stream=True, timeout=60, headers=headers) as r:
+                    r.raise_for_status()
+                    # A server ignoring the Range sends everything again
+                    skip = offset if offset and r.status_code != 206 else 0
+                    for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
+                        metrics.count('bytes_downloaded', len(chunk))
+                        if skip:
+                            chunk, skip = chunk[skip:], max(0, skip - len(chunk))
+                            if not chunk:
+                                continue
+                        h.update(chunk)
+                        offset += len(chunk)
+                        stream.put(chunk)
+                break
+            except ReaderClosed:
+                raise
+            except Exception as e:
+                logging.warning(f'Attempt {attempt + 1} failed for url {url}: {e}')
+                if attempt + 1 < MAX_RETRIES:
+                    time.sleep(backoff_delay(attempt, e))
+        else:
+            logging.error(f'Failed to download {url}')
+            stream.finish(DownloadError(f'failed to download {url}'))
+            return
+
+        digest = h.hexdigest()
+        if expected_md5 is not None and digest != expected_md5:
+            logging.error(f'Checksum mismatch for {url} ({digest} != {expected_md5})')
+            stream.finish(DownloadError(f'checksum mismatch ({digest} != {expected_md5})'))
+            return
+        stream.finish()
+    except ReaderClosed:
+        pass
+    finally:
+        metrics.add_times({'fetch': time.perf_counter() - start - stream.waited})
@@ -0,0 +1,30 @@
+import threading
+from pathlib import Path
+
+
+class CompletionLedger:
+    """
+    Append-only record of accessions that were downloaded and validated.
+    One accession per line; safe to share between download threads.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._done = set()
+        if path.exists():
+            self._done = {line.strip() for line in path.read_text().splitlines() if line.strip()}
+
+    def __contains__(self, accession: str) -> bool:
+        return accession in self._done
+
+    def __len__(self) -> int:
+        return len(self._done)
+
+    def add(self, accession: str) -> None:
+        with self._lock:
+            if accession in self._done:
+                return
+            with open(self.path, 'a') as f:
+                f.write(f'{accession}\n')
+            self._done.add(accession)
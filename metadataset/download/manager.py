@@ -1,17 +1,106 @@
 import logging
+import sys
+from concurrent.futures import Executor, ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime
+from typing import Callable
+
+import requests
 
 from metadataset.download.summary import download_summary, parse_summary
-from metadataset.download.splits import save_paths, download_split
+from metadataset.download.splits import save_paths, submit_split, finish_split
+from metadataset.download.fetcher import create_session
+from metadataset.download.ratelimit import MAX_RPS
+from metadataset.download.verify import SPLITS, read_repair_list
 from metadataset.utils.logging import init_logging
 from metadataset.utils.io import ensure_dir
+from metadataset.utils.metrics import Metrics, PROGRESS_INTERVAL
+from metadataset.utils.profiling import profiled
 
 
 def download_category(args):
+    """
+    Download every category of args.category, a single name or a
+    comma-separated list. All categories share one HTTP session and one
+    pool of args.workers download threads: every genome of every category
+    and split is queued on it up front, so it stays busy across their
+    boundaries. With args.repair, only the accessions of that repair list
+    (see `metadataset verify`) are fetched again.
+    """
     init_logging()
+    categories = list(dict.fromkeys(c.strip() for c in args.category.split(',') if c.strip()))
+    repair = getattr(args, 'repair', None)
+    if not repair and not all((args.train_cutoff, args.val_cutoff, args.test_cutoff)):
+        logging.error('--train_cutoff, --val_cutoff and --test_cutoff are required unless --repair is given')
+        sys.exit(1)
+    rows = read_repair_list(Path(repair)) if repair else None
+
+    workers = max(1, getattr(args, 'workers', 1))
+    session = create_session(workers,
+                             max_rps=getattr(args, 'max_rps', MAX_RPS),
+                             per_host=getattr(args, 'per_host', None))
+
+    with profiled(getattr(args, 'profile', None)), ThreadPoolExecutor(max_workers=workers) as pool:
+        queued = []
+        for category in categories:
+            if rows is not None:
+                queued.append(_queue_repair(args, category, session, pool,
+                                            [r for r in rows if r['category'] == category]))
+            else:
+                queued.append(_queue_category(args, category, session, pool))
+        for finish in queued:
+            finish()
+
+
+def _queue_repair(args, category: str, session: requests.Session, pool: Executor,
+                  rows: list) -> Callable[[], None]:
+    """
+    Delete the broken files of the repair rows and queue those accessions on `pool`.
+    :return: waits for the downloads and writes the category's failure lists and metrics
+    """
+    base_dir = Path(args.base_dir)
+    raw_dir = base_dir / 'raw' / category
+    meta_dir = base_dir / 'metadata' / category
+    ensure_dir(meta_dir)
+
+    logging.info(f'----- Repairing {category}: {len(rows)} genomes -----')
+    metrics = Metrics(category, rates=['bytes_downloaded'],
+                      interval=getattr(args, 'progress_interval', PROGRESS_INTERVAL))
+    metrics.total = len(rows)
+
+    queued = []
+    for split in SPLITS:
+        entries = []
+        for row in rows:
+            if row['split'] != split:
+                continue
+            if not row['ftp_path']:
+                logging.warning(f"No FTP path known for {row['accession']}; run a full download to fetch it")
+                continue
+            # The fetcher's own partial .tmp stays: the download resumes from it,
+            # or drops it if the result fails its checksum
+            resumable = f"{row['accession']}_genomic.fna.tmp"
+            for path in (raw_dir / split).glob(f"{row['accession']}_genomic.fna*"):
+                if path.name != resumable:
+                    path.unlink()
+            entries.append((row['ftp_path'], ''))
+        if entries:
+            queued.append((split, submit_split(pool, split, entries, raw_dir / split, meta_dir, category,
+                                               session, metrics)))
 
-    category = args.category
+    def finish():
+        for split, futures in queued:
+            finish_split(split, futures, meta_dir, category, merge=True)
+        metrics.write(meta_dir / f'{category}_repair_metrics.json')
+        logging.info(f'----- Repaired {category} -----')
+    return finish
+
+
+def _queue_category(args, category: str, session: requests.Session, pool: Executor) -> Callable[[], None]:
+    """
+    Fetch and split the category's assembly summary, then queue every genome on `pool`.
+    :return: waits for the downloads and writes the category's failure lists and metrics
+    """
     allowed_types = [x.strip() for x in args.assembly_level.split(',')]
     base_dir = Path(args.base_dir)
 
@@ -27,22 +116,33 @@ def download_category(args):
     logging.info(f'----- Downloading {category} -----')
     logging.info(f'assembly level: {allowed_types}')
 
+    metrics = Metrics(category, rates=['bytes_downloaded'],
+                      interval=getattr(args, 'progress_interval', PROGRESS_INTERVAL))
+
     # Step 1: Download assembly_summary.txt
     summary_file = meta_dir / f'assembly_summary.txt'
-    download_summary(category, summary_file)
+    with metrics.stage('summary'):
+        download_summary(category, summary_file, session)
 
     # Step 2: Parse into splits
-    splits = parse_summary(summary_file, train_cutoff, val_cutoff, test_cutoff, allowed_types)
+    with metrics.stage('parse_summary'):
+        splits = parse_summary(summary_file, train_cutoff, val_cutoff, test_cutoff, allowed_types)
+    metrics.total = sum(len(entries) for entries in splits.values())
 
     # Step 3: Write ftp_files
-    for split in ["train", "val", "test"]:
+    for split in SPLITS:
         paths = [p for p, _ in splits[split]]
         save_paths(paths, meta_dir / f"{split}_ftp_paths.txt")
         logging.info(f"Split {split.upper()}: {len(paths)} genomes")
 
-    # Step 4: Download each split
-    download_split('train', splits['train'], raw_dir / 'train', meta_dir, category)
-    download_split('val', splits['val'], raw_dir / 'val', meta_dir, category)
-    download_split('test', splits['test'], raw_dir / 'test', meta_dir, category)
+    # Step 4: Queue each split on the shared pool and session
+    queued = [(split, submit_split(pool, split, splits[split], raw_dir / split, meta_dir, category,
+                                   session, metrics))
+              for split in SPLITS]
 
-    logging.info(f'----- Completed {category} -----')
+    def finish():
+        for split, futures in queued:
+            finish_split(split, futures, meta_dir, category)
+        metrics.write(meta_dir / f'{category}_download_metrics.json')
+        logging.info(f'----- Completed {category} -----')
+    return finish
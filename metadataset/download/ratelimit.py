@@ -0,0 +1,153 @@
+import logging
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+
+MAX_RPS = 10.0
+MIN_RPS = 0.5
+RECOVERY_STEP = 0.02  # of max_rps, regained per successful request after throttling
+DEFAULT_COOLDOWN = 1.0
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+THROTTLE_STATUSES = (429, 503)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Seconds to wait from a Retry-After header, given either as a number
+    of seconds or as an HTTP date.
+    :return: None if the header is missing or malformed
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+def backoff_delay(attempt: int, error: Optional[BaseException] = None) -> float:
+    """
+    Seconds to sleep before retry `attempt + 1`: exponential backoff with
+    jitter (half fixed, half random), but never less than what the
+    server asked for in a Retry-After header of the failed response.
+    :param attempt: number of the attempt that failed, from 0
+    :param error: exception of the failed attempt, e.g. requests.HTTPError
+    """
+    ceiling = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)
+    delay = ceiling / 2 + random.uniform(0, ceiling / 2)
+    response = getattr(error, 'response', None)
+    if response is not None:
+        retry_after = parse_retry_after(response.headers.get('Retry-After'))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+    return delay
+
+
+class _HostBucket:
+    def __init__(self, rate: float):
+        self.max_rate = rate
+        self.rate = rate
+        self.capacity = max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+
+class RateLimiter:
+    """
+    Paces requests per host with a token bucket of `max_rps` requests per
+    second. When the server throttles (429/503), the host's rate is halved
+    and every thread holds off for its Retry-After (or a second); each
+    successful request then wins a little of the rate back, so the
+    limiter settles just under what the server tolerates.
+    """
+
+    def __init__(self, max_rps: float = MAX_RPS):
+        """
+        :param max_rps: requests per second per host, 0 = no cap (throttling still pauses)
+        """
+        self.max_rps = max_rps
+        self._hosts: Dict[str, _HostBucket] = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, host: str) -> _HostBucket:
+        bucket = self._hosts.get(host)
+        if bucket is None:
+            bucket = self._hosts[host] = _HostBucket(self.max_rps)
+        return bucket
+
+    def acquire(self, host: str) -> None:
+        """Block until a request to `host` may be sent."""
+        while True:
+            with self._lock:
+                bucket = self._bucket(host)
+                now = time.monotonic()
+                if now < bucket.paused_until:
+                    wait = bucket.paused_until - now
+                elif not bucket.rate:
+                    return
+                else:
+                    bucket.tokens = min(bucket.capacity, bucket.tokens + (now - bucket.updated) * bucket.rate)
+                    bucket.updated = now
+                    if bucket.tokens >= 1:
+                        bucket.tokens -= 1
+                        return
+                    wait = (1 - bucket.tokens) / bucket.rate
+            time.sleep(wait)
+
+    def throttled(self, host: str, retry_after: Optional[float] = None) -> None:
+        """The server refused a request to `host` for load reasons."""
+        with self._lock:
+            bucket = self._bucket(host)
+            now = time.monotonic()
+            if bucket.rate:
+                bucket.rate = max(min(MIN_RPS, bucket.max_rate), bucket.rate / 2)
+                bucket.tokens = 0.0
+                bucket.updated = now
+            pause = DEFAULT_COOLDOWN if retry_after is None else retry_after
+            bucket.paused_until = max(bucket.paused_until, now + pause)
+            rate = bucket.rate
+        logging.warning(f'{host} is throttling requests; pausing {pause:.1f}s'
+                        + (f', rate lowered to {rate:.2f}/s' if rate else ''))
+
+    def succeeded(self, host: str) -> None:
+        """A request to `host` went through."""
+        with self._lock:
+            bucket = self._bucket(host)
+            if bucket.rate and bucket.rate < bucket.max_rate:
+                bucket.rate = min(bucket.max_rate, bucket.rate + bucket.max_rate * RECOVERY_STEP)
+
+    def rate(self, host: str) -> float:
+        with self._lock:
+            return self._bucket(host).rate
+
+
+class RateLimitedSession(requests.Session):
+    """
+    requests.Session that sends every request, redirects included,
+    through a RateLimiter and reports throttling responses back to it.
+    """
+
+    def __init__(self, limiter: RateLimiter):
+        super().__init__()
+        self.limiter = limiter
+
+    def send(self, request, **kwargs):
+        host = urlsplit(request.url).netloc
+        self.limiter.acquire(host)
+        response = super().send(request, **kwargs)
+        if response.status_code in THROTTLE_STATUSES:
+            self.limiter.throttled(host, parse_retry_after(response.headers.get('Retry-After')))
+        else:
+            self.limiter.succeeded(host)
+        return response
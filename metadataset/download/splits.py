@@ -1,33 +1,129 @@
 from pathlib import Path
 import logging
-from typing import List, Tuple
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from typing import List, Optional, Tuple
 
-from metadataset.download.fetcher import (download_genome_file)
+import requests
+
+from metadataset.download.checksums import fetch_checksums
+from metadataset.download.fetcher import (download_genome_file, create_session)
+from metadataset.download.ledger import CompletionLedger
+from metadataset.utils.metrics import Metrics
 
 
 def save_paths(paths: List[str], out_file: Path) -> None:
     out_file.write_text('\n'.join(paths))
 
-def download_split(split_name: str,
-                   entries: List[Tuple[str, str]],
+def download_entry(ftp_path: str,
                    out_dir: Path,
                    meta_dir: Path,
-                   category: str) -> None:
+                   ledger: CompletionLedger,
+                   session: Optional[requests.Session] = None,
+                   metrics: Optional[Metrics] = None) -> bool:
+    """
+    Fetch, verify and decompress one assembly unless the ledger shows it
+    was already completed and its .fna is still on disk.
+    :return: True when a valid .fna is present afterwards
+    """
+    if metrics is None:
+        metrics = Metrics('download', interval=0)
+    accession = ftp_path.split('/')[-1]
+    fna_name = f'{accession}_genomic.fna'
+    if accession in ledger and (out_dir / fna_name).exists():
+        metrics.count('files_skipped')
+        metrics.advance()
+        return True
+
+    with metrics.stage('checksums'):
+        checksums = fetch_checksums(ftp_path, meta_dir / 'checksums', session)
+    url = f'{ftp_path}/{fna_name}.gz'
+    ok = download_genome_file(url, out_dir / f'{fna_name}.gz', session,
+                              expected_md5=checksums.get(f'{fna_name}.gz'), metrics=metrics)
+    if ok:
+        ledger.add(accession)
+    metrics.count('files_downloaded' if ok else 'files_failed')
+    metrics.advance()
+    return ok
+
 
-    logging.info(f'Downloading split {split_name.upper()}')
+def submit_split(pool: Executor,
+                 split_name: str,
+                 entries: List[Tuple[str, str]],
+                 out_dir: Path,
+                 meta_dir: Path,
+                 category: str,
+                 session: requests.Session,
+                 metrics: Optional[Metrics] = None) -> List[Tuple[str, Future]]:
+    """
+    Queue every genome of a split on `pool`, which may be shared with
+    other splits and categories so that it never drains between them.
+    Pass the result to finish_split once everything is queued.
+    :return: (ftp_path, future of download_entry) per genome
+    """
+    logging.info(f'Queueing split {split_name.upper()} of {category}: {len(entries)} genomes')
     out_dir.mkdir(parents=True, exist_ok=True)
 
-    failed = []
-    for ftp_path, _ in entries:
-        accession = ftp_path.split('/')[-1]
-        url = f'{ftp_path}/{accession}_genomic.fna.gz'
-        dest = out_dir / f'{accession}_genomic.fna.gz'
+    ledger = CompletionLedger(meta_dir / f'{category}_{split_name}_completed.txt')
+    if len(ledger):
+        logging.info(f'{len(ledger)} genomes already completed for {split_name.upper()}')
 
-        ok = download_genome_file(url, dest)
+    return [(ftp_path, pool.submit(download_entry, ftp_path, out_dir, meta_dir, ledger, session, metrics))
+            for ftp_path, _ in entries]
 
-        if not ok:
+
+def finish_split(split_name: str,
+                 futures: List[Tuple[str, Future]],
+                 meta_dir: Path,
+                 category: str,
+                 merge: bool = False) -> None:
+    """
+    Wait for the downloads of submit_split and list the failed ones in {category}_{split}_failed.txt.
+    :param merge: the futures cover only some genomes of the split (a repair): keep the
+                  list's other entries, dropping only those that now succeeded
+    """
+    failed, succeeded = [], set()
+    for ftp_path, future in futures:
+        accession = ftp_path.split('/')[-1]
+        url = f'{ftp_path}/{accession}_genomic.fna.gz'
+        if future.result():
+            succeeded.add(url)
+        else:
             failed.append(url)
+    failed_file = meta_dir / f'{category}_{split_name}_failed.txt'
+    if merge and failed_file.exists():
+        earlier = [url for url in failed_file.read_text().split('\n') if url]
+        failed = [url for url in earlier if url not in succeeded and url not in failed] + failed
+    write_failed_list(meta_dir, category, split_name, failed)
 
 
+def write_failed_list(meta_dir: Path, category: str, split_name: str, failed: List[str]) -> None:
+    """List the genome URLs that failed in {category}_{split}_failed.txt, removing it if none did."""
+    failed_file = meta_dir / f'{category}_{split_name}_failed.txt'
     if failed:
-        (meta_dir / f'{category}_{split_name}_failed.txt').write_text('\n'.join(failed))
+        failed_file.write_text('\n'.join(failed))
+    elif failed_file.exists():
+        failed_file.unlink()
+
+
+def download_split(split_name: str,
+                   entries: List[Tuple[str, str]],
+                   out_dir: Path,
+                   meta_dir: Path,
+                   category: str,
+                   workers: int = 1,
+                   session: Optional[requests.Session] = None,
+                   metrics: Optional[Metrics] = None) -> None:
+    """
+    Download every genome of a split, `workers` files at a time.
+    Each file is decompressed and validated by the worker that fetched it;
+    accessions recorded in {category}_{split}_completed.txt are skipped.
+    :param workers: number of concurrent downloads
+    :param session: shared HTTP session, created for the split if None
+    :param metrics: run metrics shared by all splits, progress is logged through it
+    """
+    if session is None:
+        session = create_session(workers)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = submit_split(pool, split_name, entries, out_dir, meta_dir, category, session, metrics)
+        finish_split(split_name, futures, meta_dir, category)
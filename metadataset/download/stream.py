@@ -0,0 +1,97 @@
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+
+class DownloadError(OSError):
+    """A streamed download that failed, or whose content does not match its checksum."""
+
+
+class ReaderClosed(Exception):
+    """Raised to the fetching thread when the reader of its GenomeStream has gone."""
+
+
+class GenomeStream:
+    """
+    Read end of a download running on another thread. Chunks pass through
+    a queue holding at most `buffer_bytes`, so the fetching thread waits
+    while the reader is behind and a genome is never held whole. The
+    fetching thread ends the stream with finish(); an error given there,
+    e.g. a checksum mismatch, is raised from read() once every chunk
+    before it has been read.
+    """
+
+    def __init__(self, url: str, buffer_bytes: int = 8 << 20):
+        self.url = url
+        self.buffer_bytes = buffer_bytes
+        self.waited = 0.0  # seconds the fetching thread spent waiting for room
+        self._chunks = deque()
+        self._queued = 0
+        self._cond = threading.Condition()
+        self._done = False
+        self._closed = False
+        self._error: Optional[DownloadError] = None
+
+    def put(self, chunk: bytes) -> None:
+        """Queue a chunk, waiting for room; raises ReaderClosed once the reader has closed the stream."""
+        with self._cond:
+            start = time.perf_counter()
+            while self._queued and self._queued + len(chunk) > self.buffer_bytes and not self._closed:
+                self._cond.wait()
+            self.waited += time.perf_counter() - start
+            if self._closed:
+                raise ReaderClosed()
+            self._chunks.append(chunk)
+            self._queued += len(chunk)
+            self._cond.notify_all()
+
+    def finish(self, error: Optional[DownloadError] = None) -> None:
+        with self._cond:
+            self._done = True
+            self._error = error
+            self._cond.notify_all()
+
+    def read(self, size: int = -1) -> bytes:
+        with self._cond:
+            while not self._chunks and not self._done:
+                self._cond.wait()
+            if not self._chunks:
+                if self._error is not None:
+                    raise self._error
+                return b''
+
+            if size < 0:
+                data = b''.join(self._chunks)
+                self._chunks.clear()
+            else:
+                parts, n = [], 0
+                while self._chunks and n < size:
+                    chunk = self._chunks.popleft()
+                    if n + len(chunk) > size:
+                        self._chunks.appendleft(chunk[size - n:])
+                        chunk = chunk[:size - n]
+                    parts.append(chunk)
+                    n += len(chunk)
+                data = b''.join(parts)
+            self._queued -= len(data)
+            self._cond.notify_all()
+            return data
+
+    def read_all(self) -> Optional[bytes]:
+        """The whole download, None if it failed."""
+        parts = []
+        try:
+            for chunk in iter(self.read, b''):
+                parts.append(chunk)
+        except DownloadError:
+            return None
+        return b''.join(parts)
+
+    def close(self) -> None:
+        """Stop reading; a fetching thread still waiting for room gives up."""
+        with self._cond:
+            self._closed = True
+            self._chunks.clear()
+            self._queued = 0
+            self._cond.notify_all()
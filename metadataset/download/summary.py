@@ -1,91 +1,194 @@
+import json
 import logging
+import pickle
 import time
 import requests
+from array import array
+from bisect import bisect_right
 from pathlib import Path
 from datetime import datetime
-from typing import List
+from typing import List, Optional
+
+from metadataset.download.ratelimit import backoff_delay
 
 MAX_RETRIES = 5
-RETRY_DELAY = 5
+INDEX_VERSION = 1
 
-def download_summary(category: str, dest: Path) -> None:
+def download_summary(category: str, dest: Path,
+                     session: Optional[requests.Session] = None) -> None:
     """
     Download the assembly_summary.txt file for a given GenBank category.
+    The file is streamed to disk, and a conditional request (ETag /
+    If-Modified-Since) keeps an unchanged local copy without re-fetching it.
     :param category: GenBank category
     :param dest: destination directory
+    :param session: shared HTTP session
     :return: None
     """
 
     url = f"https://ftp.ncbi.nlm.nih.gov/genomes/genbank/{category}/assembly_summary.txt"
+    http = session or requests
+    meta_path = dest.with_name(dest.name + '.meta.json')
+
+    headers = {}
+    if dest.exists() and meta_path.exists():
+        cached = json.loads(meta_path.read_text())
+        if cached.get('etag'):
+            headers['If-None-Match'] = cached['etag']
+        if cached.get('last_modified'):
+            headers['If-Modified-Since'] = cached['last_modified']
+
     for attempt in range(MAX_RETRIES):
         try:
             logging.info(f"Downloading {url}")
-            response = requests.get(url, timeout=60)
-            response.raise_for_status()
-            dest.write_text(response.text)
+            with http.get(url, stream=True, timeout=60, headers=headers) as response:
+                if response.status_code == 304:
+                    logging.info(f"{dest.name} is up to date")
+                    return
+                response.raise_for_status()
+
+                tmp = dest.with_suffix('.tmp')
+                with open(tmp, 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=1 << 20):
+                        f.write(chunk)
+                tmp.replace(dest)
+
+                meta_path.write_text(json.dumps({
+                    'url': url,
+                    'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified'),
+                }))
             return
         except requests.exceptions.RequestException as e:
             logging.error(f'Attempt {attempt + 1} failed: {e}')
-            time.sleep(RETRY_DELAY)
+            if attempt + 1 < MAX_RETRIES:
+                time.sleep(backoff_delay(attempt, e))
 
-        raise RuntimeError(f'Failed to download {url} after {MAX_RETRIES} retries.')
+    raise RuntimeError(f'Failed to download {url} after {MAX_RETRIES} retries.')
 
 
-def parse_summary(
-        summary_path: Path,
-        train_cutoff: datetime,
-        validation_cutoff: datetime,
-        test_cutoff: datetime,
-        allowed_types: List[str],
-) -> dict:
+def build_summary_index(summary_path: Path) -> dict:
     """
-    Parse the summary file and return FTP paths organized into splits
+    Read assembly_summary.txt once and keep only the columns used for
+    splitting. Rows are grouped by (assembly_level, version_status) and
+    sorted by release date so a split is a handful of bisections.
     """
     # Find the header line
     with summary_path.open() as f:
         header = next(
             line for line in f
             if line.startswith('#assembly_accession')
-        ).strip().split('\t')
+        ).lstrip('#').strip().split('\t')
+    acc_idx = header.index('assembly_accession')
     ftp_idx = header.index('ftp_path')
     date_idx = header.index('seq_rel_date')
     type_idx = header.index('assembly_level')
     status_idx = header.index('version_status')
+    max_idx = max(acc_idx, ftp_idx, date_idx, type_idx, status_idx)
 
-    splits = {
-        'train': [],
-        'val': [],
-        'test': [],
-    }
-
+    ordinals = {}
+    rows = {}
     with summary_path.open() as f:
-        for line in f:
+        for row, line in enumerate(f):
             if line.startswith('#'):
                 continue
 
             parts = line.strip().split('\t')
-            if len(parts) <= max(ftp_idx, date_idx, type_idx, status_idx):
+            if len(parts) <= max_idx:
                 continue
 
-            assembly_type = parts[type_idx]
-            version_status = parts[status_idx]
-            ftp_path = parts[ftp_idx]
-
-            if assembly_type not in allowed_types:
-                continue
-            if version_status != 'latest':
+            date_str = parts[date_idx]
+            ordinal = ordinals.get(date_str)
+            if ordinal is None:
+                try:
+                    ordinal = datetime.strptime(date_str, '%Y-%m-%d').toordinal()
+                except ValueError:
+                    ordinal = -1
+                ordinals[date_str] = ordinal
+            if ordinal < 0:
                 continue
 
-            try:
-                release_date = datetime.strptime(parts[date_idx], '%Y-%m-%d')
-            except ValueError:
-                continue
+            key = f'{parts[type_idx]}\t{parts[status_idx]}'
+            rows.setdefault(key, []).append((ordinal, row, parts[acc_idx], parts[ftp_idx]))
+
+    groups = {}
+    for key, entries in rows.items():
+        entries.sort()
+        groups[key] = {
+            'dates': array('l', (e[0] for e in entries)),
+            'rows': array('l', (e[1] for e in entries)),
+            'accessions': '\n'.join(e[2] for e in entries),
+            'ftp_paths': '\n'.join(e[3] for e in entries),
+        }
+
+    stat = summary_path.stat()
+    return {
+        'version': INDEX_VERSION,
+        'source': {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns},
+        'groups': groups,
+    }
+
+
+def load_summary_index(summary_path: Path) -> dict:
+    """
+    Return the cached index next to `summary_path`, rebuilding it when the
+    summary file changed since the index was written.
+    """
+    index_path = summary_path.with_name(summary_path.name + '.idx')
+    stat = summary_path.stat()
+    source = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+    if index_path.exists():
+        try:
+            with open(index_path, 'rb') as f:
+                index = pickle.load(f)
+            if index.get('version') == INDEX_VERSION and index.get('source') == source:
+                return index
+        except Exception as e:
+            logging.warning(f'Ignoring unreadable summary index {index_path.name}: {e}')
+
+    logging.info(f'Indexing {summary_path.name}')
+    index = build_summary_index(summary_path)
+    tmp = index_path.with_suffix('.tmp')
+    with open(tmp, 'wb') as f:
+        pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+    tmp.replace(index_path)
+    return index
+
+
+def parse_summary(
+        summary_path: Path,
+        train_cutoff: datetime,
+        validation_cutoff: datetime,
+        test_cutoff: datetime,
+        allowed_types: List[str],
+) -> dict:
+    """
+    Parse the summary file and return FTP paths organized into splits
+    """
+    index = load_summary_index(summary_path)
+    names = ['train', 'val', 'test']
+    cutoffs = [train_cutoff.toordinal(), validation_cutoff.toordinal(), test_cutoff.toordinal()]
+
+    selected = {name: [] for name in names}
+    for assembly_type in dict.fromkeys(allowed_types):
+        group = index['groups'].get(f'{assembly_type}\tlatest')
+        if group is None:
+            continue
+
+        dates, rows = group['dates'], group['rows']
+        ftp_paths = group['ftp_paths'].split('\n')
 
-            if release_date <= train_cutoff:
-                splits['train'].append((ftp_path, release_date))
-            elif release_date <= validation_cutoff:
-                splits['val'].append((ftp_path, release_date))
-            elif release_date <= test_cutoff:
-                splits['test'].append((ftp_path, release_date))
+        lo = 0
+        for name, cutoff in zip(names, cutoffs):
+            hi = max(lo, bisect_right(dates, cutoff))
+            selected[name].extend((rows[i], ftp_paths[i], dates[i]) for i in range(lo, hi))
+            lo = hi
 
-        return splits
+    # Keep the order of assembly_summary.txt within each split
+    splits = {}
+    for name in names:
+        selected[name].sort()
+        splits[name] = [(ftp_path, datetime.fromordinal(ordinal))
+                        for _, ftp_path, ordinal in selected[name]]
+    return splits
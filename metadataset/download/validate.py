@@ -1,5 +1,14 @@
-from Bio import SeqIO
 from pathlib import Path
+from typing import Optional
+
+from metadataset.utils.fasta import read_fasta
+
+MIN_FILE_SIZE = 500
+MIN_CONTIG_LENGTH = 1000
+
+# Bytes that never count towards a contig's length
+_WHITESPACE = b' \t\r\n'
+
 
 def is_valid_fasta(path: Path) -> bool:
     try:
@@ -11,7 +20,86 @@ def is_valid_fasta(path: Path) -> bool:
 
 def has_valid_contig(path: Path, min_length=1000) -> bool:
     try:
-        with open(path, 'r') as f:
-            return any(len(rec.seq) >= min_length for rec in SeqIO.parse(f, 'fasta'))
+        return any(len(rec.seq) >= min_length for rec in read_fasta(path))
     except Exception:
         return False
+
+
+class ValidatingReader:
+    """Binary file wrapper feeding everything read through a FastaStreamValidator."""
+
+    def __init__(self, handle, validator: 'FastaStreamValidator'):
+        self.handle = handle
+        self.validator = validator
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.handle.read(size)
+        self.validator.update(data)
+        return data
+
+
+class FastaStreamValidator:
+    """
+    Incremental version of the checks above, fed with the decompressed
+    bytes as they are written so the file never has to be re-read.
+    Tracks total size, header presence and the longest contig seen.
+    """
+
+    def __init__(self, min_length: int = MIN_CONTIG_LENGTH, min_size: int = MIN_FILE_SIZE):
+        self.min_length = min_length
+        self.min_size = min_size
+        self.size = 0
+        self.has_header = False
+        self.max_contig = 0
+        self._contig = 0
+        self._in_header = False
+        self._line_start = True
+
+    def _close_contig(self) -> None:
+        self.max_contig = max(self.max_contig, self._contig)
+        self._contig = 0
+
+    def update(self, chunk: bytes) -> None:
+        self.size += len(chunk)
+        if self.max_contig >= self.min_length:
+            return
+
+        pos, n = 0, len(chunk)
+        while pos < n:
+            if self._in_header:
+                nl = chunk.find(b'\n', pos)
+                if nl == -1:
+                    break
+                self._in_header = False
+                self._line_start = True
+                pos = nl + 1
+                continue
+
+            if self._line_start and chunk[pos] == 0x3E:  # '>'
+                self._close_contig()
+                self.has_header = True
+                self._in_header = True
+                self._line_start = False
+                pos += 1
+                continue
+
+            nxt = chunk.find(b'\n>', pos)
+            end = n if nxt == -1 else nxt + 1
+            if self.has_header:
+                self._contig += len(chunk[pos:end].translate(None, _WHITESPACE))
+            self._line_start = chunk[end - 1] == 0x0A  # '\n'
+            pos = end
+
+    def is_valid(self) -> bool:
+        return self.problem() is None
+
+    def problem(self) -> Optional[str]:
+        """Why the data seen is not a usable genome FASTA, None if it is."""
+        self._close_contig()
+        if self.size < self.min_size:
+            return f'only {self.size} bytes'
+        if not self.has_header:
+            return 'no FASTA header'
+        if self.max_contig < self.min_length:
+            return f'no contig of {self.min_length} bp (longest {self.max_contig})'
+        return None
@@ -0,0 +1,215 @@
+import csv
+import hashlib
+import json
+import logging
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import requests
+
+from metadataset.download.checksums import fetch_checksums, parse_checksums
+from metadataset.download.ledger import CompletionLedger
+from metadataset.download.validate import MIN_CONTIG_LENGTH, FastaStreamValidator
+from metadataset.utils.metrics import Metrics, PROGRESS_INTERVAL
+
+SPLITS = ['train', 'val', 'test']
+GENOME_SUFFIX = '_genomic.fna'
+CACHE_NAME = 'verify_cache.json'
+REPAIR_FIELDS = ['category', 'split', 'accession', 'ftp_path', 'problem']
+CHUNK_SIZE = 1 << 20
+
+
+def accession_of(path: Path) -> str:
+    """Assembly accession of a raw genome file, e.g. GCA_000001.1_ASM1v1."""
+    return path.name.split(GENOME_SUFFIX)[0]
+
+
+def _gunzip_into(path: Path, validator: FastaStreamValidator) -> str:
+    """
+    Decompress every gzip member of `path` into `validator`.
+    :return: md5 of the compressed file
+    """
+    md5 = hashlib.md5()
+    inflater = zlib.decompressobj(wbits=31)
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(CHUNK_SIZE), b''):
+            md5.update(chunk)
+            while chunk:
+                if inflater.eof:
+                    inflater = zlib.decompressobj(wbits=31)
+                validator.update(inflater.decompress(chunk))
+                chunk = inflater.unused_data if inflater.eof else b''
+    if not inflater.eof:
+        raise EOFError('truncated gzip')
+    return md5.hexdigest()
+
+
+def check_file(path: Path, expected_md5: Optional[str], min_length: int = MIN_CONTIG_LENGTH) -> Optional[str]:
+    """
+    What is wrong with one raw genome file, None if nothing is. A .gz is
+    decompressed in full and compared with NCBI's md5 when one is given;
+    a plain file is read through. Either way the FASTA must have a header
+    and a contig of at least `min_length` bases.
+    """
+    validator = FastaStreamValidator(min_length=min_length)
+    try:
+        if path.suffix == '.gz':
+            digest = _gunzip_into(path, validator)
+            if expected_md5 is not None and digest != expected_md5:
+                return f'checksum mismatch ({digest} != {expected_md5})'
+        else:
+            with open(path, 'rb') as fh:
+                for chunk in iter(lambda: fh.read(CHUNK_SIZE), b''):
+                    validator.update(chunk)
+    except zlib.error as e:
+        return f'corrupt gzip ({e})'
+    except EOFError as e:
+        return str(e)
+    except OSError as e:
+        return f'unreadable ({e})'
+    return validator.problem()
+
+
+def _ftp_paths(path: Path) -> Dict[str, str]:
+    """{accession: ftp_path} from a <split>_ftp_paths.txt written by download."""
+    if not path.exists():
+        return {}
+    lines = [line.strip() for line in path.read_text().splitlines() if line.strip()]
+    return {line.rstrip('/').split('/')[-1]: line for line in lines}
+
+
+def _expected_md5(path: Path, meta_dir: Path, ftp_path: Optional[str],
+                  session: Optional[requests.Session]) -> Optional[str]:
+    """NCBI's md5 of a .fna.gz from the cached listing, fetched first if a session is given."""
+    if path.suffix != '.gz':
+        return None
+    accession = accession_of(path)
+    cached = meta_dir / 'checksums' / f'{accession}_md5checksums.txt'
+    if cached.exists():
+        return parse_checksums(cached.read_text()).get(path.name)
+    if session is not None and ftp_path:
+        return fetch_checksums(ftp_path, meta_dir / 'checksums', session).get(path.name)
+    return None
+
+
+def verify_category(base_dir: Path, category: str,
+                    jobs: int = 1,
+                    min_length: int = MIN_CONTIG_LENGTH,
+                    session: Optional[requests.Session] = None,
+                    progress_interval: float = PROGRESS_INTERVAL) -> List[dict]:
+    """
+    Check the genomes under <base_dir>/raw/<category>/<split> as download
+    left them: leftover partial downloads and decompressions, files the
+    completion ledger does not list, accessions of <split>_ftp_paths.txt
+    with no file, and every file's content (see check_file) on `jobs`
+    processes. Content results are cached in metadata/<category>/verify_cache.json
+    by size and mtime, so unchanged files are not read again.
+    :param session: fetch NCBI checksum listings that are not cached yet, offline if None
+    :return: repair rows (REPAIR_FIELDS), one per broken or missing accession
+    """
+    raw_dir = base_dir / 'raw' / category
+    meta_dir = base_dir / 'metadata' / category
+    cache_path = meta_dir / CACHE_NAME
+    cache = json.loads(cache_path.read_text()) if cache_path.exists() else {}
+    metrics = Metrics(f'verify {category}', rates=['bytes_checked'], interval=progress_interval)
+
+    problems: Dict[tuple, str] = {}
+    ftp_paths: Dict[tuple, str] = {}
+    todo = []
+    new_cache = {}
+    for split in SPLITS:
+        expected = _ftp_paths(meta_dir / f'{split}_ftp_paths.txt')
+        ledger_path = meta_dir / f'{category}_{split}_completed.txt'
+        ledger = CompletionLedger(ledger_path) if ledger_path.exists() else None
+        split_dir = raw_dir / split
+        files = sorted(f for f in split_dir.iterdir() if f.is_file()) if split_dir.exists() else []
+
+        present = set()
+        for path in files:
+            accession = accession_of(path)
+            key = (split, accession)
+            present.add(accession)
+            ftp_paths[key] = expected.get(accession, '')
+
+            if path.suffix == '.tmp':
+                problems.setdefault(key, 'interrupted download')
+                continue
+            if path.suffix == '.fna' and path.with_name(path.name + '.gz').exists():
+                problems.setdefault(key, 'interrupted decompression')
+                continue
+            if path.suffix == '.fna' and ledger is not None and accession not in ledger:
+                problems.setdefault(key, 'not recorded as complete')
+                continue
+
+            st = path.stat()
+            md5 = _expected_md5(path, meta_dir, expected.get(accession), session)
+            entry = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'min_length': min_length, 'md5': md5}
+            rel = f'{split}/{path.name}'
+            cached = cache.get(rel)
+            if cached is not None and all(cached.get(k) == v for k, v in entry.items()):
+                new_cache[rel] = cached
+                metrics.count('files_cached')
+                if cached['problem']:
+                    problems.setdefault(key, cached['problem'])
+            else:
+                todo.append((key, rel, path, entry))
+
+        for accession in sorted(set(expected) - present):
+            problems[(split, accession)] = 'missing'
+            ftp_paths[(split, accession)] = expected[accession]
+
+    logging.info(f'{category}: checking {len(todo)} files, {len(new_cache)} unchanged since the last scan')
+    metrics.total = len(todo)
+    paths = [path for _, _, path, _ in todo]
+    md5s = [entry['md5'] for _, _, _, entry in todo]
+    with metrics.stage('check'):
+        if jobs > 1:
+            with ProcessPoolExecutor(max_workers=jobs) as pool:
+                results = list(_tracked(pool.map(check_file, paths, md5s, repeat(min_length), chunksize=4),
+                                        paths, metrics))
+        else:
+            results = list(_tracked(map(check_file, paths, md5s, repeat(min_length)), paths, metrics))
+
+    for (key, rel, _, entry), problem in zip(todo, results):
+        new_cache[rel] = {**entry, 'problem': problem}
+        if problem:
+            problems.setdefault(key, problem)
+
+    meta_dir.mkdir(parents=True, exist_ok=True)
+    tmp = cache_path.with_suffix('.tmp')
+    tmp.write_text(json.dumps(new_cache, indent=1))
+    tmp.replace(cache_path)
+    metrics.write(meta_dir / f'{category}_verify_metrics.json')
+
+    rows = [{'category': category, 'split': split, 'accession': accession,
+             'ftp_path': ftp_paths.get((split, accession), ''), 'problem': problem}
+            for (split, accession), problem in problems.items()]
+    rows.sort(key=lambda r: (SPLITS.index(r['split']), r['accession']))
+    for row in rows:
+        logging.warning(f"{row['split']}/{row['accession']}: {row['problem']}")
+    return rows
+
+
+def _tracked(results, paths: List[Path], metrics: Metrics):
+    for path, result in zip(paths, results):
+        metrics.count('bytes_checked', path.stat().st_size if path.exists() else 0)
+        metrics.count('files_broken' if result else 'files_ok')
+        metrics.advance()
+        yield result
+
+
+def write_repair_list(path: Path, rows: List[dict]) -> None:
+    """Write repair rows as a TSV with a REPAIR_FIELDS header, for `download --repair`."""
+    with open(path, 'w', newline='') as fh:
+        writer = csv.DictWriter(fh, fieldnames=REPAIR_FIELDS, delimiter='\t')
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def read_repair_list(path: Path) -> List[dict]:
+    """Repair rows of a list written by write_repair_list."""
+    with open(path, newline='') as fh:
+        return list(csv.DictReader(fh, delimiter='\t'))
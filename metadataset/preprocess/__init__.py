@@ -1,4 +1,7 @@
 from .core import BioProcessor
 from .config import PipelineConfig, CATEGORY_TO_DOMAIN
+from .manifest import ManifestStore
+from .merge import merge_shards
+from .multi import MultiProcessor
 
-__all__ = ["BioProcessor", "PipelineConfig", "CATEGORY_TO_DOMAIN"]
+__all__ = ["BioProcessor", "PipelineConfig", "CATEGORY_TO_DOMAIN", "ManifestStore", "MultiProcessor", "merge_shards"]
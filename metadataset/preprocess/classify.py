@@ -0,0 +1,129 @@
+"""
+Replicon classification of FASTA descriptions.
+
+The description is lower-cased once and every keyword of every rule is
+matched in one pass of a single compiled regex alternation, which yields
+the replicon type, the 4-class label and the plasmid label together.
+Results are memoized per description with bounded LRU eviction, since
+collections repeat the same description templates many times.
+"""
+import re
+from functools import lru_cache
+from itertools import permutations
+from typing import Dict, NamedTuple, Optional, Sequence
+
+from .config import CATEGORY_TO_DOMAIN, DEFAULT_REPLICON_RULES
+
+# Replicon types that are their own class4; others take the category's domain
+CLASS4_TYPES = ("plasmid", "viral")
+# Replicon types rules may assign: the host map files plasmid and chromosomal records by them
+REPLICON_TYPES = tuple(DEFAULT_REPLICON_RULES)
+UNKNOWN = "unknown"
+DEFAULT_CACHE_SIZE = 1 << 16
+
+
+def validate_rules(rules) -> None:
+    """
+    Raise ValueError unless `rules` maps known replicon types (REPLICON_TYPES)
+    to non-empty lists of keywords. A blank keyword would match every
+    description, so it is refused too.
+    """
+    if not isinstance(rules, dict):
+        raise ValueError("Replicon rules must map each replicon type to a list of keywords")
+    unknown = [rtype for rtype in rules if rtype not in REPLICON_TYPES]
+    if unknown:
+        raise ValueError(f"Unknown replicon types: {', '.join(map(str, unknown))}; "
+                         f"expected some of {', '.join(REPLICON_TYPES)}")
+    for rtype, keywords in rules.items():
+        if not isinstance(keywords, (list, tuple)) or not keywords:
+            raise ValueError(f"Replicon rule '{rtype}' needs a non-empty list of keywords")
+        for keyword in keywords:
+            if not isinstance(keyword, str) or not keyword.strip():
+                raise ValueError(f"Replicon rule '{rtype}' has an empty or blank keyword: {keyword!r}")
+
+
+def _overlapping(priority: Dict[str, int]) -> bool:
+    """
+    Whether a keyword can share text with a keyword of another rule, by
+    containing it or by a suffix of one being a prefix of the other. Only
+    then can a match consume a keyword that decides the result.
+    """
+    for a, b in permutations(priority, 2):
+        if priority[a] == priority[b]:
+            continue
+        if b in a or any(a.endswith(b[:n]) for n in range(1, min(len(a), len(b)))):
+            return True
+    return False
+
+
+class Classification(NamedTuple):
+    replicon_type: str
+    class4: str
+    plasmid_label: Optional[str]  # text after the plasmid keyword, None if there is none
+
+
+class RepliconClassifier:
+    """
+    Classifies descriptions by keyword rules: the first rule, in order,
+    with a keyword anywhere in the description (case-insensitive) gives
+    the replicon type, "unknown" if none does.
+    """
+
+    def __init__(self, category: str,
+                 rules: Optional[Dict[str, Sequence[str]]] = None,
+                 cache_size: int = DEFAULT_CACHE_SIZE):
+        """
+        :param category: taxonomic category, decides class4 of chromosomal records
+        :param rules: {replicon type: keywords}, highest priority first;
+                      DEFAULT_REPLICON_RULES if None
+        :param cache_size: descriptions memoized, 0 = none
+        """
+        rules = DEFAULT_REPLICON_RULES if rules is None else rules
+        validate_rules(rules)
+        self.types = list(rules)
+        self.domain = CATEGORY_TO_DOMAIN.get(category.lower(), UNKNOWN)
+        self._priority: Dict[str, int] = {}
+        for priority, keywords in enumerate(rules.values()):
+            for keyword in keywords:
+                self._priority.setdefault(keyword.lower(), priority)
+        self._plasmid = self.types.index("plasmid") if "plasmid" in rules else None
+
+        # At one position the higher-priority, then longer keyword matches
+        keywords = sorted(self._priority, key=lambda k: (self._priority[k], -len(k)))
+        alternation = "|".join(map(re.escape, keywords))
+        if _overlapping(self._priority):
+            # A lookahead matches at every position, so no keyword can hide inside another's match
+            alternation = f"(?=({alternation}))"
+        self._pattern = re.compile(alternation)
+        # Result of each rule without a plasmid label, "unknown" last
+        self._unlabelled = [Classification(t, t if t in CLASS4_TYPES else self.domain, None)
+                            for t in self.types] + [Classification(UNKNOWN, self.domain, None)]
+
+        self.classify = lru_cache(maxsize=cache_size)(self._classify) if cache_size else self._classify
+
+    def _classify(self, description: str) -> Classification:
+        text = description.lower()
+        hits = self._pattern.findall(text)
+        if not hits:
+            return self._unlabelled[-1]
+
+        priority = self._priority
+        best = min(map(priority.__getitem__, hits))
+        result = self._unlabelled[best]
+        if best != self._plasmid:
+            return result
+        # Hits come in text order, so the first plasmid keyword hit is also its first occurrence
+        for keyword in hits:
+            if priority[keyword] == best:
+                label = description[text.find(keyword) + len(keyword):].strip() or None
+                return Classification(result.replicon_type, result.class4, label)
+
+    def replicon_type(self, description: str) -> str:
+        return self.classify(description or "").replicon_type
+
+    def class4(self, description: str) -> str:
+        return self.classify(description or "").class4
+
+    def plasmid_label(self, description: str, rec_id: str) -> str:
+        """The plasmid's name from its description, `rec_id` if it has none."""
+        return self.classify(description or "").plasmid_label or rec_id
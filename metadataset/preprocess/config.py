@@ -1,5 +1,6 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from pathlib import Path
+from typing import Dict, List, Optional
 
 # Mapping of specific categories to high-level domains
 CATEGORY_TO_DOMAIN = {
@@ -11,6 +12,14 @@ CATEGORY_TO_DOMAIN = {
     "viral": "viral",
 }
 
+# Replicon type by description keywords, see classify.py; the first rule
+# with a keyword anywhere in the description wins
+DEFAULT_REPLICON_RULES = {
+    "viral": ["phage", "virus", "viral", "bacteriophage"],
+    "plasmid": ["plasmid"],
+    "chromosomal": ["chromosome", "complete genome", "chromosomal"],
+}
+
 @dataclass
 class PipelineConfig:
     """Configuration settings for the preprocessing pipeline."""
@@ -20,4 +29,31 @@ class PipelineConfig:
     min_len: int = 1000
     max_ambig: float = 0.05
     mash_threshold: float = 0.05
+    mash_dedup: bool = True
+    kmer_size: int = 21
+    sketch_size: int = 1000
+    mash_within_split: bool = False
+    lsh_bands: int = 128
+    lsh_rows: int = 1
     keep_unknown: bool = False
+    replicon_rules: Dict[str, List[str]] = field(
+        default_factory=lambda: {k: list(v) for k, v in DEFAULT_REPLICON_RULES.items()})
+    classify_cache: int = 1 << 16  # descriptions whose classification is memoized, 0 = none
+    jobs: int = 1
+    incremental: bool = False
+    dedup_memory_mb: int = 0  # spill the MD5 table to disk beyond this, 0 = never
+    dedup_bloom_mb: int = 0
+    fasta_engine: str = "native"  # or "biopython"
+    output_format: str = "files"  # or "shards": packed multi-FASTA with .fai
+    shard_size_mb: int = 256
+    output_compression: str = "none"  # or "gzip", "zstd" (needs zstandard); 'files' output only
+    writer_threads: int = 2  # background threads writing record files, 0 = write inline
+    write_buffer_mb: int = 64  # sequence queued for the writer threads before commit waits
+    stream_threshold_mb: int = 32  # records longer than this are cleaned chunk-wise, 0 = never
+    manifest_db: bool = False  # also write an indexed SQLite manifest
+    record_stats: bool = False  # length/GC/ambiguity manifest columns and per-assembly aggregates
+    tetra_freqs: bool = False  # with record_stats: tetranucleotide frequencies in <category>_tetra.npz
+    progress_interval: float = 30.0  # seconds between progress lines, 0 = none
+    profile: Optional[Path] = None  # cProfile output, workers included
+    shard_index: int = 0  # with shard_count > 1, process only this subset of the inputs, see sharding.py
+    shard_count: int = 1
@@ -1,197 +1,861 @@
 import csv
+import gzip
 import hashlib
+import io
 import json
 import logging
+import os
+import zlib
 import shutil
-import subprocess
+import tempfile
 from collections import defaultdict
-from typing import Optional, Set
-from Bio import SeqIO
-from Bio.Seq import Seq
-
+from concurrent.futures import Executor, ProcessPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import partial
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
+
+from .classify import RepliconClassifier
 from .config import PipelineConfig
+from .digests import DigestSet
+from .lsh import NearDuplicateIndex, band_recall
+from .manifest import ManifestStore, TeeWriter, manifest_db_path, manifest_fields
+from .minhash import MinHashSketcher, Sketch, jaccard_for_distance, load_sketches, save_sketches
+from .shards import ShardWriter
+from .seqstats import AssemblyStats, RecordStats, StatsBuilder, TetraTable
+from .sharding import partial_dir, save_shard_config, select_shard
+from .state import StateStore
+from .writer import RecordWriter
 from .helpers import (
     sanitize_id,
-    get_replicon_type,
-    get_class4,
     iter_fasta,
-    clean_sequence_string
+    clean_sequence_bytes
+)
+from ..download.stream import DownloadError
+from ..download.validate import FastaStreamValidator, ValidatingReader
+from ..utils.fasta import (
+    FastaRecord,
+    StreamedFastaRecord,
+    WrappedSequenceWriter,
+    format_fasta_header,
+    parse_fasta_stream
 )
+from ..utils.io import FILE_MODE
+from ..utils.metrics import Metrics, timed
+from ..utils.parallel import ordered_map
+from ..utils.profiling import profile_worker
+
+SPLITS = ["train", "val", "test"]
+MANIFEST_BUFFER = 1 << 20  # manifest rows reach the file in blocks this large
+MIN_LSH_RECALL = 0.999  # below this chance of catching a pair at the Mash threshold, warn
+MASH_CLUSTER_FIELDS = [
+    "representative", "representative_split", "member_accession",
+    "member_split", "member_source", "distance"
+]
+
+
+def new_record_writer(config: PipelineConfig) -> RecordWriter:
+    """The writer of 'files' output configured by `config`."""
+    return RecordWriter(threads=config.writer_threads, buffer_bytes=config.write_buffer_mb << 20,
+                        compression=config.output_compression)
+
+
+def new_digest_set(config: PipelineConfig, meta_dir: Path, name: str) -> DigestSet:
+    """The MD5 dedup table sized by `config`, spilling to <meta_dir>/<name>_md5_table.bin."""
+    return DigestSet(
+        memory_budget=(config.dedup_memory_mb << 20) or None,
+        spill_path=meta_dir / f"{name}_md5_table.bin",
+        bloom_bits=config.dedup_bloom_mb << 23,
+    )
+
+
+@dataclass
+class Candidate:
+    """A cleaned record that passed the per-record filters but not yet dedup."""
+    record: FastaRecord
+    description: str
+    replicon_type: str
+    class4: str
+    digest: bytes
+    sketch: Optional[Sketch] = None
+    spool: Optional[Path] = None  # streamed records: already written here, record.seq is None
+    length: int = 0
+    seq_stats: Optional[RecordStats] = None  # with record_stats
+
+
+# Per-process processors used by pool workers, one per category, see analysis_pool
+_WORKERS: Dict[str, "BioProcessor"] = {}
+_KNOWN: Optional[DigestSet] = None
+
+
+def _init_worker(profile: Optional[Path], known_path: Optional[Path]) -> None:
+    global _KNOWN
+    if profile is not None:
+        profile_worker(profile)
+    _KNOWN = DigestSet.attach(known_path) if known_path is not None else None
+
+
+def _worker(config: PipelineConfig) -> "BioProcessor":
+    processor = _WORKERS.get(config.category)
+    if processor is None:
+        processor = _WORKERS[config.category] = BioProcessor(config)
+    return processor
+
+
+def _analyze_in_worker(config: PipelineConfig,
+                       fpath: Path) -> Tuple[List[Candidate], Dict[str, int], Dict[str, float]]:
+    return _worker(config).analyze_file(fpath, _KNOWN)
+
+
+def _analyze_gzip_in_worker(config: PipelineConfig,
+                            data: Optional[bytes]) -> Tuple[List[Candidate], Dict[str, int], Dict[str, float]]:
+    return _worker(config).analyze_gzip(data, _KNOWN)
+
+
+@contextmanager
+def analysis_pool(config: PipelineConfig, known: DigestSet, snapshot_path: Path):
+    """
+    `config.jobs` worker processes for BioProcessor analysis, which may be
+    shared by processors of several categories. Workers pre-filter against
+    the digests in `known` when the pool starts, shared through a snapshot
+    file at `snapshot_path`.
+    """
+    known_path = known.share(snapshot_path) if len(known) else None
+    try:
+        with ProcessPoolExecutor(max_workers=max(1, config.jobs), initializer=_init_worker,
+                                 initargs=(config.profile, known_path)) as pool:
+            yield pool
+    finally:
+        if known_path is not None:
+            known_path.unlink()
+
+
+def partial_path(path: Path) -> Path:
+    """Where `path` is written until the record files it lists are complete."""
+    return path.with_name(path.name + ".tmp")
+
+
+def _drop_spools(candidates: List[Candidate]) -> None:
+    for cand in candidates:
+        if cand.spool is not None:
+            cand.spool.unlink()
+
+
+def resume_incremental(processors: List["BioProcessor"], inputs: List[List[Tuple[str, Path]]]
+                       ) -> List[Tuple[List[Tuple[str, Path]], List[dict]]]:
+    """
+    BioProcessor.resume_from_state for processors sharing one dedup set.
+    Retracting a source also retracts, in any of the processors, every
+    unchanged source that dropped an MD5 duplicate or near-duplicate of its
+    records, since that source now holds the copy to keep; this repeats
+    until no more sources are affected.
+    :return: (inputs to process, manifest rows to keep) per processor
+    """
+    for processor, proc_inputs in zip(processors, inputs):
+        processor.load_state(proc_inputs)
+    while True:
+        digests, paths = set(), set()
+        for processor in processors:
+            d, p = processor.retracted_output()
+            digests |= d
+            paths |= p
+        # Every processor is asked, even after one has found dependents
+        if not any([processor.requeue_dependents(digests, paths) for processor in processors]):
+            break
+    return [processor.restore_state() for processor in processors]
 
 
 class BioProcessor:
-    def __init__(self, config: PipelineConfig):
+    def __init__(self, config: PipelineConfig, seen: Optional[DigestSet] = None):
+        """
+        :param seen: MD5 table shared with the processors of other categories,
+                     which then also dedups across them; closed by its owner
+        """
         self.cfg = config
-        self.seen_md5_global: Set[str] = set()
         self.stats = defaultdict(int)
+        self.metrics = Metrics(self.cfg.category, counters=self.stats,
+                               rates=["records_read", "bases_read", "bases_written"],
+                               interval=self.cfg.progress_interval)
+        self.classifier = RepliconClassifier(self.cfg.category, self.cfg.replicon_rules, self.cfg.classify_cache)
         # Structure: host_map[assembly_id] = { ... }
         self.host_map = defaultdict(lambda: {"chromosome_accessions": [], "plasmids": {}})
 
+        # A shard of a --shard run keeps its partial metadata and shards apart, see sharding.py
+        self.sharded = self.cfg.shard_count > 1
         self.meta_dir = self.cfg.out_dir / "metadata"
+        self.records_dir = self.cfg.out_dir
+        self.spool_dir = self.cfg.out_dir / ".spool"
+        if self.sharded:
+            self.meta_dir = self.records_dir = partial_dir(self.cfg.out_dir, self.cfg.category,
+                                                           self.cfg.shard_index, self.cfg.shard_count)
+            self.spool_dir = self.meta_dir / ".spool"
         self.meta_dir.mkdir(parents=True, exist_ok=True)
 
+        # Raw 16-byte MD5s of every sequence accepted so far
+        self._owns_seen = seen is None
+        self.seen_md5_global = seen if seen is not None else new_digest_set(self.cfg, self.meta_dir,
+                                                                            self.cfg.category)
+        self.shards: Optional[ShardWriter] = None
+        self.writer: Optional[RecordWriter] = None
+        self.shard_digests: List[bytes] = []  # of each written record, in order, for the merge
+        self.stream_threshold = (self.cfg.stream_threshold_mb << 20) or None
+        if self.cfg.tetra_freqs and not self.cfg.record_stats:
+            raise ValueError("tetra_freqs needs record_stats")
+        self.assembly_stats = AssemblyStats() if self.cfg.record_stats else None
+        self.tetra = TetraTable() if self.cfg.tetra_freqs else None
+        self.state: Optional[StateStore] = None
+
+        # Near-duplicate detection: sketches of every written record, in write order
+        self.sketcher: Optional[MinHashSketcher] = None
+        self.near_dups: Optional[NearDuplicateIndex] = None
+        self.mash_clusters: List[dict] = []
+        if self.cfg.mash_dedup:
+            self.sketcher = MinHashSketcher(self.cfg.kmer_size, self.cfg.sketch_size,
+                                            bins=self.cfg.lsh_bands * self.cfg.lsh_rows)
+            self.near_dups = NearDuplicateIndex(self.cfg.kmer_size, self.cfg.sketch_size,
+                                                self.cfg.lsh_bands, self.cfg.lsh_rows)
+            recall = band_recall(jaccard_for_distance(self.cfg.mash_threshold, self.cfg.kmer_size),
+                                 self.cfg.lsh_bands, self.cfg.lsh_rows)
+            if recall < MIN_LSH_RECALL:
+                logging.warning(f"{self.cfg.lsh_bands} LSH bands of {self.cfg.lsh_rows} rows find only "
+                                f"{recall:.1%} of the pairs at the Mash threshold; use more bands or fewer rows")
+
     def is_high_quality(self, seq_str: str) -> bool:
         """Check quality metrics (ambiguity) BEFORE cleaning."""
         if not seq_str:
             return False
         # Count chars that are NOT A, C, G, T
-        ambiguous_count = sum(1 for b in seq_str if b not in "ACGT")
-        return (ambiguous_count / len(seq_str)) <= self.cfg.max_ambig
+        raw = seq_str.encode("ascii", "replace") if isinstance(seq_str, str) else seq_str
+        ambiguous_count = len(raw.translate(None, b"ACGT"))
+        return (ambiguous_count / len(raw)) <= self.cfg.max_ambig
+
+    def clean_record(self, rec, stats, times: Optional[Dict[str, float]] = None) -> Optional[Tuple[bytes, bytes]]:
+        """Quality-check and clean a record, returning (sequence, md5) or None."""
+        times = {} if times is None else times
+        raw = rec.seq if isinstance(rec.seq, bytes) else str(rec.seq).encode("ascii", "replace")
+        if not raw:
+            stats["skipped_low_quality"] += 1
+            return None
 
-    def process_sequence(self, rec) -> Optional[Seq]:
-        """Orchestrates cleaning, checking, and deduplication."""
-        seq_upper = str(rec.seq).upper()
+        # Upper-casing and cleaning in one pass; what was removed is ambiguous
+        with timed(times, "clean"):
+            cleaned = clean_sequence_bytes(raw)
+        ambiguous_count = len(raw) - len(cleaned)
 
-        if not self.is_high_quality(seq_upper):
-            self.stats["skipped_low_quality"] += 1
+        if (ambiguous_count / len(raw)) > self.cfg.max_ambig:
+            stats["skipped_low_quality"] += 1
             return None
 
-        # Clean using helper
-        cleaned_str = clean_sequence_string(seq_upper)
+        if len(cleaned) < self.cfg.min_len:
+            stats["skipped_short"] += 1
+            return None
 
-        if len(cleaned_str) < self.cfg.min_len:
-            self.stats["skipped_short"] += 1
+        with timed(times, "hash"):
+            digest = hashlib.md5(cleaned).digest()
+        return cleaned, digest
+
+    def stream_record(self, rec: StreamedFastaRecord, stats,
+                      times: Dict[str, float]
+                      ) -> Optional[Tuple[Path, bytes, Optional[Sketch], int, Optional[RecordStats]]]:
+        """
+        clean_record for a record too long to hold: the chunks are cleaned,
+        hashed, sketched and counted one at a time while the cleaned record
+        is written to a spool file. Returns (spool file, md5, sketch, length,
+        statistics) or None.
+        """
+        self.spool_dir.mkdir(parents=True, exist_ok=True)
+        fd, name = tempfile.mkstemp(suffix=".fna.part", dir=self.spool_dir)
+        # mkstemp makes the file private, and uncompressed output is moved into place as it is
+        os.fchmod(fd, FILE_MODE)
+        spool = Path(name)
+        md5 = hashlib.md5()
+        builder = self.sketcher.builder() if self.sketcher else None
+        counter = StatsBuilder(self.cfg.tetra_freqs) if self.cfg.record_stats else None
+        raw_len = clean_len = 0
+
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(format_fasta_header(rec.id, rec.description))
+            out = WrappedSequenceWriter(fh)
+            for chunk in rec.chunks:
+                with timed(times, "clean"):
+                    cleaned = clean_sequence_bytes(chunk)
+                raw_len += len(chunk)
+                clean_len += len(cleaned)
+                with timed(times, "hash"):
+                    md5.update(cleaned)
+                if builder is not None:
+                    with timed(times, "sketch"):
+                        builder.update(cleaned)
+                if counter is not None:
+                    with timed(times, "stats"):
+                        counter.update(cleaned, len(chunk))
+                with timed(times, "spool"):
+                    out.write(cleaned)
+            out.close()
+        stats["bases_read"] += raw_len
+
+        if (raw_len - clean_len) / raw_len > self.cfg.max_ambig:
+            stats["skipped_low_quality"] += 1
+        elif clean_len < self.cfg.min_len:
+            stats["skipped_short"] += 1
+        else:
+            return (spool, md5.digest(), builder.finish() if builder else None, clean_len,
+                    counter.finish() if counter else None)
+        spool.unlink()
+        return None
+
+    def process_sequence(self, rec) -> Optional[bytes]:
+        """Orchestrates cleaning, checking, and deduplication."""
+        cleaned = self.clean_record(rec, self.stats)
+        if cleaned is None:
             return None
+        cleaned_seq, seq_hash = cleaned
 
         # MD5 Deduplication
-        seq_hash = hashlib.md5(cleaned_str.encode("utf-8")).hexdigest()
         if seq_hash in self.seen_md5_global:
             self.stats["skipped_duplicate_md5"] += 1
             return None
 
         self.seen_md5_global.add(seq_hash)
-        return Seq(cleaned_str)
+        return cleaned_seq
 
     def extract_plasmid_name(self, desc: str, rec_id: str) -> str:
-        d_lower = desc.lower()
-        if "plasmid" in d_lower:
-            parts = d_lower.split("plasmid", 1)
-            if len(parts) > 1 and parts[1].strip():
-                idx = d_lower.find("plasmid") + 7
-                return desc[idx:].strip()
-        return rec_id
-
-    def run_mash_dedup(self):
-        """Runs external tool 'mash' for near-duplicate removal."""
-        if shutil.which("mash") is None:
-            logging.warning("MASH not found in PATH. Skipping near-identical deduplication.")
-            return
-
-        logging.info("Starting Mash deduplication...")
-        pairs = [("train", "val"), ("train", "test"), ("val", "test")]
-        cat = str(self.cfg.category)
-
-        for ref_split, query_split in pairs:
-            ref_dir = self.cfg.out_dir / ref_split / cat
-            q_dir = self.cfg.out_dir / query_split / cat
+        return self.classifier.plasmid_label(desc, rec_id)
+
+    def add_to_host_map(self, assembly_id: str, rtype: str, rec_id: str, desc: str) -> None:
+        if rtype == "plasmid":
+            label = self.extract_plasmid_name(desc, rec_id)
+            self.host_map[assembly_id]["plasmids"][rec_id] = label
+        elif rtype == "chromosomal":
+            if rec_id not in self.host_map[assembly_id]["chromosome_accessions"]:
+                self.host_map[assembly_id]["chromosome_accessions"].append(rec_id)
+
+    def find_near_duplicate(self, split: str, sketch: Sketch) -> Optional[Tuple[str, str, float]]:
+        """
+        Look for a kept record within `mash_threshold` of `sketch`, returning
+        (its path, its split, distance). Records of earlier splits are always
+        searched, those of the same split only with `mash_within_split`, in
+        which case the first record kept acts as its cluster's representative.
+        """
+        groups = set(SPLITS[:SPLITS.index(split)])
+        if self.cfg.mash_within_split:
+            groups.add(split)
+        if not groups:
+            return None
 
-            ref_files = list(ref_dir.glob("*.fna"))
-            q_files = list(q_dir.glob("*.fna"))
+        hit = self.near_dups.nearest(sketch, self.cfg.mash_threshold, groups)
+        if hit is None:
+            return None
+        item, dist = hit
+        return self.near_dups.names[item], self.near_dups.groups[item], dist
+
+    def reject_near_duplicate(self, split: str, out_name: str, rec_id: str,
+                              source: str, sketch: Sketch) -> Optional[str]:
+        """
+        The path of the kept record if this one is a near-duplicate of it, in
+        which case it is counted and added to the cluster report; else None.
+        """
+        with self.metrics.stage("near_dup"):
+            hit = self.find_near_duplicate(split, sketch)
+        if hit is None:
+            return None
+        ref_path, ref_split, dist = hit
+        logging.warning(f"Mash Dup ({dist:.4f}): Removing {out_name} (close to {Path(ref_path).name})")
+        if ref_split == split:
+            self.stats["skipped_mash_within_split"] += 1
+        else:
+            self.stats["skipped_mash_duplicate"] += 1
+        self.mash_clusters.append({
+            "representative": ref_path, "representative_split": ref_split,
+            "member_accession": rec_id, "member_split": split,
+            "member_source": source, "distance": f"{dist:.6f}"
+        })
+        return ref_path
+
+    def analyze_file(self, fpath: Path,
+                     known: Optional[DigestSet] = None
+                     ) -> Tuple[List[Candidate], Dict[str, int], Dict[str, float]]:
+        """Parse, classify and clean every record of one input file, see analyze_records."""
+        return self.analyze_records(iter_fasta(fpath, self.cfg.fasta_engine, self.stream_threshold), known)
+
+    def analyze_gzip(self, data: Union[bytes, BinaryIO, None],
+                     known: Optional[DigestSet] = None
+                     ) -> Tuple[List[Candidate], Dict[str, int], Dict[str, float]]:
+        """
+        analyze_file for a downloaded .fna.gz, held in memory or read from a
+        GenomeStream while it downloads (None if the download failed). The
+        decompressed stream is validated the way download does it while it
+        is parsed; an invalid file, or a stream that fails or does not match
+        its checksum, gives no candidates.
+        """
+        if data is None:
+            return [], {"skipped_download_failed": 1}, {}
+
+        raw = io.BytesIO(data) if isinstance(data, bytes) else data
+        validator = FastaStreamValidator()
+        handle = ValidatingReader(gzip.GzipFile(fileobj=raw), validator)
+        candidates = []
+        try:
+            records = parse_fasta_stream(handle, stream_threshold=self.stream_threshold)
+            candidates, stats, times = self.analyze_records(records, known)
+            # A stream checks its md5 once read to the end
+            raw.read()
+        except DownloadError as e:
+            logging.warning(f"Download failed: {e}")
+            _drop_spools(candidates)
+            return [], {"skipped_download_failed": 1}, {}
+        except (OSError, EOFError, zlib.error) as e:
+            logging.warning(f"Failed to decompress download: {e}")
+            _drop_spools(candidates)
+            return [], {"skipped_invalid_fasta": 1}, {}
+
+        if not validator.is_valid():
+            _drop_spools(candidates)
+            return [], {"skipped_invalid_fasta": 1}, times
+        return candidates, stats, times
+
+    def analyze_records(self, records: Iterator[FastaRecord],
+                        known: Optional[DigestSet] = None
+                        ) -> Tuple[List[Candidate], Dict[str, int], Dict[str, float]]:
+        """
+        Classify and clean the records of one input file.
+        Touches no shared state, so it can run in a worker process; the
+        returned counters and stage times are merged by the caller. Records whose digest
+        is already in `known` are cut down to a header-only candidate here,
+        which spares sketching them and shipping them back from a worker;
+        commit still drops them, and records what they deferred to.
+        """
+        stats = defaultdict(int)
+        times = defaultdict(float)
+        candidates = []
+
+        while True:
+            with timed(times, "parse"):
+                rec = next(records, None)
+            if rec is None:
+                break
+            stats["records_read"] += 1
+            if not isinstance(rec, StreamedFastaRecord):
+                stats["bases_read"] += len(rec.seq)
+
+            desc = rec.description or rec.id
+            rtype, cls, _ = self.classifier.classify(desc)
+
+            if cls == "unknown" and not self.cfg.keep_unknown:
+                continue
 
-            if not ref_files or not q_files:
+            if isinstance(rec, StreamedFastaRecord):
+                streamed = self.stream_record(rec, stats, times)
+                if streamed is None:
+                    continue
+                spool, seq_hash, sketch, length, seq_stats = streamed
+                # The spent chunk iterator cannot go back from a worker process
+                header = FastaRecord(rec.id, rec.description, None)
+                if known is not None and seq_hash in known:
+                    spool.unlink()
+                    candidates.append(Candidate(header, desc, rtype, cls, seq_hash))
+                    continue
+                candidates.append(Candidate(header, desc, rtype, cls, seq_hash, sketch, spool, length, seq_stats))
                 continue
 
-            sketch_prefix = str(self.meta_dir / f"mash_{ref_split}")
-            subprocess.run(
-                ["mash", "sketch", "-o", sketch_prefix] + [str(p) for p in ref_files],
-                check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
-            )
-            ref_msh = f"{sketch_prefix}.msh"
-
-            for q_file in q_files:
-                q_sketch = str(self.meta_dir / f"temp_q")
-                subprocess.run(
-                    ["mash", "sketch", "-o", q_sketch, str(q_file)],
-                    check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
-                )
-
-                res = subprocess.run(
-                    ["mash", "dist", ref_msh, f"{q_sketch}.msh"],
-                    capture_output=True, text=True
-                )
-
-                for line in res.stdout.strip().split("\n"):
-                    if not line: continue
-                    parts = line.split("\t")
-                    dist = float(parts[2])
-
-                    if dist <= self.cfg.mash_threshold:
-                        logging.warning(f"Mash Dup ({dist:.4f}): Removing {q_file.name}")
-                        q_file.unlink()
-                        self.stats["skipped_mash_duplicate"] += 1
-                        break
+            cleaned = self.clean_record(rec, stats, times)
+            if cleaned is None:
+                continue
 
-    def run(self):
+            cleaned_seq, seq_hash = cleaned
+            if known is not None and seq_hash in known:
+                candidates.append(Candidate(FastaRecord(rec.id, rec.description, None), desc, rtype, cls, seq_hash))
+                continue
+            seq_stats = None
+            if self.cfg.record_stats:
+                with timed(times, "stats"):
+                    seq_stats = StatsBuilder(self.cfg.tetra_freqs).update(cleaned_seq, len(rec.seq)).finish()
+            rec.seq = cleaned_seq
+            sketch = None
+            if self.sketcher:
+                with timed(times, "sketch"):
+                    sketch = self.sketcher.sketch(cleaned_seq)
+            candidates.append(Candidate(rec, desc, rtype, cls, seq_hash, sketch, seq_stats=seq_stats))
+
+        return candidates, dict(stats), dict(times)
+
+    def commit_file(self, split: str, fpath: Path, candidates: List[Candidate], writer) -> None:
+        """Deduplicate a file's candidates against everything committed so far and write them."""
         cat_str = str(self.cfg.category)
-        manifest_path = self.meta_dir / f"{cat_str}_manifest.csv"
-
-        with open(manifest_path, "w", newline="") as mf:
-            writer = csv.DictWriter(mf, fieldnames=[
-                "split", "category", "class4", "replicon_type",
-                "host_assembly", "accession", "description", "path", "source_file"
-            ])
-            writer.writeheader()
-
-            for split in ["train", "val", "test"]:
-                input_split_dir = self.cfg.base_dir / split / cat_str
-
-                if not input_split_dir.exists():
-                    logging.warning(f"Skipping missing directory: {input_split_dir}")
+        assembly_id = sanitize_id(fpath.stem)
+        added_digests, deferred, deferred_to = [], [], set()
+
+        for cand in candidates:
+            # MD5 Deduplication
+            if cand.digest in self.seen_md5_global:
+                self.stats["skipped_duplicate_md5"] += 1
+                deferred.append(cand.digest)
+                if cand.spool is not None:
+                    cand.spool.unlink()
+                continue
+            self.seen_md5_global.add(cand.digest)
+            added_digests.append(cand.digest)
+
+            rec, desc, rtype, cls = cand.record, cand.description, cand.replicon_type, cand.class4
+            rec_id = sanitize_id(rec.id)
+            out_name = f"{fpath.stem}__{rec_id}"
+
+            # Near-duplicate of a record already kept; shards leave this to the merge
+            if cand.sketch is not None and not self.sharded:
+                representative = self.reject_near_duplicate(split, out_name, rec.id, str(fpath), cand.sketch)
+                if representative is not None:
+                    deferred_to.add(representative)
+                    if cand.spool is not None:
+                        cand.spool.unlink()
                     continue
 
-                files = sorted(list(input_split_dir.glob("*")))
-                logging.info(f"Processing {split} ({len(files)} files)...")
-
-                for fpath in files:
-                    if fpath.name.startswith("."): continue
-
-                    assembly_id = sanitize_id(fpath.stem)
-
-                    for rec in iter_fasta(fpath):
-                        desc = rec.description or rec.id
-                        rtype = get_replicon_type(desc)
-                        cls = get_class4(cat_str, desc)
-
-                        if cls == "unknown" and not self.cfg.keep_unknown:
-                            continue
-
-                        processed_seq = self.process_sequence(rec)
-                        if processed_seq is None:
-                            continue
-
-                        rec.seq = processed_seq
-
-                        # Build Host Map
-                        if rtype == "plasmid":
-                            label = self.extract_plasmid_name(desc, rec.id)
-                            self.host_map[assembly_id]["plasmids"][rec.id] = label
-                        elif rtype == "chromosomal":
-                            if rec.id not in self.host_map[assembly_id]["chromosome_accessions"]:
-                                self.host_map[assembly_id]["chromosome_accessions"].append(rec.id)
-
-                        # Write to file
-                        out_cls_dir = self.cfg.out_dir / split / cls
-                        out_cls_dir.mkdir(parents=True, exist_ok=True)
+            self.add_to_host_map(assembly_id, rtype, rec.id, desc)
+
+            # Write to file, or append to the split/class shard
+            with self.metrics.stage("write"):
+                if self.shards is not None:
+                    if cand.spool is not None:
+                        out_path = self.shards.write_file(split, cls, out_name, rec.id, rec.description,
+                                                          cand.spool, cand.length)
+                        cand.spool.unlink()
+                    else:
+                        out_path = self.shards.write(split, cls, out_name, rec.id, rec.description, rec.seq)
+                else:
+                    out_path = self.cfg.out_dir / split / cls / f"{out_name}{self.writer.suffix}"
+                    if cand.spool is not None:
+                        self.writer.move(out_path, cand.spool)
+                    else:
+                        self.writer.write(out_path, rec.id, rec.description, rec.seq)
+            length = cand.length if cand.spool is not None else len(rec.seq)
+            self.stats["records_written"] += 1
+            self.stats["bases_written"] += length
+
+            if cand.sketch is not None:
+                self.near_dups.add(str(out_path), split, cand.sketch)
+
+            row = {
+                "split": split, "category": cat_str,
+                "class4": cls, "replicon_type": rtype,
+                "host_assembly": assembly_id, "accession": rec.id,
+                "description": desc, "path": str(out_path),
+                "source_file": str(fpath)
+            }
+            if self.sharded:
+                row["length"] = length
+                self.shard_digests.append(cand.digest)
+            if cand.seq_stats is not None:
+                row.update(cand.seq_stats.columns())
+                self.assembly_stats.add(row)
+                if cand.seq_stats.tetra is not None:
+                    self.tetra.add(str(out_path), cand.seq_stats.tetra)
+            writer.writerow(row)
+
+        if self.state is not None:
+            self.state.record(split, fpath, added_digests, deferred, deferred_to)
+
+    def write_cluster_report(self, path: Path) -> None:
+        """One row per removed near-duplicate, keyed by the record that was kept for it."""
+        with open(path, "w", newline="") as fh:
+            writer = csv.DictWriter(fh, fieldnames=MASH_CLUSTER_FIELDS, delimiter="\t")
+            writer.writeheader()
+            writer.writerows(self.mash_clusters)
+
+    def resume_from_state(self, inputs: List[Tuple[str, Path]]) -> Tuple[List[Tuple[str, Path]], List[dict]]:
+        """
+        Restore what earlier incremental runs produced and keep only the
+        inputs that are new or changed since. Output of changed or vanished
+        sources is retracted, and so is that of unchanged sources which
+        dropped duplicates of retracted records, so those are processed
+        again; everything else (manifest rows, host map, dedup digests,
+        sketches, cluster report) is carried over, and new records are
+        deduplicated against it.
+        :return: (inputs to process, manifest rows to keep)
+        """
+        return resume_incremental([self], [inputs])[0]
+
+    def load_state(self, inputs: List[Tuple[str, Path]]) -> None:
+        """First step of resume_incremental: find the new, changed and vanished sources."""
+        cat_str = str(self.cfg.category)
+        self.state = StateStore(self.meta_dir, cat_str)
+        self._inputs = inputs
+        todo, self._stale = self.state.diff(inputs)
+        self._todo = {str(fpath) for _, fpath in todo}
+        self._requeued = 0
 
-                        rec_id = sanitize_id(rec.id)
-                        out_name = f"{fpath.stem}__{rec_id}.fna"
-                        out_path = out_cls_dir / out_name
+        self._stored_rows = []
+        manifest_path = self.meta_dir / f"{cat_str}_manifest.csv"
+        if len(self.state) and manifest_path.exists():
+            with open(manifest_path, newline="") as mf:
+                self._stored_rows = list(csv.DictReader(mf))
+
+    def retracted_output(self) -> Tuple[Set[bytes], Set[str]]:
+        """(digests, record paths) that the stale sources put out, see load_state."""
+        digests = {d for source in self._stale for d in self.state.added_digests(source)}
+        paths = {row["path"] for row in self._stored_rows if row["source_file"] in self._stale}
+        return digests, paths
+
+    def requeue_dependents(self, digests: Set[bytes], paths: Set[str]) -> bool:
+        """Mark the sources that deferred to retracted output stale; True if there were any."""
+        found = self.state.dependents(digests, paths, self._stale)
+        self._stale |= found
+        self._todo |= found
+        self._requeued += len(found)
+        return bool(found)
+
+    def restore_state(self) -> Tuple[List[Tuple[str, Path]], List[dict]]:
+        """Last step of resume_incremental: retract stale output and carry over the rest."""
+        cat_str = str(self.cfg.category)
+        stale = self._stale
+        for source in stale:
+            self.state.forget(source)
+
+        rows, retracted = [], set()
+        for row in self._stored_rows:
+            if row["source_file"] in stale:
+                retracted.add(row["path"])
+                if self.shards is None and Path(row["path"]).exists():
+                    Path(row["path"]).unlink()
+                continue
+            rows.append(row)
+            self.add_to_host_map(row["host_assembly"], row["replicon_type"],
+                                 row["accession"], row["description"])
+
+        self.seen_md5_global.update(self.state.known_digests())
+
+        tetra_path = self.meta_dir / f"{cat_str}_tetra.npz"
+        if self.tetra is not None and len(self.state) and tetra_path.exists():
+            stored = TetraTable.load(tetra_path)
+            for name, freqs in zip(stored.names, stored.freqs):
+                if name not in retracted:
+                    self.tetra.add(name, freqs)
+
+        sketch_path = self.meta_dir / f"{cat_str}_sketches.npz"
+        if self.near_dups is not None and len(self.state) and sketch_path.exists():
+            names, groups, sketches, k, size = load_sketches(sketch_path)
+            if (k, size) != (self.sketcher.k, self.sketcher.size):
+                logging.warning(f"Stored sketches use k={k}, s={size}; new records are not compared against them")
+            else:
+                for name, group, sketch in zip(names, groups, sketches):
+                    if name not in retracted:
+                        self.near_dups.add(name, group, sketch)
+
+            cluster_path = self.meta_dir / f"{cat_str}_mash_clusters.tsv"
+            if cluster_path.exists():
+                with open(cluster_path, newline="") as fh:
+                    self.mash_clusters = [r for r in csv.DictReader(fh, delimiter="\t")
+                                          if r["member_source"] not in stale]
+
+        # Input order decides dedup precedence, also among re-queued sources
+        todo = [(split, fpath) for split, fpath in self._inputs if str(fpath) in self._todo]
+        logging.info(f"Incremental run: {len(todo)} of {len(self._inputs)} files new or changed "
+                     f"({self._requeued} re-queued for retracted duplicates), {len(retracted)} records retracted")
+        del self._inputs, self._stored_rows, self._stale, self._todo
+        return todo, rows
+
+    def list_inputs(self) -> List[Tuple[str, Path]]:
+        """All (split, file) pairs to process, in the order that decides dedup precedence."""
+        cat_str = str(self.cfg.category)
+        inputs = []
+        for split in SPLITS:
+            input_split_dir = self.cfg.base_dir / split / cat_str
 
-                        SeqIO.write([rec], out_path, "fasta")
-                        self.stats["records_written"] += 1
+            if not input_split_dir.exists():
+                logging.warning(f"Skipping missing directory: {input_split_dir}")
+                continue
 
-                        writer.writerow({
-                            "split": split, "category": cat_str,
-                            "class4": cls, "replicon_type": rtype,
-                            "host_assembly": assembly_id, "accession": rec.id,
-                            "description": desc, "path": str(out_path),
-                            "source_file": str(fpath)
-                        })
+            files = sorted(list(input_split_dir.glob("*")))
+            logging.info(f"Processing {split} ({len(files)} files)...")
+            inputs.extend((split, f) for f in files if not f.name.startswith("."))
+        return inputs
+
+    def iter_analyzed(self, inputs: List[Tuple[str, Path]], pool: Optional[Executor] = None):
+        """
+        Yield (split, file, candidates, stats, times) in input order, analysing files on
+        `cfg.jobs` worker processes when more than one is requested.
+        :param pool: analysis_pool to use instead of starting one
+        """
+        return self._analyze_all(inputs, [f for _, f in inputs], self.analyze_file, _analyze_in_worker, pool)
+
+    def iter_analyzed_gzip(self, inputs: List[Tuple[str, Path]], blobs: Iterable[Union[bytes, BinaryIO, None]],
+                           pool: Optional[Executor] = None, budget: Optional[int] = None):
+        """
+        iter_analyzed for downloads: `blobs` gives the .fna.gz of each input
+        in order, as a stream or as bytes (None if it failed), and is only
+        consumed as far as analysis has got, e.g. while downloads complete.
+        Worker processes need bytes; then `budget` caps the bytes queued
+        for them. Nothing is read from the input paths, they only name the records.
+        """
+        return self._analyze_all(inputs, blobs, self.analyze_gzip, _analyze_gzip_in_worker, pool,
+                                 weight=lambda data: len(data) if data else 0, budget=budget)
+
+    def _analyze_all(self, inputs, payloads, analyze, analyze_in_worker, pool=None, weight=None, budget=None):
+        jobs = max(1, self.cfg.jobs)
+        if jobs == 1:
+            for (split, fpath), payload in zip(inputs, payloads):
+                yield (split, fpath, *analyze(payload, self.seen_md5_global))
+            return
 
-            with open(self.meta_dir / f"{cat_str}_host_map.json", "w") as jf:
-                json.dump(self.host_map, jf, indent=2)
+        if pool is None:
+            snapshot = self.meta_dir / f"{self.cfg.category}_md5_snapshot.bin"
+            with analysis_pool(self.cfg, self.seen_md5_global, snapshot) as pool:
+                yield from self._analyze_all(inputs, payloads, analyze, analyze_in_worker, pool, weight, budget)
+            return
 
-            self.run_mash_dedup()
+        results = ordered_map(pool, partial(analyze_in_worker, self.cfg), payloads, window=2 * jobs,
+                              weight=weight, budget=budget)
+        for (split, fpath), (candidates, stats, times) in zip(inputs, results):
+            yield split, fpath, candidates, stats, times
+
+    def open_outputs(self) -> None:
+        """Set up shard or record file output and clear spool files left by an interrupted run."""
+        if self.cfg.output_format == "shards":
+            if self.cfg.output_compression != "none":
+                raise ValueError("Shards are written uncompressed, output_compression needs 'files' output")
+            self.shards = ShardWriter(self.records_dir, self.cfg.shard_size_mb << 20,
+                                      append=self.cfg.incremental)
+        else:
+            self.writer = new_record_writer(self.cfg)
+        shutil.rmtree(self.spool_dir, ignore_errors=True)
 
-            logging.info("Processing Complete.")
-            logging.info(f"Stats: {json.dumps(self.stats, indent=2)}")
+    def run(self):
+        if self.sharded:
+            if self.cfg.incremental:
+                raise ValueError("Incremental runs cannot be sharded")
+            # Start the shard's partial output afresh
+            shutil.rmtree(self.meta_dir)
+            self.meta_dir.mkdir(parents=True)
+            save_shard_config(self.meta_dir, self.cfg)
+        self.open_outputs()
+
+        inputs = self.list_inputs()
+        if self.sharded:
+            inputs = select_shard(inputs, self.cfg.shard_index, self.cfg.shard_count)
+        kept_rows = []
+        if self.cfg.incremental:
+            inputs, kept_rows = self.resume_from_state(inputs)
+
+        self.commit_all(self.iter_analyzed(inputs), len(inputs), kept_rows)
+
+    def close_outputs(self) -> None:
+        """Close the shards or finish writing record files, and drop leftover spool files."""
+        if self.shards is not None:
+            self.shards.close()
+        if self.writer is not None:
+            self.writer.close()
+        shutil.rmtree(self.spool_dir, ignore_errors=True)
+
+    def commit_all(self, analyzed: Iterable[tuple], total: int, kept_rows: List[dict] = ()) -> None:
+        """
+        Commit analysed files in the order given, then write the manifest,
+        host map and the remaining metadata.
+        :param analyzed: (split, file, candidates, stats, times) per input file
+        :param total: number of input files, for progress
+        :param kept_rows: manifest rows carried over from earlier runs
+        """
+        self.begin_commit(total, kept_rows)
+        with self.committing():
+            for item in analyzed:
+                self.commit_analyzed(*item)
+
+    @contextmanager
+    def committing(self) -> Iterator[None]:
+        """
+        Around the commit_analyzed calls after begin_commit: finish the
+        record files, then finish_commit, or abort_commit if the block or a
+        record write failed.
+        """
+        try:
+            try:
+                yield
+            finally:
+                self.close_outputs()
+        except BaseException:
+            self.abort_commit()
+            raise
+        self.finish_commit()
+
+    def begin_commit(self, total: int, kept_rows: List[dict] = (), sinks: Iterable = ()) -> None:
+        """
+        Open the manifest for commit_analyzed calls and write `kept_rows` to it.
+        It is written next to its final path and only moved there by
+        finish_commit, once close_outputs has finished the record files.
+        :param sinks: further csv.DictWriter-like sinks every manifest row goes to
+        """
+        cat_str = str(self.cfg.category)
+        self.metrics.total = total
+
+        self._store = None
+        if self.cfg.manifest_db and not self.sharded:
+            self._store = ManifestStore(partial_path(manifest_db_path(self.meta_dir, cat_str)), create=True,
+                                        fields=manifest_fields(self.cfg))
+
+        self._manifest = open(partial_path(self.meta_dir / f"{cat_str}_manifest.csv"), "w", newline="",
+                              buffering=MANIFEST_BUFFER)
+        # Rows carried over from a run with statistics may have more columns than this one
+        writer = csv.DictWriter(self._manifest, fieldnames=manifest_fields(self.cfg), extrasaction="ignore")
+        writer.writeheader()
+        sinks = [s for s in (self._store, *sinks) if s is not None]
+        self.manifest_writer = TeeWriter(writer, *sinks) if sinks else writer
+        self.manifest_writer.writerows(kept_rows)
+        if self.assembly_stats is not None:
+            for row in kept_rows:
+                self.assembly_stats.add(row)
+
+    def commit_analyzed(self, split: str, fpath: Path, candidates: List[Candidate],
+                        stats: Dict[str, int], times: Dict[str, float]) -> None:
+        """Commit one analysed file, see begin_commit."""
+        self.metrics.add_counts(stats)
+        self.metrics.add_times(times)
+        self.commit_file(split, fpath, candidates, self.manifest_writer)
+        self.metrics.advance()
+
+    def abort_commit(self) -> None:
+        """Drop the partial manifest of a failed commit; earlier runs' metadata stays."""
+        self._manifest.close()
+        Path(self._manifest.name).unlink()
+        if self._store is not None:
+            self._store.close()
+            self._store.path.unlink()
+
+    def finish_commit(self) -> None:
+        """
+        Move the manifest into place and write the host map and the
+        remaining metadata. Call after close_outputs.
+        """
+        cat_str = str(self.cfg.category)
+        self._manifest.close()
+        Path(self._manifest.name).replace(self.meta_dir / f"{cat_str}_manifest.csv")
+
+        with open(self.meta_dir / f"{cat_str}_host_map.json", "w") as jf:
+            json.dump(self.host_map, jf, indent=2)
+        if self.assembly_stats is not None:
+            self.assembly_stats.write(self.meta_dir / f"{cat_str}_assembly_stats.json")
+
+        if self._store is not None:
+            with self.metrics.stage("manifest_db"):
+                self._store.write_host_map(self.host_map)
+                self._store.finish()
+                self._store.close()
+                self._store.path.replace(manifest_db_path(self.meta_dir, cat_str))
+
+        with self.metrics.stage("finalize"):
+            if self.near_dups is not None:
+                save_sketches(self.meta_dir / f"{cat_str}_sketches.npz", self.near_dups.names,
+                              self.near_dups.groups, self.near_dups.sketches,
+                              self.sketcher.k, self.sketcher.size)
+                if not self.sharded:
+                    self.write_cluster_report(self.meta_dir / f"{cat_str}_mash_clusters.tsv")
+            if self.tetra is not None:
+                self.tetra.save(self.meta_dir / f"{cat_str}_tetra.npz")
+            if self.sharded:
+                (self.meta_dir / f"{cat_str}_digests.bin").write_bytes(b"".join(self.shard_digests))
+
+            if self.state is not None:
+                self.state.save()
+            if self._owns_seen:
+                self.seen_md5_global.close()
+
+        logging.info("Processing Complete.")
+        logging.info(f"Stats: {json.dumps(self.stats, indent=2)}")
+        self.metrics.write(self.meta_dir / f"{cat_str}_metrics.json")
@@ -0,0 +1,234 @@
+"""
+Compact exact set of 16-byte digests.
+
+Digests live in one flat open-addressing table (linear probing, 16 bytes
+per slot, load factor <= 0.7) instead of a Python set of hex strings, so
+an entry costs ~23 bytes instead of ~120. Once the table would outgrow
+`memory_budget` it is moved into a memory-mapped file, optionally with a
+Bloom filter kept in RAM so that lookups of new digests, the common case,
+do not touch the disk. A snapshot can be written with `share()` and
+attached read-only by worker processes with `DigestSet.attach()`.
+"""
+import logging
+import mmap
+import struct
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, Union
+
+DIGEST_SIZE = 16
+MAX_LOAD = 0.7
+MIN_CAPACITY = 1 << 10
+
+_MAGIC = b"MDDIGST1"
+_HEADER = struct.Struct("<8sQQQ")  # magic, count, capacity, has_zero
+_ZERO = bytes(DIGEST_SIZE)
+
+Digest = Union[bytes, str]
+
+
+def _raw(digest: Digest) -> bytes:
+    if isinstance(digest, str):
+        digest = bytes.fromhex(digest)
+    if len(digest) != DIGEST_SIZE:
+        raise ValueError(f"Expected a {DIGEST_SIZE}-byte digest, got {len(digest)} bytes")
+    return bytes(digest)
+
+
+class DigestSet:
+    def __init__(self, capacity: int = MIN_CAPACITY,
+                 memory_budget: Optional[int] = None,
+                 spill_path: Optional[Path] = None,
+                 bloom_bits: int = 0):
+        """
+        :param memory_budget: bytes of RAM the table may use before spilling
+        :param spill_path: file backing the table once it spills
+        :param bloom_bits: size of the in-RAM Bloom filter (rounded up to a
+                           power of two), 0 for none
+        """
+        self.memory_budget = memory_budget
+        self.spill_path = spill_path
+        self.readonly = False
+        self._count = 0
+        self._has_zero = False
+        self._mmap: Optional[mmap.mmap] = None
+        self._file = None
+        self._generation = 0
+
+        self._bloom = None
+        if bloom_bits:
+            bits = 1 << max(3, (bloom_bits - 1).bit_length())
+            self._bloom = bytearray(bits // 8)
+            self._bloom_mask = bits - 1
+
+        cap = MIN_CAPACITY
+        while cap < capacity:
+            cap <<= 1
+        self._allocate(cap)
+
+    # ------------------------------------------------------------------
+    # storage
+    # ------------------------------------------------------------------
+    def _allocate(self, capacity: int) -> None:
+        size = capacity * DIGEST_SIZE
+        spill = (self.spill_path is not None and self.memory_budget is not None
+                 and size > self.memory_budget)
+        old_mmap, old_file = self._mmap, self._file
+
+        if spill:
+            # A fresh file per resize; the previous one is removed once rehashed
+            path = self.spill_path.with_name(f"{self.spill_path.name}.{self._generation}")
+            self._generation += 1
+            fh = open(path, "w+b")
+            fh.truncate(size)
+            mm = mmap.mmap(fh.fileno(), size)
+            if old_mmap is None:
+                logging.info(f"Dedup table exceeds {self.memory_budget >> 20} MiB, spilling to {self.spill_path}")
+            self._table = memoryview(mm)
+            self._mmap, self._file = mm, fh
+        else:
+            self._table = memoryview(bytearray(size))
+            self._mmap, self._file = None, None
+
+        self._capacity = capacity
+        self._mask = capacity - 1
+        self._old = (old_mmap, old_file)
+
+    def _release_old(self) -> None:
+        old_mmap, old_file = self._old
+        self._old = (None, None)
+        if old_mmap is not None:
+            old_mmap.close()
+            old_file.close()
+            Path(old_file.name).unlink()
+
+    def _grow(self) -> None:
+        old_table, old_capacity = self._table, self._capacity
+        self._allocate(old_capacity * 2)
+        for i in range(old_capacity):
+            slot = bytes(old_table[i * DIGEST_SIZE:(i + 1) * DIGEST_SIZE])
+            if slot != _ZERO:
+                self._insert(slot)
+        old_table.release()
+        self._release_old()
+
+    # ------------------------------------------------------------------
+    # table operations
+    # ------------------------------------------------------------------
+    def _bloom_positions(self, d: bytes):
+        mask = self._bloom_mask
+        for j in range(0, DIGEST_SIZE, 4):
+            yield int.from_bytes(d[j:j + 4], "little") & mask
+
+    def _find(self, d: bytes) -> int:
+        """Slot holding `d`, or the empty slot where it would go, as -(slot + 1)."""
+        table = self._table
+        i = int.from_bytes(d[:8], "little") & self._mask
+        while True:
+            off = i * DIGEST_SIZE
+            slot = table[off:off + DIGEST_SIZE]
+            if slot == d:
+                return i
+            if slot == _ZERO:
+                return -(i + 1)
+            i = (i + 1) & self._mask
+
+    def _insert(self, d: bytes) -> None:
+        i = -self._find(d) - 1
+        self._table[i * DIGEST_SIZE:(i + 1) * DIGEST_SIZE] = d
+
+    def __contains__(self, digest: Digest) -> bool:
+        d = _raw(digest)
+        if d == _ZERO:
+            return self._has_zero
+        if self._bloom is not None:
+            bloom = self._bloom
+            for pos in self._bloom_positions(d):
+                if not bloom[pos >> 3] & (1 << (pos & 7)):
+                    return False
+        return self._find(d) >= 0
+
+    def add(self, digest: Digest) -> bool:
+        """Add a digest; returns False when it was already present."""
+        if self.readonly:
+            raise TypeError("DigestSet attached read-only")
+        d = _raw(digest)
+        if d == _ZERO:
+            added, self._has_zero = not self._has_zero, True
+            self._count += added
+            return added
+
+        i = self._find(d)
+        if i >= 0:
+            return False
+        i = -i - 1
+        self._table[i * DIGEST_SIZE:(i + 1) * DIGEST_SIZE] = d
+        self._count += 1
+        if self._bloom is not None:
+            bloom = self._bloom
+            for pos in self._bloom_positions(d):
+                bloom[pos >> 3] |= 1 << (pos & 7)
+        if self._count > self._capacity * MAX_LOAD:
+            self._grow()
+        return True
+
+    def update(self, digests: Iterable[Digest]) -> None:
+        for d in digests:
+            self.add(d)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __iter__(self) -> Iterator[bytes]:
+        if self._has_zero:
+            yield _ZERO
+        table = self._table
+        for i in range(self._capacity):
+            slot = bytes(table[i * DIGEST_SIZE:(i + 1) * DIGEST_SIZE])
+            if slot != _ZERO:
+                yield slot
+
+    @property
+    def nbytes(self) -> int:
+        bloom = len(self._bloom) if self._bloom is not None else 0
+        return self._capacity * DIGEST_SIZE + bloom
+
+    # ------------------------------------------------------------------
+    # sharing between processes
+    # ------------------------------------------------------------------
+    def share(self, path: Path) -> Path:
+        """Write a snapshot that other processes can `attach` to."""
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "wb") as fh:
+            fh.write(_HEADER.pack(_MAGIC, self._count, self._capacity, int(self._has_zero)))
+            fh.write(self._table)
+        tmp.replace(path)
+        return path
+
+    @classmethod
+    def attach(cls, path: Path) -> "DigestSet":
+        """Map a snapshot written by `share` read-only, without copying it."""
+        self = cls.__new__(cls)
+        self.memory_budget = self.spill_path = None
+        self.readonly = True
+        self._bloom = None
+        self._old = (None, None)
+        self._generation = 0
+        self._file = open(path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._count, self._capacity, has_zero = _HEADER.unpack_from(self._mmap)
+        if magic != _MAGIC:
+            raise ValueError(f"{path} is not a digest set snapshot")
+        self._has_zero = bool(has_zero)
+        self._mask = self._capacity - 1
+        self._table = memoryview(self._mmap)[_HEADER.size:]
+        return self
+
+    def close(self) -> None:
+        """Release the table; a spill file is deleted, a shared snapshot is kept."""
+        self._table.release()
+        if self._mmap is not None:
+            self._mmap.close()
+            self._file.close()
+            if not self.readonly:
+                Path(self._file.name).unlink()
+            self._mmap = self._file = None
@@ -1,45 +1,65 @@
 import gzip
 import logging
 import re
+from functools import lru_cache
 from pathlib import Path
-from Bio import SeqIO
-from .config import CATEGORY_TO_DOMAIN
+from typing import Optional
+from .classify import RepliconClassifier
+from ..utils.fasta import FastaRecord, read_fasta
 
 # Pre-compile regex for performance
 REGEX_NON_ACGT = re.compile(r"[^ACGT]")
 REGEX_SANITIZER = re.compile(r"[^A-Za-z0-9._-]+")
 
+# Byte tables for bytes.translate: delete everything except ACGT/acgt,
+# then upper-case what is left
+_NON_ACGT_BYTES = bytes(b for b in range(256) if b not in b"ACGTacgt")
+_UPPER_ACGT = bytes.maketrans(b"acgt", b"ACGT")
+
 def sanitize_id(s: str) -> str:
     """Make a string safe for use as a filename."""
     return REGEX_SANITIZER.sub("_", s or "")
 
 def get_replicon_type(description: str) -> str:
     """Classify a sequence (plasmid vs viral vs chromosomal) based on text."""
-    d = (description or "").lower()
-    if any(w in d for w in ["phage", "virus", "viral", "bacteriophage"]):
-        return "viral"
-    if "plasmid" in d:
-        return "plasmid"
-    if any(w in d for w in ["chromosome", "complete genome", "chromosomal"]):
-        return "chromosomal"
-    return "unknown"
+    return _default_classifier("").replicon_type(description)
 
 def get_class4(category: str, description: str) -> str:
     """Determine the final 4-class label."""
-    rtype = get_replicon_type(description)
-    if rtype in {'plasmid', 'viral'}:
-        return rtype
-    return CATEGORY_TO_DOMAIN.get(category.lower(), 'unknown')
+    return _default_classifier(category.lower()).class4(description)
+
+@lru_cache(maxsize=None)
+def _default_classifier(category: str) -> RepliconClassifier:
+    """Classifier with the default rules, one per category."""
+    return RepliconClassifier(category)
+
+def _iter_fasta_biopython(path: Path):
+    """Fallback reader going through Bio.SeqIO, converted to FastaRecords."""
+    from Bio import SeqIO
 
-def iter_fasta(path: Path):
-    """Generator that yields SeqRecords from normal or gzipped FASTA."""
     open_func = gzip.open if path.suffix == ".gz" else open
+    with open_func(path, "rt", encoding="utf-8", errors="ignore") as fh:
+        for rec in SeqIO.parse(fh, "fasta"):
+            yield FastaRecord(rec.id, rec.description, bytes(rec.seq))
+
+def iter_fasta(path: Path, engine: str = "native", stream_threshold: Optional[int] = None):
+    """
+    Generator that yields FastaRecords from normal or gzipped FASTA.
+    With the native engine, records longer than `stream_threshold` bytes
+    are yielded as StreamedFastaRecords.
+    """
     try:
-        with open_func(path, "rt", encoding="utf-8", errors="ignore") as fh:
-            yield from SeqIO.parse(fh, "fasta")
+        if engine == "biopython":
+            yield from _iter_fasta_biopython(path)
+        else:
+            yield from read_fasta(path, stream_threshold)
     except Exception as e:
         logging.error(f"Error reading {path.name}: {e}")
 
 def clean_sequence_string(seq_str: str) -> str:
     """Remove non-ACGT characters from a string."""
     return REGEX_NON_ACGT.sub("", seq_str.upper())
+
+def clean_sequence_bytes(seq: bytes) -> bytes:
+    """Upper-case and remove non-ACGT bytes in a single C-level pass."""
+    return seq.translate(_UPPER_ACGT, _NON_ACGT_BYTES)
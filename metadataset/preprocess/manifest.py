@@ -0,0 +1,225 @@
+import csv
+import json
+import logging
+import sqlite3
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+
+from .config import PipelineConfig
+from .seqstats import STATS_FIELDS
+
+# Same columns, in the same order, as <category>_manifest.csv
+MANIFEST_FIELDS = [
+    "split", "category", "class4", "replicon_type",
+    "host_assembly", "accession", "description", "path", "source_file"
+]
+INDEXED_FIELDS = ["split", "class4", "replicon_type", "host_assembly", "accession"]
+BATCH_SIZE = 1000
+
+# SQLite column types other than TEXT
+_COLUMN_TYPES = {"length": "INTEGER", "gc": "REAL", "ambiguous": "INTEGER"}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS host_replicons (
+    host_assembly TEXT,
+    accession TEXT,
+    kind TEXT,
+    label TEXT
+);
+"""
+
+
+def manifest_fields(config: PipelineConfig) -> List[str]:
+    """
+    Manifest columns of a run: MANIFEST_FIELDS, then STATS_FIELDS with
+    `record_stats`. Partial manifests of --shard runs always carry `length`.
+    """
+    fields = MANIFEST_FIELDS + STATS_FIELDS if config.record_stats else list(MANIFEST_FIELDS)
+    if config.shard_count > 1 and "length" not in fields:
+        fields.append("length")
+    return fields
+
+
+def manifest_db_path(meta_dir: Path, category: str) -> Path:
+    return meta_dir / f"{category}_manifest.sqlite"
+
+
+class ManifestStore:
+    """
+    SQLite copy of a category's manifest and host map, indexed on split,
+    class4, replicon_type, host_assembly and accession. Rows are buffered
+    and inserted in batches, one transaction per batch; indexes are built
+    once the table is complete.
+
+    Tables:
+    - records: one row per written record, the manifest CSV columns
+      (statistics columns as numbers)
+    - host_replicons: the host map flattened to (host_assembly, accession,
+      kind, label) with kind 'chromosome' or 'plasmid'
+    """
+
+    def __init__(self, path: Path, create: bool = False, batch_size: int = BATCH_SIZE,
+                 fields: Sequence[str] = MANIFEST_FIELDS):
+        """
+        :param create: start an empty database, replacing any existing file
+        :param fields: columns of a new database, see manifest_fields;
+                       an existing one keeps its own
+        """
+        if create and path.exists():
+            path.unlink()
+        elif not create and not path.exists():
+            raise FileNotFoundError(f"No manifest database at {path}")
+
+        self.path = path
+        self.batch_size = batch_size
+        self._pending: List[tuple] = []
+        self.conn = sqlite3.connect(str(path))
+        self.conn.row_factory = sqlite3.Row
+        if create:
+            # The file is rebuilt from scratch on failure, so skip the journal
+            self.conn.execute("PRAGMA journal_mode=OFF")
+            self.conn.execute("PRAGMA synchronous=OFF")
+            columns = ", ".join(f"{name} {_COLUMN_TYPES.get(name, 'TEXT')}" for name in fields)
+            self.conn.execute(f"CREATE TABLE records ({columns})")
+            self.conn.executescript(_SCHEMA)
+            self.fields = list(fields)
+        else:
+            self.fields = [row["name"] for row in self.conn.execute("PRAGMA table_info(records)")]
+
+    # ----- building -----
+
+    def writerow(self, row: Dict[str, str]) -> None:
+        """Queue one manifest row (csv.DictWriter compatible)."""
+        values = []
+        for name in self.fields:
+            value = row.get(name, "")
+            # Rows carried over from runs without statistics leave those columns NULL
+            values.append(None if value == "" and name in _COLUMN_TYPES else value)
+        self._pending.append(tuple(values))
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def writerows(self, rows: Iterable[Dict[str, str]]) -> None:
+        for row in rows:
+            self.writerow(row)
+
+    def flush(self) -> None:
+        if not self._pending:
+            return
+        placeholders = ", ".join("?" * len(self.fields))
+        with self.conn:
+            self.conn.executemany(f"INSERT INTO records VALUES ({placeholders})", self._pending)
+        self._pending.clear()
+
+    def write_host_map(self, host_map: Dict[str, dict]) -> None:
+        """Replace the host_replicons table with the contents of `host_map`."""
+        rows = []
+        for assembly, entry in host_map.items():
+            rows.extend((assembly, acc, "chromosome", None) for acc in entry["chromosome_accessions"])
+            rows.extend((assembly, acc, "plasmid", label) for acc, label in entry["plasmids"].items())
+        with self.conn:
+            self.conn.execute("DELETE FROM host_replicons")
+            self.conn.executemany("INSERT INTO host_replicons VALUES (?, ?, ?, ?)", rows)
+
+    def finish(self) -> None:
+        """Flush pending rows and build the indexes."""
+        self.flush()
+        with self.conn:
+            for name in INDEXED_FIELDS:
+                self.conn.execute(f"CREATE INDEX IF NOT EXISTS records_{name} ON records ({name})")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS host_replicons_host ON host_replicons (host_assembly)")
+        self.conn.execute("ANALYZE")
+
+    @classmethod
+    def from_files(cls, path: Path, manifest_csv: Path, host_map_json: Optional[Path] = None) -> "ManifestStore":
+        """Build a database from an existing manifest CSV and host map JSON."""
+        with open(manifest_csv, newline="") as fh:
+            reader = csv.DictReader(fh)
+            store = cls(path, create=True, fields=reader.fieldnames or MANIFEST_FIELDS)
+            store.writerows(reader)
+        if host_map_json is not None and host_map_json.exists():
+            store.write_host_map(json.loads(host_map_json.read_text()))
+        store.finish()
+        logging.info(f"Built {path} from {manifest_csv.name}")
+        return store
+
+    # ----- querying -----
+
+    def query(self,
+              split: Optional[str] = None,
+              class4: Optional[str] = None,
+              replicon_type: Optional[str] = None,
+              host_assembly: Optional[str] = None,
+              accession: Optional[str] = None,
+              host_split: Optional[str] = None,
+              limit: Optional[int] = None) -> Iterator[Dict[str, str]]:
+        """
+        Manifest rows matching every given filter, in insertion order.
+        :param host_split: only records whose host assembly has records in this
+                           split, e.g. split='val', class4='plasmid',
+                           host_split='train' for val plasmids of train hosts
+        """
+        where, params = [], []
+        for name, value in (("split", split), ("class4", class4), ("replicon_type", replicon_type),
+                            ("host_assembly", host_assembly), ("accession", accession)):
+            if value is not None:
+                where.append(f"{name} = ?")
+                params.append(value)
+        if host_split is not None:
+            where.append("host_assembly IN (SELECT host_assembly FROM records WHERE split = ?)")
+            params.append(host_split)
+
+        sql = f"SELECT {', '.join(self.fields)} FROM records"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY rowid"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        for row in self.conn.execute(sql, params):
+            yield dict(row)
+
+    def counts(self, by: Sequence[str] = ("split", "class4")) -> List[Dict[str, object]]:
+        """Number of records per combination of the `by` columns."""
+        unknown = set(by) - set(self.fields)
+        if unknown:
+            raise ValueError(f"Unknown manifest columns: {sorted(unknown)}")
+        cols = ", ".join(by)
+        sql = f"SELECT {cols}, COUNT(*) AS n FROM records GROUP BY {cols} ORDER BY {cols}"
+        return [dict(row) for row in self.conn.execute(sql)]
+
+    def host_replicons(self, host_assembly: str) -> Dict[str, object]:
+        """One host map entry: {'chromosome_accessions': [...], 'plasmids': {acc: label}}."""
+        entry = {"chromosome_accessions": [], "plasmids": {}}
+        rows = self.conn.execute(
+            "SELECT accession, kind, label FROM host_replicons WHERE host_assembly = ? ORDER BY rowid",
+            (host_assembly,))
+        for row in rows:
+            if row["kind"] == "plasmid":
+                entry["plasmids"][row["accession"]] = row["label"]
+            else:
+                entry["chromosome_accessions"].append(row["accession"])
+        return entry
+
+    def sql(self, statement: str, params: Sequence = ()) -> List[Dict[str, object]]:
+        """Run an arbitrary read-only statement."""
+        return [dict(row) for row in self.conn.execute(statement, params)]
+
+    def close(self) -> None:
+        self.flush()
+        self.conn.close()
+
+
+class TeeWriter:
+    """Hands each manifest row to several csv.DictWriter-like sinks."""
+
+    def __init__(self, *sinks):
+        self.sinks = sinks
+
+    def writerow(self, row: Dict[str, str]) -> None:
+        for sink in self.sinks:
+            sink.writerow(row)
+
+    def writerows(self, rows: Iterable[Dict[str, str]]) -> None:
+        for row in rows:
+            self.writerow(row)
@@ -0,0 +1,139 @@
+import csv
+import json
+import logging
+import shutil
+from collections import defaultdict
+from dataclasses import replace
+from pathlib import Path
+from typing import Dict, List
+
+from .core import SPLITS, BioProcessor
+from .digests import DIGEST_SIZE
+from .helpers import sanitize_id
+from .manifest import manifest_fields
+from .minhash import load_sketches
+from .seqstats import TetraTable
+from .shards import parse_shard_path
+from .sharding import load_shard_config, partial_dir
+
+
+def _record_sizes(rows: List[dict]) -> Dict[str, int]:
+    """Byte size of every '<shard>:<offset>' record, from the offsets that follow it."""
+    offsets = defaultdict(list)
+    for row in rows:
+        shard, offset = parse_shard_path(row["path"])
+        offsets[shard].append(offset)
+    sizes = {}
+    for shard, starts in offsets.items():
+        starts.sort()
+        ends = starts[1:] + [shard.stat().st_size]
+        for start, end in zip(starts, ends):
+            sizes[f"{shard}:{start}"] = end - start
+    return sizes
+
+
+def _discard(path: Path, out_dir: Path) -> None:
+    """Remove a record file a shard wrote but the merge drops, and directories this empties."""
+    path.unlink(missing_ok=True)
+    for parent in path.parents:
+        if parent == out_dir:
+            break
+        try:
+            parent.rmdir()
+        except OSError:
+            break
+
+
+def merge_shards(out_dir: Path, category: str, count: int, keep_partial: bool = False) -> BioProcessor:
+    """
+    Combine the partial outputs of `process --shard i/N` for i in 0..N-1
+    into what a single run would have written. Shards dedup exact copies
+    only among their own files and leave near-duplicates alone; here the
+    records every shard kept are replayed in the single run's order (by
+    split, then input file, then position in the file), so cross-shard MD5
+    and Mash duplicates resolve with the same precedence.
+    :param keep_partial: keep the shards' partial directories afterwards
+    """
+    dirs = [partial_dir(out_dir, category, i, count) for i in range(count)]
+    unfinished = [str(d) for d in dirs if not (d / f"{category}_metrics.json").exists()]
+    if unfinished:
+        raise FileNotFoundError(f"Shards missing or unfinished: {', '.join(unfinished)}")
+
+    configs = [load_shard_config(d, category) for d in dirs]
+    for cfg in configs[1:]:
+        if replace(cfg, shard_index=0) != replace(configs[0], shard_index=0):
+            raise ValueError(f"Shard {cfg.shard_index} ran with different settings from shard 0")
+    processor = BioProcessor(replace(configs[0], out_dir=out_dir, shard_index=0, shard_count=1))
+    stats = processor.stats
+
+    rows, tetra = [], {}
+    fields = manifest_fields(processor.cfg)
+    for d in dirs:
+        summary = json.loads((d / f"{category}_metrics.json").read_text())
+        for key, n in summary["counters"].items():
+            if key not in ("records_written", "bases_written"):
+                stats[key] += n
+        processor.metrics.add_times(summary["stage_seconds"])
+
+        with open(d / f"{category}_manifest.csv", newline="") as fh:
+            part = list(csv.DictReader(fh))
+        blob = (d / f"{category}_digests.bin").read_bytes()
+        sketches = {}
+        if processor.near_dups is not None:
+            names, _, shard_sketches, _, _ = load_sketches(d / f"{category}_sketches.npz")
+            sketches = dict(zip(names, shard_sketches))
+        if processor.tetra is not None:
+            tetra.update(TetraTable.load(d / f"{category}_tetra.npz").as_dict())
+        for i, row in enumerate(part):
+            rows.append((row, blob[i * DIGEST_SIZE:(i + 1) * DIGEST_SIZE], sketches.get(row["path"])))
+
+    # A single run's commit order; each file's records come from one shard, already in order
+    rows.sort(key=lambda r: (SPLITS.index(r[0]["split"]), r[0]["source_file"]))
+    logging.info(f"Merging {len(rows)} records from {count} shards of {category}")
+
+    processor.open_outputs()
+    sizes = _record_sizes([r for r, _, _ in rows]) if processor.shards is not None else {}
+    processor.begin_commit(len(rows))
+    with processor.committing():
+        for row, digest, sketch in rows:
+            split, accession = row["split"], row["accession"]
+            out_name = f"{Path(row['source_file']).stem}__{sanitize_id(accession)}"
+
+            if digest in processor.seen_md5_global:
+                stats["skipped_duplicate_md5"] += 1
+                keep = False
+            else:
+                processor.seen_md5_global.add(digest)
+                keep = sketch is None or not processor.reject_near_duplicate(
+                    split, out_name, accession, row["source_file"], sketch)
+
+            if keep:
+                processor.add_to_host_map(row["host_assembly"], row["replicon_type"],
+                                          accession, row["description"])
+                path = row["path"]
+                if processor.shards is not None:
+                    with processor.metrics.stage("write"):
+                        shard, offset = parse_shard_path(path)
+                        path = processor.shards.copy_record(split, row["class4"], out_name, shard, offset,
+                                                            sizes[path], int(row["length"]))
+                stats["records_written"] += 1
+                stats["bases_written"] += int(row["length"])
+                if sketch is not None:
+                    processor.near_dups.add(path, split, sketch)
+                if processor.assembly_stats is not None:
+                    processor.assembly_stats.add(row)
+                if processor.tetra is not None:
+                    processor.tetra.add(path, tetra[row["path"]])
+                processor.manifest_writer.writerow({**{k: row[k] for k in fields}, "path": path})
+            elif processor.shards is None:
+                _discard(Path(row["path"]), out_dir)
+            processor.metrics.advance()
+
+    if not keep_partial:
+        for d in dirs:
+            shutil.rmtree(d)
+        try:
+            dirs[0].parent.rmdir()
+        except OSError:
+            pass
+    return processor
@@ -0,0 +1,205 @@
+"""
+In-process MinHash sketching and Mash distances.
+
+Sketches follow Mash: canonical k-mers, a bottom-s sketch of 64-bit
+hashes, and the Mash distance -ln(2j / (1 + j)) / k on the Jaccard
+estimate. K-mers are 2-bit packed and hashed with the MurmurHash3
+finaliser, all in NumPy, so no external binary is needed.
+
+Alongside the bottom-s hashes, a fixed-length one-permutation MinHash
+signature (minimum hash per bin) is kept for LSH banding, see lsh.py.
+"""
+import math
+from pathlib import Path
+from typing import List, Tuple
+
+import numpy as np
+
+DEFAULT_KMER = 21
+DEFAULT_SKETCH_SIZE = 1000
+DEFAULT_SEED = 42
+DEFAULT_BINS = 128
+CHUNK_BASES = 1 << 22
+EMPTY_BIN = np.iinfo(np.uint64).max
+
+# A/C/G/T (any case) -> 0..3, everything else -> 4 (k-mer is skipped)
+_CODES = np.full(256, 4, dtype=np.uint8)
+for _i, _b in enumerate(b"ACGT"):
+    _CODES[_b] = _i
+    _CODES[_b + 32] = _i
+
+_EMPTY = np.empty(0, dtype=np.uint64)
+
+
+def _fmix64(h: np.ndarray) -> np.ndarray:
+    """MurmurHash3 64-bit finaliser, applied element-wise (wraps mod 2**64)."""
+    h ^= h >> np.uint64(33)
+    h *= np.uint64(0xFF51AFD7ED558CCD)
+    h ^= h >> np.uint64(33)
+    h *= np.uint64(0xC4CEB9FE1A85EC53)
+    h ^= h >> np.uint64(33)
+    return h
+
+
+def _pack_kmers(codes: np.ndarray, k: int, n: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    2-bit packed forward and reverse-complement values of the n k-mers,
+    built by binary lifting: L-mers are doubled into 2L-mers and the
+    blocks of k's binary expansion concatenated, so only O(log k) passes
+    over the sequence are needed.
+    """
+    block_f, block_r, width = codes, np.uint64(3) - codes, 1
+    fwd = rev = None
+    length, remaining = 0, k
+    while True:
+        if remaining & 1:
+            bf = block_f[length:length + n]
+            br = block_r[length:length + n]
+            if fwd is None:
+                fwd, rev = bf.copy(), br.copy()
+            else:
+                fwd = (fwd << np.uint64(2 * width)) | bf
+                rev = (br << np.uint64(2 * length)) | rev
+            length += width
+        remaining >>= 1
+        if not remaining:
+            return fwd, rev
+        m = len(block_f) - width
+        block_f = (block_f[:m] << np.uint64(2 * width)) | block_f[width:width + m]
+        block_r = (block_r[width:width + m] << np.uint64(2 * width)) | block_r[:m]
+        width *= 2
+
+
+def kmer_hashes(seq: bytes, k: int = DEFAULT_KMER, seed: int = DEFAULT_SEED) -> np.ndarray:
+    """Hashes of every canonical k-mer of `seq` (k <= 32) without ambiguous bases."""
+    codes = _CODES[np.frombuffer(seq, dtype=np.uint8)]
+    n = len(codes) - k + 1
+    if n <= 0:
+        return _EMPTY
+
+    fwd, rev = _pack_kmers(codes.astype(np.uint64), k, n)
+    canonical = np.minimum(fwd, rev)
+
+    bad = codes == 4
+    if bad.any():
+        window = np.convolve(bad, np.ones(k, dtype=np.int64), mode="valid")
+        canonical = canonical[window == 0]
+
+    with np.errstate(over="ignore"):
+        return _fmix64(canonical ^ np.uint64(seed))
+
+
+class Sketch:
+    """Bottom-s hashes used for distances plus the per-bin signature used for LSH."""
+    __slots__ = ("hashes", "signature")
+
+    def __init__(self, hashes: np.ndarray, signature: np.ndarray):
+        self.hashes = hashes
+        self.signature = signature
+
+    def __len__(self) -> int:
+        return len(self.hashes)
+
+
+class SketchBuilder:
+    """
+    Sketch accumulated over consecutive chunks of one sequence, so
+    arbitrarily long records are sketched with bounded memory.
+    """
+
+    def __init__(self, k: int = DEFAULT_KMER, size: int = DEFAULT_SKETCH_SIZE,
+                 seed: int = DEFAULT_SEED, bins: int = DEFAULT_BINS):
+        self.k = k
+        self.size = size
+        self.seed = seed
+        self._carry = b""
+        self._mins = _EMPTY
+        self._signature = np.full(bins, EMPTY_BIN, dtype=np.uint64)
+
+    def update(self, seq: bytes) -> "SketchBuilder":
+        bins = np.uint64(len(self._signature))
+        for start in range(0, len(seq), CHUNK_BASES):
+            chunk = self._carry + bytes(seq[start:start + CHUNK_BASES])
+            hashes = kmer_hashes(chunk, self.k, self.seed)
+            self._carry = chunk[-(self.k - 1):] if self.k > 1 else b""
+            if not len(hashes):
+                continue
+
+            np.minimum.at(self._signature, (hashes % bins).astype(np.intp), hashes)
+            if len(hashes) > self.size:
+                hashes = np.partition(hashes, self.size - 1)[:self.size]
+            self._mins = np.unique(np.concatenate([self._mins, hashes]))[:self.size]
+        return self
+
+    def finish(self) -> Sketch:
+        return Sketch(self._mins, self._signature)
+
+
+class MinHashSketcher:
+    """Sketching parameters shared by every record of a run."""
+
+    def __init__(self, k: int = DEFAULT_KMER, size: int = DEFAULT_SKETCH_SIZE,
+                 seed: int = DEFAULT_SEED, bins: int = DEFAULT_BINS):
+        if not 1 <= k <= 32:
+            raise ValueError(f"k-mer size must be between 1 and 32, got {k}")
+        self.k = k
+        self.size = size
+        self.seed = seed
+        self.bins = bins
+
+    def builder(self) -> SketchBuilder:
+        return SketchBuilder(self.k, self.size, self.seed, self.bins)
+
+    def sketch(self, seq: bytes) -> Sketch:
+        return self.builder().update(seq).finish()
+
+
+def mash_distance_from_jaccard(j: float, k: int) -> float:
+    if j <= 0:
+        return 1.0
+    return min(1.0, -math.log(2 * j / (1 + j)) / k)
+
+
+def mash_distance(a: np.ndarray, b: np.ndarray, k: int = DEFAULT_KMER,
+                  size: int = DEFAULT_SKETCH_SIZE) -> float:
+    """Mash distance between two sketches, estimated on their union's bottom-s."""
+    union = np.union1d(a, b)[:size]
+    if not len(union):
+        return 1.0
+    common = np.intersect1d(a, b, assume_unique=True)
+    shared = np.count_nonzero(common <= union[-1])
+    return mash_distance_from_jaccard(shared / len(union), k)
+
+
+def jaccard_for_distance(distance: float, k: int) -> float:
+    """Smallest Jaccard estimate whose Mash distance is <= `distance`."""
+    x = math.exp(-distance * k)
+    return x / (2 - x)
+
+
+def save_sketches(path: Path, names: List[str], groups: List[str],
+                  sketches: List[Sketch], k: int, size: int) -> None:
+    """Store sketches as one flat hash array plus offsets in a compressed .npz."""
+    lengths = np.array([len(s) for s in sketches], dtype=np.int64)
+    bins = len(sketches[0].signature) if sketches else 0
+    np.savez_compressed(
+        path,
+        names=np.array(names, dtype=str),
+        groups=np.array(groups, dtype=str),
+        offsets=np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64),
+        hashes=np.concatenate([s.hashes for s in sketches]) if sketches else _EMPTY,
+        signatures=(np.stack([s.signature for s in sketches]) if sketches
+                    else np.empty((0, bins), dtype=np.uint64)),
+        params=np.array([k, size], dtype=np.int64),
+    )
+
+
+def load_sketches(path: Path) -> Tuple[List[str], List[str], List[Sketch], int, int]:
+    with np.load(path) as data:
+        offsets, hashes, signatures = data["offsets"], data["hashes"], data["signatures"]
+        sketches = [Sketch(hashes[offsets[i]:offsets[i + 1]], signatures[i])
+                    for i in range(len(offsets) - 1)]
+        k, size = (int(x) for x in data["params"])
+        names = [str(n) for n in data["names"]]
+        groups = [str(g) for g in data["groups"]]
+        return names, groups, sketches, k, size
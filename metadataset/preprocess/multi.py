@@ -0,0 +1,173 @@
+import csv
+import json
+import logging
+import shutil
+from concurrent.futures import Executor
+from contextlib import ExitStack, nullcontext
+from dataclasses import replace
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from .config import PipelineConfig
+from .core import (
+    MANIFEST_BUFFER, SPLITS, BioProcessor, analysis_pool, new_digest_set, new_record_writer, partial_path,
+    resume_incremental,
+)
+from .manifest import ManifestStore, TeeWriter, manifest_db_path, manifest_fields
+from .shards import ShardWriter
+
+# Name of the cross-category manifest, host map and dedup table in <out_dir>/metadata
+COMBINED = "combined"
+
+# (processor, its inputs of one split), in commit order
+Segment = Tuple[BioProcessor, List[Tuple[str, Path]]]
+
+
+class MultiProcessor:
+    """
+    Several categories processed as one run into the same output directory.
+    The categories share one MD5 table, so a sequence already kept for one
+    category is dropped from the others, one analysis worker pool and one
+    shard writer. Files are committed split by split, every category's
+    train files before any val file, so the earlier split always keeps a
+    sequence shared across categories. Near-duplicate detection stays
+    within each category.
+
+    Each category gets its usual manifest, host map and metadata; the
+    rows of all of them also go to combined_manifest.csv (and
+    combined_manifest.sqlite with `manifest_db`) plus combined_host_map.json
+    (and combined_assembly_stats.json with `record_stats`).
+    """
+
+    def __init__(self, config: PipelineConfig, categories: List[str]):
+        """
+        :param config: settings for every category, its `category` is ignored
+        """
+        self.cfg = config
+        self.meta_dir = config.out_dir / "metadata"
+        self.meta_dir.mkdir(parents=True, exist_ok=True)
+        self.seen = new_digest_set(config, self.meta_dir, COMBINED)
+        self.processors = [BioProcessor(replace(config, category=cat), seen=self.seen) for cat in categories]
+
+    def open_outputs(self) -> None:
+        """One shard or record file writer for all categories; clears leftover spool files."""
+        shards = writer = None
+        if self.cfg.output_format == "shards":
+            if self.cfg.output_compression != "none":
+                raise ValueError("Shards are written uncompressed, output_compression needs 'files' output")
+            shards = ShardWriter(self.cfg.out_dir, self.cfg.shard_size_mb << 20, append=self.cfg.incremental)
+        else:
+            writer = new_record_writer(self.cfg)
+        for processor in self.processors:
+            processor.shards = shards
+            processor.writer = writer
+        shutil.rmtree(self.processors[0].spool_dir, ignore_errors=True)
+
+    def schedule(self, inputs: List[List[Tuple[str, Path]]]) -> List[Segment]:
+        """
+        Order the (split, file) inputs of each processor for commit: split
+        by split, categories in the order given within a split.
+        """
+        segments = []
+        for split in SPLITS:
+            for processor, proc_inputs in zip(self.processors, inputs):
+                segment = [(s, f) for s, f in proc_inputs if s == split]
+                if segment:
+                    segments.append((processor, segment))
+        return segments
+
+    def run(self) -> None:
+        self.open_outputs()
+
+        inputs = [processor.list_inputs() for processor in self.processors]
+        kept_rows = {}
+        if self.cfg.incremental:
+            resumed = resume_incremental(self.processors, inputs)
+            inputs = [proc_inputs for proc_inputs, _ in resumed]
+            kept_rows = {p.cfg.category: rows for p, (_, rows) in zip(self.processors, resumed)}
+
+        self.commit_all(self.schedule(inputs),
+                        lambda processor, segment, pool: processor.iter_analyzed(segment, pool),
+                        kept_rows)
+
+    def commit_all(self, segments: List[Segment],
+                   analyze: Callable[[BioProcessor, List[Tuple[str, Path]], Optional[Executor]], Iterable[tuple]],
+                   kept_rows: Optional[Dict[str, List[dict]]] = None) -> None:
+        """
+        Analyse and commit the segments in order, then write every
+        category's metadata and the combined manifest and host map.
+        :param analyze: (processor, segment, pool) -> that processor's
+                        iter_analyzed output for the segment; pool is the
+                        shared analysis pool, None with a single job
+        :param kept_rows: manifest rows carried over from earlier runs, per category
+        """
+        kept_rows = kept_rows or {}
+        totals = {}
+        for processor, segment in segments:
+            totals[processor.cfg.category] = totals.get(processor.cfg.category, 0) + len(segment)
+
+        store = None
+        if self.cfg.manifest_db:
+            store = ManifestStore(partial_path(manifest_db_path(self.meta_dir, COMBINED)), create=True,
+                                  fields=manifest_fields(self.cfg))
+
+        # Like the categories' manifests, moved into place once the record files are complete
+        manifest_path = self.meta_dir / f"{COMBINED}_manifest.csv"
+        with open(partial_path(manifest_path), "w", newline="", buffering=MANIFEST_BUFFER) as mf:
+            combined = csv.DictWriter(mf, fieldnames=manifest_fields(self.cfg), extrasaction="ignore")
+            combined.writeheader()
+            if store is not None:
+                combined = TeeWriter(combined, store)
+
+            begun = []
+            try:
+                # Every processor's outputs are closed, even if closing another one raises
+                with ExitStack() as outputs:
+                    for processor in self.processors:
+                        outputs.callback(processor.close_outputs)
+                    for processor in self.processors:
+                        cat = processor.cfg.category
+                        processor.begin_commit(totals.get(cat, 0), kept_rows.get(cat, ()), sinks=(combined,))
+                        begun.append(processor)
+
+                    pool_ctx = nullcontext()
+                    if self.cfg.jobs > 1:
+                        snapshot = self.meta_dir / f"{COMBINED}_md5_snapshot.bin"
+                        pool_ctx = analysis_pool(self.cfg, self.seen, snapshot)
+                    with pool_ctx as pool:
+                        for processor, segment in segments:
+                            for item in analyze(processor, segment, pool):
+                                processor.commit_analyzed(*item)
+            except BaseException:
+                for processor in begun:
+                    processor.abort_commit()
+                mf.close()
+                partial_path(manifest_path).unlink()
+                if store is not None:
+                    store.close()
+                    store.path.unlink()
+                raise
+        partial_path(manifest_path).replace(manifest_path)
+
+        host_map, assembly_stats = {}, {}
+        for processor in self.processors:
+            processor.finish_commit()
+            host_map.update(processor.host_map)
+            if processor.assembly_stats is not None:
+                assembly_stats.update(processor.assembly_stats.summary())
+        self.seen.close()
+
+        with open(self.meta_dir / f"{COMBINED}_host_map.json", "w") as jf:
+            json.dump(host_map, jf, indent=2)
+        if self.cfg.record_stats:
+            with open(self.meta_dir / f"{COMBINED}_assembly_stats.json", "w") as jf:
+                json.dump(assembly_stats, jf, indent=2)
+        if store is not None:
+            store.write_host_map(host_map)
+            store.finish()
+            store.close()
+            store.path.replace(manifest_db_path(self.meta_dir, COMBINED))
+
+        written = sum(p.stats["records_written"] for p in self.processors)
+        cross = {p.cfg.category: p.stats["skipped_duplicate_md5"] for p in self.processors}
+        logging.info(f"All categories complete: {written} records written; MD5 duplicates dropped per category: {cross}")
@@ -0,0 +1,145 @@
+"""
+Per-record sequence statistics, gathered while records are cleaned so
+that no second pass over the output is needed: cleaned length, GC
+fraction, number of ambiguous bases removed and, optionally, the
+tetranucleotide frequencies. Counting is done on the raw bytes with
+NumPy. Per-assembly aggregates (total length, GC, N50, ...) are built
+from the manifest columns.
+"""
+import json
+from collections import defaultdict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+STATS_FIELDS = ["length", "gc", "ambiguous"]
+TETRA_SIZE = 256  # 4-mers in ACGT order, AAAA first, TTTT last
+
+_G, _C = ord("G"), ord("C")
+
+# Cleaned sequences hold only A/C/G/T
+_CODES = np.zeros(256, dtype=np.uint8)
+for _i, _b in enumerate(b"ACGT"):
+    _CODES[_b] = _i
+
+
+@dataclass
+class RecordStats:
+    length: int
+    gc: int  # G + C bases
+    ambiguous: int  # bases removed by cleaning
+    tetra: Optional[np.ndarray] = None  # float32 frequencies, see TETRA_SIZE
+
+    def columns(self) -> Dict[str, object]:
+        """The STATS_FIELDS manifest values."""
+        return {"length": self.length, "gc": f"{self.gc / self.length:.6f}", "ambiguous": self.ambiguous}
+
+
+class StatsBuilder:
+    """Statistics accumulated over consecutive cleaned chunks of one record."""
+
+    def __init__(self, tetra: bool = False):
+        self.length = self.gc = self.ambiguous = 0
+        self._tetra = np.zeros(TETRA_SIZE, dtype=np.int64) if tetra else None
+        self._carry = np.empty(0, dtype=np.uint8)
+
+    def update(self, cleaned: bytes, raw_len: int) -> "StatsBuilder":
+        """Add a cleaned chunk that came from `raw_len` raw bases."""
+        seq = np.frombuffer(cleaned, dtype=np.uint8)
+        counts = np.bincount(seq, minlength=256)
+        self.length += len(seq)
+        self.gc += int(counts[_G] + counts[_C])
+        self.ambiguous += raw_len - len(seq)
+
+        if self._tetra is not None:
+            codes = np.concatenate([self._carry, _CODES[seq]])
+            if len(codes) >= 4:
+                # A 4-mer in 2-bit codes fits a uint8
+                kmers = (codes[:-3] << 6) | (codes[1:-2] << 4) | (codes[2:-1] << 2) | codes[3:]
+                self._tetra += np.bincount(kmers, minlength=TETRA_SIZE)
+            self._carry = codes[-3:]
+        return self
+
+    def finish(self) -> RecordStats:
+        tetra = None
+        if self._tetra is not None:
+            total = self._tetra.sum()
+            tetra = (self._tetra / total if total else self._tetra).astype(np.float32)
+        return RecordStats(self.length, self.gc, self.ambiguous, tetra)
+
+
+def n50(lengths: Iterable[int]) -> int:
+    """Smallest length L such that records of length >= L hold half the bases."""
+    lengths = sorted(lengths, reverse=True)
+    half, total = sum(lengths) / 2, 0
+    for length in lengths:
+        total += length
+        if total >= half:
+            return length
+    return 0
+
+
+class AssemblyStats:
+    """Per-assembly aggregates of the STATS_FIELDS columns of manifest rows."""
+
+    def __init__(self):
+        self._records: Dict[str, List[Tuple[int, float, int]]] = defaultdict(list)
+
+    def add(self, row: Dict[str, str]) -> None:
+        """Count a manifest row; rows of runs without statistics are ignored."""
+        if row.get("length") in (None, ""):
+            return
+        self._records[row["host_assembly"]].append(
+            (int(row["length"]), float(row["gc"]), int(row["ambiguous"])))
+
+    def summary(self) -> Dict[str, dict]:
+        out = {}
+        for assembly, records in self._records.items():
+            lengths = [length for length, _, _ in records]
+            total = sum(lengths)
+            out[assembly] = {
+                "records": len(records),
+                "length": total,
+                "gc": round(sum(length * gc for length, gc, _ in records) / total, 6) if total else 0.0,
+                "ambiguous": sum(amb for _, _, amb in records),
+                "largest": max(lengths),
+                "n50": n50(lengths),
+            }
+        return out
+
+    def write(self, path: Path) -> None:
+        with open(path, "w") as fh:
+            json.dump(self.summary(), fh, indent=2)
+
+
+class TetraTable:
+    """Tetranucleotide frequencies of written records, by manifest path."""
+
+    def __init__(self):
+        self.names: List[str] = []
+        self.freqs: List[np.ndarray] = []
+
+    def add(self, name: str, freqs: np.ndarray) -> None:
+        self.names.append(name)
+        self.freqs.append(freqs)
+
+    def save(self, path: Path) -> None:
+        """<category>_tetra.npz: 'names' (manifest paths) and 'freqs', one row of TETRA_SIZE per name."""
+        np.savez_compressed(
+            path,
+            names=np.array(self.names, dtype=str),
+            freqs=np.stack(self.freqs) if self.freqs else np.empty((0, TETRA_SIZE), dtype=np.float32),
+        )
+
+    @classmethod
+    def load(cls, path: Path) -> "TetraTable":
+        table = cls()
+        with np.load(path) as data:
+            table.names = [str(n) for n in data["names"]]
+            table.freqs = list(data["freqs"])
+        return table
+
+    def as_dict(self) -> Dict[str, np.ndarray]:
+        return dict(zip(self.names, self.freqs))
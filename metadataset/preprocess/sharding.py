@@ -0,0 +1,64 @@
+import heapq
+import json
+import logging
+from dataclasses import asdict
+from pathlib import Path
+from typing import List, Tuple
+
+from .config import PipelineConfig
+
+
+def parse_shard_spec(spec: str) -> Tuple[int, int]:
+    """'i/N' -> (i, N), shards numbered from 0."""
+    try:
+        index, count = (int(x) for x in spec.split("/"))
+    except ValueError:
+        raise ValueError(f"Shard must be given as i/N, not '{spec}'")
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Shard index must be in 0..{count - 1}, not {index}")
+    return index, count
+
+
+def assign_shards(inputs: List[Tuple[str, Path]], count: int) -> List[int]:
+    """
+    Shard number of every input file, balancing total bytes per shard:
+    largest files first, each to the shard with the fewest bytes so far
+    (ties to the lower shard). Depends only on the file list and sizes, so
+    every node computes the same assignment.
+    """
+    sizes = [f.stat().st_size for _, f in inputs]
+    order = sorted(range(len(inputs)), key=lambda j: (-sizes[j], str(inputs[j][1])))
+    loads = [(0, i) for i in range(count)]
+    assignment = [0] * len(inputs)
+    for j in order:
+        load, shard = heapq.heappop(loads)
+        assignment[j] = shard
+        heapq.heappush(loads, (load + sizes[j], shard))
+    return assignment
+
+
+def select_shard(inputs: List[Tuple[str, Path]], index: int, count: int) -> List[Tuple[str, Path]]:
+    """The inputs of shard `index` of `count`, in their original order."""
+    assignment = assign_shards(inputs, count)
+    chosen = [item for item, shard in zip(inputs, assignment) if shard == index]
+    nbytes = sum(f.stat().st_size for _, f in chosen)
+    logging.info(f"Shard {index}/{count}: {len(chosen)} of {len(inputs)} files, {nbytes / (1 << 20):.1f} MiB")
+    return chosen
+
+
+def partial_dir(out_dir: Path, category: str, index: int, count: int) -> Path:
+    """Where shard `index` of `count` keeps its partial metadata (and shard files)."""
+    return out_dir / "metadata" / "partial" / f"{category}_{index}of{count}"
+
+
+def save_shard_config(meta_dir: Path, config: PipelineConfig) -> None:
+    data = {k: str(v) if isinstance(v, Path) else v for k, v in asdict(config).items()}
+    (meta_dir / f"{config.category}_config.json").write_text(json.dumps(data, indent=2))
+
+
+def load_shard_config(meta_dir: Path, category: str) -> PipelineConfig:
+    data = json.loads((meta_dir / f"{category}_config.json").read_text())
+    for name in ("base_dir", "out_dir", "profile"):
+        if data.get(name) is not None:
+            data[name] = Path(data[name])
+    return PipelineConfig(**data)
@@ -0,0 +1,137 @@
+import logging
+import shutil
+from pathlib import Path
+from typing import BinaryIO, Dict, Tuple
+
+from ..utils.fasta import LINE_WIDTH, FastaRecord, format_fasta, format_fasta_header, parse_fasta_stream
+
+SHARD_PATTERN = "shard_{:05d}.fna"
+
+
+def parse_shard_path(path_spec: str) -> Tuple[Path, int]:
+    """Split a manifest path of the form '<shard>:<offset>'."""
+    shard, offset = path_spec.rsplit(":", 1)
+    return Path(shard), int(offset)
+
+
+def read_shard_record(path_spec: str) -> FastaRecord:
+    """Seek straight to one record of a shard and parse it."""
+    shard, offset = parse_shard_path(path_spec)
+    with open(shard, "rb") as fh:
+        fh.seek(offset)
+        return next(parse_fasta_stream(fh, read_size=1 << 20))
+
+
+class _Shard:
+    def __init__(self, path: Path):
+        self.path = path
+        self.handle: BinaryIO = open(path, "wb")
+        self.index = open(path.with_name(path.name + ".fai"), "w")
+        self.size = 0
+
+    def close(self) -> None:
+        self.handle.close()
+        self.index.close()
+
+
+class ShardWriter:
+    """
+    Appends records to size-bounded multi-FASTA shards, one series per
+    <split>/<class4> directory, each shard with a samtools-style .fai index.
+    """
+
+    def __init__(self, out_dir: Path, max_bytes: int, append: bool = False):
+        """
+        :param append: keep existing shards and number new ones after them,
+                       instead of replacing them (incremental runs)
+        """
+        self.out_dir = out_dir
+        self.max_bytes = max_bytes
+        self.append = append
+        self._open: Dict[Tuple[str, str], _Shard] = {}
+        self._counts: Dict[Tuple[str, str], int] = {}
+
+    def _next_shard(self, split: str, cls: str) -> _Shard:
+        key = (split, cls)
+        n = self._counts.get(key)
+        if n is None:
+            cls_dir = self.out_dir / split / cls
+            cls_dir.mkdir(parents=True, exist_ok=True)
+            existing = sorted(cls_dir.glob("shard_*.fna"))
+            if self.append:
+                n = int(existing[-1].stem.split("_")[1]) + 1 if existing else 0
+            else:
+                n = 0
+                # Drop shards left over from an earlier run
+                for stale in cls_dir.glob("shard_*.fna*"):
+                    stale.unlink()
+        self._counts[key] = n + 1
+
+        shard = _Shard(self.out_dir / split / cls / SHARD_PATTERN.format(n))
+        logging.debug(f"Opened shard {shard.path}")
+        return shard
+
+    def _shard_for(self, split: str, cls: str, size: int) -> _Shard:
+        key = (split, cls)
+        shard = self._open.get(key)
+        if shard is None or (shard.size and shard.size + size > self.max_bytes):
+            if shard is not None:
+                shard.close()
+            shard = self._open[key] = self._next_shard(split, cls)
+        return shard
+
+    def _index(self, shard: _Shard, name: str, seq_len: int, header_len: int, size: int) -> str:
+        offset = shard.size
+        shard.index.write(f"{name}\t{seq_len}\t{offset + header_len}\t{LINE_WIDTH}\t{LINE_WIDTH + 1}\n")
+        shard.size += size
+        return f"{shard.path}:{offset}"
+
+    def write(self, split: str, cls: str, name: str, rec_id: str,
+              description: str, seq: bytes) -> str:
+        """
+        Append one record and return its manifest path, '<shard>:<offset>'
+        where offset points at the record's '>' line.
+        :param name: unique record name used in the .fai index
+        """
+        data = format_fasta(rec_id, description, seq)
+        shard = self._shard_for(split, cls, len(data))
+        shard.handle.write(data)
+        return self._index(shard, name, len(seq), data.index(b"\n") + 1, len(data))
+
+    def write_file(self, split: str, cls: str, name: str, rec_id: str,
+                   description: str, path: Path, seq_len: int) -> str:
+        """
+        Like write, for a record already formatted into the file at `path`
+        (a streamed record); the file is copied in and left in place.
+        :param seq_len: length of the record's sequence
+        """
+        size = path.stat().st_size
+        shard = self._shard_for(split, cls, size)
+        with open(path, "rb") as src:
+            shutil.copyfileobj(src, shard.handle, 1 << 22)
+        return self._index(shard, name, seq_len, len(format_fasta_header(rec_id, description)), size)
+
+    def copy_record(self, split: str, cls: str, name: str, src: Path,
+                    offset: int, size: int, seq_len: int) -> str:
+        """
+        Like write, for a record already in another shard file: the `size`
+        bytes at `offset` of `src`, header line included, are copied as is.
+        """
+        shard = self._shard_for(split, cls, size)
+        with open(src, "rb") as fh:
+            fh.seek(offset)
+            header_len = len(fh.readline())
+            fh.seek(offset)
+            remaining = size
+            while remaining:
+                chunk = fh.read(min(remaining, 1 << 22))
+                if not chunk:
+                    raise EOFError(f"{src} ends before {offset + size}")
+                shard.handle.write(chunk)
+                remaining -= len(chunk)
+        return self._index(shard, name, seq_len, header_len, size)
+
+    def close(self) -> None:
+        for shard in self._open.values():
+            shard.close()
+        self._open.clear()
@@ -0,0 +1,151 @@
+import hashlib
+import json
+import logging
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Set, Tuple
+
+from .digests import DIGEST_SIZE
+
+
+def file_md5(path: Path) -> str:
+    h = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _slice(blob: bytes, offset: int, count: int) -> bytes:
+    return blob[offset * DIGEST_SIZE:(offset + count) * DIGEST_SIZE]
+
+
+def _split(blob: bytes) -> Iterator[bytes]:
+    for i in range(0, len(blob), DIGEST_SIZE):
+        yield blob[i:i + DIGEST_SIZE]
+
+
+class StateStore:
+    """
+    What earlier incremental runs processed, kept in
+    out_dir/metadata/<category>_state/:
+
+    - files.json: per source file its split, size, mtime and content md5
+    - digests.bin: the sequence digests each file added to the dedup set,
+      as raw 16-byte MD5s, located through files.json offsets
+    - deferred.bin: likewise, the digests of the duplicates each file
+      dropped; files.json also lists the near-duplicate representatives
+      ("deferred_to") its dropped records were clustered with
+
+    What a file deferred to tells which unchanged files must be processed
+    again when that output is retracted. Emitted records are not
+    duplicated here; the manifest already lists them with their source_file.
+    """
+
+    def __init__(self, meta_dir: Path, category: str):
+        self.dir = meta_dir / f"{category}_state"
+        self.files: Dict[str, dict] = {}
+        self.digests: Dict[str, bytes] = {}
+        self.deferred: Dict[str, bytes] = {}
+
+        files_path = self.dir / "files.json"
+        if files_path.exists():
+            self.files = json.loads(files_path.read_text())
+            blob = (self.dir / "digests.bin").read_bytes()
+            deferred_path = self.dir / "deferred.bin"
+            deferred = deferred_path.read_bytes() if deferred_path.exists() else b""
+            for source, entry in self.files.items():
+                self.digests[source] = _slice(blob, entry.pop("digest_offset"), entry.pop("digest_count"))
+                self.deferred[source] = _slice(deferred, entry.pop("deferred_offset", 0),
+                                               entry.pop("deferred_count", 0))
+                entry.setdefault("deferred_to", [])
+            logging.info(f"Loaded state for {len(self.files)} source files from {self.dir}")
+
+    def __len__(self) -> int:
+        return len(self.files)
+
+    def diff(self, inputs: List[Tuple[str, Path]]) -> Tuple[List[Tuple[str, Path]], Set[str]]:
+        """
+        Split `inputs` against the stored state.
+        :return: (inputs that are new or changed, sources whose earlier output is stale)
+        """
+        todo, stale = [], set()
+        current = set()
+        for split, fpath in inputs:
+            source = str(fpath)
+            current.add(source)
+            entry = self.files.get(source)
+            if entry is None or entry["split"] != split:
+                if entry is not None:
+                    stale.add(source)
+                todo.append((split, fpath))
+                continue
+
+            stat = fpath.stat()
+            if entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+                continue
+            # Touched but possibly unchanged: let the content decide
+            if entry["size"] == stat.st_size and entry["md5"] == file_md5(fpath):
+                entry["mtime_ns"] = stat.st_mtime_ns
+                continue
+            stale.add(source)
+            todo.append((split, fpath))
+
+        stale.update(source for source in self.files if source not in current)
+        return todo, stale
+
+    def forget(self, source: str) -> None:
+        self.files.pop(source, None)
+        self.digests.pop(source, None)
+        self.deferred.pop(source, None)
+
+    def record(self, split: str, fpath: Path, digests: List[bytes],
+               deferred: List[bytes] = (), deferred_to: Iterable[str] = ()) -> None:
+        """
+        Remember a processed file, the digests it added to the dedup set and
+        what its dropped records deferred to: the digests of its MD5
+        duplicates and the paths of the near-duplicate representatives.
+        """
+        stat = fpath.stat()
+        source = str(fpath)
+        self.files[source] = {
+            "split": split, "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns, "md5": file_md5(fpath),
+            "deferred_to": sorted(set(deferred_to)),
+        }
+        self.digests[source] = b"".join(digests)
+        self.deferred[source] = b"".join(deferred)
+
+    def dependents(self, digests: Set[bytes], paths: Set[str], exclude: Set[str]) -> Set[str]:
+        """Sources not in `exclude` that dropped a duplicate of one of `digests` or one of `paths`."""
+        found = set()
+        for source, entry in self.files.items():
+            if source in exclude:
+                continue
+            if paths.intersection(entry["deferred_to"]) or not digests.isdisjoint(_split(self.deferred[source])):
+                found.add(source)
+        return found
+
+    def added_digests(self, source: str) -> Iterator[bytes]:
+        return _split(self.digests.get(source, b""))
+
+    def known_digests(self) -> Iterator[bytes]:
+        for blob in self.digests.values():
+            yield from _split(blob)
+
+    def save(self) -> None:
+        self.dir.mkdir(parents=True, exist_ok=True)
+        files = {source: dict(entry) for source, entry in self.files.items()}
+        for name, blobs in (("digest", self.digests), ("deferred", self.deferred)):
+            offset = 0
+            with open(self.dir / f"{name}.tmp", "wb") as fh:
+                for source, entry in files.items():
+                    blob = blobs.get(source, b"")
+                    fh.write(blob)
+                    count = len(blob) // DIGEST_SIZE
+                    entry.update({f"{name}_offset": offset, f"{name}_count": count})
+                    offset += count
+        (self.dir / "digest.tmp").replace(self.dir / "digests.bin")
+        (self.dir / "deferred.tmp").replace(self.dir / "deferred.bin")
+        tmp = self.dir / "files.tmp"
+        tmp.write_text(json.dumps(files))
+        tmp.replace(self.dir / "files.json")
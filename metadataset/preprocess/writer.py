@@ -0,0 +1,130 @@
+import logging
+import queue
+import threading
+from pathlib import Path
+from typing import List, Optional, Set, Tuple, Union
+
+from ..utils.fasta import format_fasta
+from ..utils.io import COMPRESSION_SUFFIXES, open_compressed, require_compression
+
+BATCH_SIZE = 64  # jobs a writer thread takes off the queue at once
+COPY_SIZE = 1 << 20
+
+# (destination, (id, description, sequence) or a spool file to move there, queued bytes)
+_Job = Tuple[Path, Union[Tuple[str, str, bytes], Path], int]
+
+
+class RecordWriter:
+    """
+    Writes the per-record .fna files of 'files' output on background
+    threads, so committing further records overlaps with directory
+    creation, file writes and compression. Records queue up to
+    `buffer_bytes`; past that, write() waits for the threads to catch up.
+    Each thread takes queued records in batches and creates the class
+    directories a batch needs once, remembering those that exist.
+
+    A failed write is raised from the next write() or from close().
+    """
+
+    def __init__(self, threads: int = 2, buffer_bytes: int = 64 << 20,
+                 compression: str = "none", level: Optional[int] = None):
+        """
+        :param threads: writer threads, 0 = write in the calling thread
+        :param buffer_bytes: sequence bytes queued before write() blocks
+        :param compression: "none", "gzip" or "zstd", see utils.io
+        :param level: compression level, the codec's default if None
+        """
+        require_compression(compression)
+        self.compression = compression
+        self.level = level
+        self.suffix = ".fna" + COMPRESSION_SUFFIXES[compression]
+        self.buffer_bytes = buffer_bytes
+
+        self._dirs: Set[Path] = set()
+        self._dirs_lock = threading.Lock()
+        self._jobs: "queue.Queue[Optional[_Job]]" = queue.Queue()
+        self._queued = 0
+        self._room = threading.Condition()
+        self._error: Optional[BaseException] = None
+        self._threads = [threading.Thread(target=self._drain, name=f"record-writer-{i}", daemon=True)
+                         for i in range(threads)]
+        for thread in self._threads:
+            thread.start()
+
+    def write(self, path: Path, rec_id: str, description: str, seq: bytes) -> None:
+        """Write one record to `path`, which should end in `suffix`."""
+        self._submit((path, (rec_id, description, seq), len(seq)))
+
+    def move(self, path: Path, spool: Path) -> None:
+        """Move an already formatted FASTA file to `path`, compressing it on the way."""
+        self._submit((path, spool, 0))
+
+    def _submit(self, job: _Job) -> None:
+        self._check()
+        if not self._threads:
+            self._write_batch([job])
+            return
+        with self._room:
+            while self._queued and self._queued + job[2] > self.buffer_bytes and self._error is None:
+                self._room.wait()
+            self._queued += job[2]
+        self._check()
+        self._jobs.put(job)
+
+    def _check(self) -> None:
+        if self._error is not None:
+            raise self._error
+
+    def _drain(self) -> None:
+        while True:
+            batch = [self._jobs.get()]
+            while batch[-1] is not None and len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(self._jobs.get_nowait())
+                except queue.Empty:
+                    break
+            done = batch[-1] is None
+            jobs: List[_Job] = [job for job in batch if job is not None]
+
+            if self._error is None:
+                try:
+                    self._write_batch(jobs)
+                except BaseException as e:
+                    logging.error(f"Writing record files failed: {e}")
+                    self._error = e
+            with self._room:
+                self._queued -= sum(job[2] for job in jobs)
+                self._room.notify_all()
+            if done:
+                return
+
+    def _write_batch(self, jobs: List[_Job]) -> None:
+        missing = {path.parent for path, _, _ in jobs} - self._dirs
+        if missing:
+            # Under the lock, so no thread writes into a directory another one is still creating
+            with self._dirs_lock:
+                for directory in missing - self._dirs:
+                    directory.mkdir(parents=True, exist_ok=True)
+                    self._dirs.add(directory)
+
+        for path, content, _ in jobs:
+            if isinstance(content, Path):
+                if self.compression == "none":
+                    content.replace(path)
+                    continue
+                with open(content, "rb") as src, open_compressed(path, self.compression, self.level) as fh:
+                    for block in iter(lambda: src.read(COPY_SIZE), b""):
+                        fh.write(block)
+                content.unlink()
+            else:
+                with open_compressed(path, self.compression, self.level) as fh:
+                    fh.write(format_fasta(*content))
+
+    def close(self) -> None:
+        """Wait for every queued record to be written."""
+        for _ in self._threads:
+            self._jobs.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        self._check()
@@ -0,0 +1,8 @@
+from .dataset import PackedDataset
+from .encode import decode_bases, encode_bases, kmer_counts, one_hot
+from .pack import CLASS4_LABELS, PackWriter, manifest_rows, pack_manifest
+
+__all__ = [
+    "PackedDataset", "PackWriter", "pack_manifest", "manifest_rows", "CLASS4_LABELS",
+    "encode_bases", "decode_bases", "one_hot", "kmer_counts",
+]
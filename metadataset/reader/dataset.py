@@ -0,0 +1,106 @@
+from pathlib import Path
+from typing import Iterator, Optional, Tuple
+
+import numpy as np
+
+from .pack import index_path, seq_path
+
+_SHIFTS = np.array([6, 4, 2, 0], dtype=np.uint8)
+
+
+class PackedDataset:
+    """
+    Read-only view of a packed dataset (see pack.PackWriter). The sequence
+    buffer is memory-mapped, so opening is instant and only the pages a
+    batch touches are read. Sequences come back as uint8 codes
+    (A=0, C=1, G=2, T=3, N=4), ready for encode.one_hot / kmer_counts.
+    """
+
+    def __init__(self, prefix: Path):
+        with np.load(index_path(prefix), allow_pickle=False) as index:
+            self.offsets = index["offsets"]
+            self.lengths = index["lengths"]
+            self.labels = index["labels"].astype(np.int64)
+            self.accessions = index["accessions"]
+            self.classes = [str(c) for c in index["classes"]]
+            self.encoding = str(index["encoding"])
+
+        path = seq_path(prefix)
+        if path.stat().st_size:
+            self.buffer = np.memmap(path, dtype=np.uint8, mode="r")
+        else:
+            self.buffer = np.empty(0, dtype=np.uint8)
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    @property
+    def total_bases(self) -> int:
+        return int(self.lengths.sum())
+
+    def _slice(self, start: int, length: int) -> np.ndarray:
+        """Codes of global bases [start, start + length)."""
+        if self.encoding == "uint8":
+            return np.array(self.buffer[start:start + length])
+        first, last = start >> 2, (start + length + 3) >> 2
+        codes = (self.buffer[first:last, None] >> _SHIFTS) & 3
+        skip = start & 3
+        return codes.reshape(-1)[skip:skip + length]
+
+    def _gather(self, starts: np.ndarray, length: int) -> np.ndarray:
+        """Codes of shape (len(starts), length) for windows at global `starts`."""
+        pos = starts[:, None] + np.arange(length, dtype=np.int64)
+        if self.encoding == "uint8":
+            return self.buffer[pos]
+        shifts = ((3 - (pos & 3)) << 1).astype(np.uint8)
+        return (self.buffer[pos >> 2] >> shifts) & 3
+
+    def sequence(self, i: int) -> np.ndarray:
+        """All codes of record `i`."""
+        return self._slice(int(self.offsets[i]), int(self.lengths[i]))
+
+    def window(self, i: int, start: int, length: int) -> np.ndarray:
+        """Codes of record `i` from `start`, clipped to the record's end."""
+        length = max(0, min(length, int(self.lengths[i]) - start))
+        return self._slice(int(self.offsets[i]) + start, length)
+
+    def windows(self, records: np.ndarray, starts: np.ndarray, length: int) -> np.ndarray:
+        """Windows of `length` at per-record `starts`, shape (len(records), length)."""
+        records = np.asarray(records)
+        starts = np.asarray(starts, dtype=np.int64)
+        if np.any(starts + length > self.lengths[records]) or np.any(starts < 0):
+            raise IndexError("window runs past the end of its record")
+        return self._gather(self.offsets[records] + starts, length)
+
+    def sample(self, batch_size: int, length: int,
+               rng: Optional[np.random.Generator] = None,
+               weighted: bool = True) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Random windows of `length` bases from records at least that long.
+        :param weighted: pick records in proportion to their number of
+                         windows (uniform over positions), else uniformly
+        :return: (codes of shape (batch_size, length), class4 labels, record indices)
+        """
+        rng = rng or np.random.default_rng()
+        eligible = np.flatnonzero(self.lengths >= length)
+        if not len(eligible):
+            raise ValueError(f"No record is at least {length} bases long")
+
+        n_windows = self.lengths[eligible] - length + 1
+        p = n_windows / n_windows.sum() if weighted else None
+        pick = rng.choice(len(eligible), size=batch_size, p=p)
+        records = eligible[pick]
+        starts = rng.integers(0, n_windows[pick])
+        codes = self._gather(self.offsets[records] + starts, length)
+        return codes, self.labels[records], records
+
+    def batches(self, batch_size: int, length: int, n_batches: Optional[int] = None,
+                seed: Optional[int] = None, weighted: bool = True
+                ) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """Endless (or `n_batches`) stream of sample() batches as (codes, labels)."""
+        rng = np.random.default_rng(seed)
+        produced = 0
+        while n_batches is None or produced < n_batches:
+            codes, labels, _ = self.sample(batch_size, length, rng, weighted)
+            yield codes, labels
+            produced += 1
@@ -0,0 +1,61 @@
+import numpy as np
+
+# Base codes used throughout the packed format; anything else is N
+A, C, G, T, N = 0, 1, 2, 3, 4
+
+_CODES = np.full(256, N, dtype=np.uint8)
+for _base, _code in zip(b"ACGT", (A, C, G, T)):
+    _CODES[_base] = _code
+    _CODES[ord(chr(_base).lower())] = _code
+_BASES = np.frombuffer(b"ACGTN", dtype=np.uint8)
+# One-hot rows per code; N encodes as all zeros
+_ONE_HOT = np.vstack([np.eye(4), np.zeros(4)])
+
+
+def encode_bases(seq: bytes) -> np.ndarray:
+    """ASCII sequence -> uint8 codes (A=0, C=1, G=2, T=3, other=4)."""
+    return _CODES[np.frombuffer(seq, dtype=np.uint8)]
+
+
+def decode_bases(codes: np.ndarray) -> bytes:
+    """uint8 codes -> ASCII sequence."""
+    return _BASES[np.asarray(codes)].tobytes()
+
+
+def one_hot(codes: np.ndarray, dtype=np.float32) -> np.ndarray:
+    """Codes of shape (..., L) -> one-hot array of shape (..., L, 4)."""
+    return _ONE_HOT.astype(dtype)[np.asarray(codes)]
+
+
+def kmer_counts(codes: np.ndarray, k: int, dtype=np.float32, normalize: bool = False) -> np.ndarray:
+    """
+    k-mer count vectors, lexicographic order (AA..A, AA..C, ...), for codes
+    of shape (L,) or (B, L). k-mers containing an N are not counted.
+    :param normalize: divide by the number of counted k-mers per row
+    """
+    codes = np.asarray(codes)
+    single = codes.ndim == 1
+    if single:
+        codes = codes[None, :]
+    if codes.ndim != 2:
+        raise ValueError(f"Expected codes of shape (L,) or (B, L), got {codes.shape}")
+    if not 1 <= k <= 12:
+        raise ValueError(f"k must be between 1 and 12, got {k}")
+
+    rows, length = codes.shape
+    n_kmers = max(length - k + 1, 0)
+    size = 4 ** k
+    index = np.zeros((rows, n_kmers), dtype=np.int64)
+    valid = np.ones((rows, n_kmers), dtype=bool)
+    for i in range(k):
+        part = codes[:, i:i + n_kmers]
+        index = index * 4 + (part & 3)
+        valid &= part < N
+
+    # One bincount over all rows, each row shifted into its own block
+    flat = (index + (np.arange(rows) * size)[:, None])[valid]
+    counts = np.bincount(flat, minlength=rows * size).reshape(rows, size).astype(dtype)
+    if normalize:
+        totals = counts.sum(axis=1, keepdims=True)
+        counts /= np.maximum(totals, 1)
+    return counts[0] if single else counts
@@ -0,0 +1,137 @@
+import csv
+import logging
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional
+
+import numpy as np
+
+from .encode import N, encode_bases
+from ..preprocess.shards import read_shard_record
+from ..utils.fasta import StreamedFastaRecord, read_fasta
+
+ENCODINGS = ("2bit", "uint8")
+# Label ids shared by every packed dataset, whatever categories went into it
+CLASS4_LABELS = ["prokaryote", "eukaryote", "viral", "plasmid", "unknown"]
+CHUNK_BASES = 1 << 24
+
+
+def seq_path(prefix: Path) -> Path:
+    return prefix.with_name(prefix.name + ".seq")
+
+
+def index_path(prefix: Path) -> Path:
+    return prefix.with_name(prefix.name + ".index.npz")
+
+
+def _pack_2bit(codes: np.ndarray) -> np.ndarray:
+    """Four codes per byte, first base in the high bits; len(codes) % 4 == 0."""
+    quads = codes.reshape(-1, 4)
+    return (quads[:, 0] << 6) | (quads[:, 1] << 4) | (quads[:, 2] << 2) | quads[:, 3]
+
+
+class PackWriter:
+    """
+    Concatenates sequences into <prefix>.seq, as one uint8 code per base
+    or four bases per byte ('2bit', ACGT only), and writes the offset
+    index to <prefix>.index.npz on close.
+    """
+
+    def __init__(self, prefix: Path, encoding: str = "2bit"):
+        if encoding not in ENCODINGS:
+            raise ValueError(f"Unknown encoding {encoding!r}, expected one of {ENCODINGS}")
+        prefix.parent.mkdir(parents=True, exist_ok=True)
+        self.prefix = prefix
+        self.encoding = encoding
+        self.handle = open(seq_path(prefix), "wb")
+        self.total = 0
+        self._carry = np.empty(0, dtype=np.uint8)
+        self.offsets: List[int] = []
+        self.lengths: List[int] = []
+        self.labels: List[int] = []
+        self.accessions: List[str] = []
+
+    def _write(self, codes: np.ndarray) -> None:
+        if self.encoding == "uint8":
+            self.handle.write(codes.tobytes())
+            return
+        if (codes == N).any():
+            raise ValueError("2bit encoding only holds A, C, G and T; use uint8")
+        codes = np.concatenate([self._carry, codes])
+        full = len(codes) - len(codes) % 4
+        self.handle.write(_pack_2bit(codes[:full]).tobytes())
+        self._carry = codes[full:]
+
+    def add(self, accession: str, class4: str, chunks: Iterable[bytes]) -> None:
+        """Append one record given as consecutive pieces of its sequence."""
+        start = self.total
+        for chunk in chunks:
+            for i in range(0, len(chunk), CHUNK_BASES):
+                codes = encode_bases(chunk[i:i + CHUNK_BASES])
+                self._write(codes)
+                self.total += len(codes)
+
+        label = CLASS4_LABELS.index(class4) if class4 in CLASS4_LABELS else CLASS4_LABELS.index("unknown")
+        self.offsets.append(start)
+        self.lengths.append(self.total - start)
+        self.labels.append(label)
+        self.accessions.append(accession)
+
+    def abort(self) -> None:
+        """Close and delete the partial output."""
+        self.handle.close()
+        seq_path(self.prefix).unlink(missing_ok=True)
+        index_path(self.prefix).unlink(missing_ok=True)
+
+    def close(self) -> None:
+        if len(self._carry):
+            pad = np.zeros(4 - len(self._carry), dtype=np.uint8)
+            self.handle.write(_pack_2bit(np.concatenate([self._carry, pad])).tobytes())
+            self._carry = self._carry[:0]
+        self.handle.close()
+        np.savez(index_path(self.prefix),
+                 offsets=np.asarray(self.offsets, dtype=np.int64),
+                 lengths=np.asarray(self.lengths, dtype=np.int64),
+                 labels=np.asarray(self.labels, dtype=np.int16),
+                 accessions=np.asarray(self.accessions, dtype=str),
+                 classes=np.asarray(CLASS4_LABELS, dtype=str),
+                 encoding=np.asarray(self.encoding))
+
+
+def manifest_rows(out_dir: Path, categories: List[str], split: Optional[str] = None) -> Iterator[dict]:
+    """Rows of the manifests of `categories` under out_dir/metadata, optionally of one split."""
+    for category in categories:
+        manifest_path = out_dir / "metadata" / f"{category}_manifest.csv"
+        with open(manifest_path, newline="") as fh:
+            for row in csv.DictReader(fh):
+                if split is None or row["split"] == split:
+                    yield row
+
+
+def _record_chunks(path_spec: str) -> Iterator[bytes]:
+    """Sequence of the record a manifest path points to, in pieces."""
+    path = Path(path_spec)
+    if not path.exists() and ":" in path_spec:
+        yield read_shard_record(path_spec).seq
+        return
+    rec = next(read_fasta(path, stream_threshold=CHUNK_BASES))
+    if isinstance(rec, StreamedFastaRecord):
+        yield from rec.chunks
+    else:
+        yield rec.seq
+
+
+def pack_manifest(rows: Iterable[dict], prefix: Path, encoding: str = "2bit") -> int:
+    """
+    Pack the records listed in manifest `rows`, in order.
+    :return: number of records packed
+    """
+    writer = PackWriter(prefix, encoding)
+    try:
+        for row in rows:
+            writer.add(row["accession"], row["class4"], _record_chunks(row["path"]))
+    except BaseException:
+        writer.abort()
+        raise
+    writer.close()
+    logging.info(f"Packed {len(writer.offsets)} records ({writer.total:,} bases) into {seq_path(prefix)}")
+    return len(writer.offsets)
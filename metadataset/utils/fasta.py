@@ -0,0 +1,231 @@
+import gzip
+import mmap
+from pathlib import Path
+from typing import BinaryIO, Iterable, Iterator, Optional, Tuple
+
+from .io import open_zstd
+
+READ_SIZE = 1 << 22
+PIECE_SIZE = 1 << 22
+LINE_WIDTH = 60
+
+# Bytes stripped from sequence lines
+_WHITESPACE = b" \t\r\n\x0b\x0c"
+
+
+class FastaRecord:
+    """
+    Minimal FASTA record: the id, the full header line and the raw
+    sequence bytes. Mirrors the attributes of Bio.SeqRecord that the
+    pipeline reads.
+    """
+    __slots__ = ("id", "description", "seq")
+
+    def __init__(self, id: str, description: str, seq: Optional[bytes]):
+        self.id = id
+        self.description = description
+        self.seq = seq
+
+    def __len__(self) -> int:
+        return len(self.seq)
+
+    def __repr__(self) -> str:
+        return f"FastaRecord(id={self.id!r}, length={len(self.seq)})"
+
+
+class StreamedFastaRecord(FastaRecord):
+    """
+    A record too long to materialise: `seq` is None and the sequence is
+    read through `chunks`, which must be consumed before the next record
+    is requested (whatever is left is skipped).
+    """
+    __slots__ = ("chunks",)
+
+    def __init__(self, id: str, description: str, chunks: Iterator[bytes]):
+        super().__init__(id, description, None)
+        self.chunks = chunks
+
+    def __len__(self) -> int:
+        raise TypeError("length of a streamed record is only known once consumed")
+
+    def __repr__(self) -> str:
+        return f"StreamedFastaRecord(id={self.id!r})"
+
+
+def _split_title(title: bytes) -> Tuple[str, str]:
+    description = title.decode("utf-8", "ignore").rstrip()
+    words = description.split(None, 1)
+    return (words[0] if words else ""), description
+
+
+def _parse_events(blocks: Iterable) -> Iterator[Tuple[bool, bytes]]:
+    """
+    Turn a stream of byte blocks into (is_header, data) events: complete
+    header lines and whitespace-free sequence pieces of at most
+    PIECE_SIZE bytes. Record boundaries are found with bytes.find on
+    '\\n>', so no Python object is created per line. Text before the
+    first header is ignored.
+    """
+    in_record = False
+    header = None       # header line still being read, if any
+    line_start = True
+
+    for block in blocks:
+        pos, n = 0, len(block)
+        while pos < n:
+            if header is not None:
+                nl = block.find(b"\n", pos)
+                if nl == -1:
+                    header += block[pos:n]
+                    break
+                yield True, header + block[pos:nl]
+                header = None
+                in_record = line_start = True
+                pos = nl + 1
+                continue
+
+            if line_start and block[pos] == 0x3E:  # '>'
+                header = b""
+                line_start = False
+                pos += 1
+                continue
+
+            limit = min(n, pos + PIECE_SIZE)
+            nxt = block.find(b"\n>", pos, limit)
+            end = limit if nxt == -1 else nxt + 1
+            if in_record:
+                yield False, block[pos:end].translate(None, _WHITESPACE)
+            line_start = block[end - 1] == 0x0A  # '\n'
+            pos = end
+
+    if header is not None:
+        yield True, header
+
+
+def _stream_pieces(first: list, events: Iterator[Tuple[bool, bytes]], box: list) -> Iterator[bytes]:
+    """Sequence pieces of a streamed record; the next header is left in `box`."""
+    for i, piece in enumerate(first):
+        first[i] = None
+        yield piece
+    for is_header, data in events:
+        if is_header:
+            box.append(data)
+            return
+        yield data
+
+
+def _parse_blocks(blocks: Iterable, stream_threshold: Optional[int] = None) -> Iterator[FastaRecord]:
+    """
+    Assemble records from the event stream. A record whose sequence grows
+    past `stream_threshold` bytes is handed out as a StreamedFastaRecord
+    instead, so memory stays bounded by the threshold plus one piece.
+    """
+    events = _parse_events(blocks)
+    title = next(events, (True, None))[1]
+
+    while title is not None:
+        next_title = None
+        parts, size, streamed = [], 0, False
+        for is_header, data in events:
+            if is_header:
+                next_title = data
+                break
+            parts.append(data)
+            size += len(data)
+            if stream_threshold is not None and size > stream_threshold:
+                streamed = True
+                break
+
+        rec_id, description = _split_title(title)
+        if streamed:
+            box = []
+            chunks = _stream_pieces(parts, events, box)
+            yield StreamedFastaRecord(rec_id, description, chunks)
+            for _ in chunks:    # skip whatever the consumer left
+                pass
+            next_title = box[0] if box else None
+        else:
+            yield FastaRecord(rec_id, description, parts[0] if len(parts) == 1 else b"".join(parts))
+        title = next_title
+
+
+def parse_fasta_stream(handle: BinaryIO, read_size: int = READ_SIZE,
+                       stream_threshold: Optional[int] = None) -> Iterator[FastaRecord]:
+    """Parse FASTA from any binary file object using large buffered reads."""
+    return _parse_blocks(iter(lambda: handle.read(read_size), b""), stream_threshold)
+
+
+def read_fasta(path: Path, stream_threshold: Optional[int] = None) -> Iterator[FastaRecord]:
+    """
+    Yield FastaRecords from a plain, gzipped or zstd-compressed FASTA file.
+    Plain files are memory-mapped, compressed ones are decompressed in
+    large blocks. Records
+    longer than `stream_threshold` come as StreamedFastaRecords.
+    """
+    if path.suffix in (".gz", ".zst"):
+        with gzip.open(path, "rb") if path.suffix == ".gz" else open_zstd(path) as fh:
+            yield from parse_fasta_stream(fh, stream_threshold=stream_threshold)
+        return
+
+    with open(path, "rb") as fh:
+        if path.stat().st_size == 0:
+            return
+        with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            yield from _parse_blocks([mm], stream_threshold)
+
+
+def format_fasta_header(rec_id: str, description: str) -> bytes:
+    """The '>' line Bio.SeqIO.write(..., 'fasta') writes for a record."""
+    rec_id = rec_id.replace("\n", " ").replace("\r", " ")
+    description = description.replace("\n", " ").replace("\r", " ")
+    if description and description.split(None, 1)[0] == rec_id:
+        title = description
+    elif description:
+        title = f"{rec_id} {description}"
+    else:
+        title = rec_id
+    return b">" + title.encode("utf-8") + b"\n"
+
+
+def format_fasta(rec_id: str, description: str, seq: bytes, wrap: int = LINE_WIDTH) -> bytes:
+    """Serialise one record the way Bio.SeqIO.write(..., 'fasta') does."""
+    lines = [seq[i:i + wrap] for i in range(0, len(seq), wrap)]
+    lines.append(b"")
+    return format_fasta_header(rec_id, description) + b"\n".join(lines)
+
+
+class WrappedSequenceWriter:
+    """Writes a sequence given in arbitrary chunks as fixed-width FASTA lines."""
+
+    def __init__(self, handle: BinaryIO, wrap: int = LINE_WIDTH):
+        self.handle = handle
+        self.wrap = wrap
+        self._col = 0
+
+    def write(self, seq: bytes) -> None:
+        wrap, pos = self.wrap, 0
+        if self._col:
+            pos = min(wrap - self._col, len(seq))
+            self.handle.write(seq[:pos])
+            self._col += pos
+            if self._col < wrap:
+                return
+            self.handle.write(b"\n")
+            self._col = 0
+
+        full = pos + (len(seq) - pos) // wrap * wrap
+        if full > pos:
+            self.handle.write(b"\n".join(seq[i:i + wrap] for i in range(pos, full, wrap)) + b"\n")
+        if full < len(seq):
+            self.handle.write(seq[full:])
+            self._col = len(seq) - full
+
+    def close(self) -> None:
+        if self._col:
+            self.handle.write(b"\n")
+            self._col = 0
+
+
+def write_fasta(path: Path, rec_id: str, description: str, seq: bytes) -> None:
+    with open(path, "wb") as fh:
+        fh.write(format_fasta(rec_id, description, seq))
@@ -1,6 +1,63 @@
+import gzip
+import os
+from contextlib import contextmanager
 from pathlib import Path
+from typing import BinaryIO, Iterator, Optional
+
+try:
+    import zstandard
+except ImportError:  # optional, only needed for .zst files
+    zstandard = None
+
+# File name suffix of each output compression
+COMPRESSION_SUFFIXES = {"none": "", "gzip": ".gz", "zstd": ".zst"}
+DEFAULT_LEVELS = {"gzip": 6, "zstd": 3}
+
+
+def _umask() -> int:
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+# Permissions open() gives new files; read once, as os.umask cannot be queried without setting it
+FILE_MODE = 0o666 & ~_umask()
 
 
 def ensure_dir(path: Path) -> None:
     path.mkdir(parents=True, exist_ok=True)
     return None
+
+
+def require_compression(compression: str) -> None:
+    """Raise if `compression` is unknown or needs a package that is not installed."""
+    if compression not in COMPRESSION_SUFFIXES:
+        raise ValueError(f"Unknown compression '{compression}', expected one of {', '.join(COMPRESSION_SUFFIXES)}")
+    if compression == "zstd" and zstandard is None:
+        raise ImportError("zstd compression needs the zstandard package (pip install zstandard)")
+
+
+def open_zstd(path: Path) -> BinaryIO:
+    """Open a .zst file for reading."""
+    require_compression("zstd")
+    return zstandard.open(path, "rb")
+
+
+@contextmanager
+def open_compressed(path: Path, compression: str = "none", level: Optional[int] = None) -> Iterator[BinaryIO]:
+    """
+    Open `path` for writing through `compression`. gzip members carry no
+    file name or timestamp, so the same content always gives the same bytes.
+    :param level: compression level, the codec's default (as in DEFAULT_LEVELS) if None
+    """
+    require_compression(compression)
+    level = DEFAULT_LEVELS.get(compression) if level is None else level
+    with open(path, "wb") as raw:
+        if compression == "gzip":
+            with gzip.GzipFile(filename="", mode="wb", fileobj=raw, compresslevel=level, mtime=0) as fh:
+                yield fh
+        elif compression == "zstd":
+            with zstandard.ZstdCompressor(level=level).stream_writer(raw, closefd=False) as fh:
+                yield fh
+        else:
+            yield raw
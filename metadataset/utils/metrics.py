@@ -0,0 +1,137 @@
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+PROGRESS_INTERVAL = 30.0
+
+
+@contextmanager
+def timed(times: Dict[str, float], stage: str):
+    """Add the time spent in the block to times[stage]."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        times[stage] = times.get(stage, 0.0) + time.perf_counter() - start
+
+
+def _format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds}s"
+
+
+class Metrics:
+    """
+    Counters and per-stage timers of one run, shared by its threads.
+    Progress lines with rates and an ETA are logged at most every
+    `interval` seconds as work items complete, and the whole lot can be
+    written out as JSON when the run ends.
+
+    Stage times are summed over threads and worker processes, so with
+    concurrency they can add up to more than the wall-clock time.
+    """
+
+    def __init__(self, name: str,
+                 total: Optional[int] = None,
+                 rates: Iterable[str] = (),
+                 counters: Optional[Dict[str, int]] = None,
+                 interval: float = PROGRESS_INTERVAL):
+        """
+        :param name: label of the run in progress lines
+        :param total: number of work items, for the ETA
+        :param rates: counters shown as per-second rates in progress lines
+        :param counters: existing counter mapping to report on, a new one if None
+        :param interval: minimum seconds between progress lines, 0 = never log
+        """
+        self.name = name
+        self.total = total
+        self.rates = list(rates)
+        self.counters = counters if counters is not None else defaultdict(int)
+        self.timers: Dict[str, float] = defaultdict(float)
+        self.interval = interval
+        self.done = 0
+        self.started = time.time()
+        self._start = time.perf_counter()
+        self._last_report = self._start
+        self._lock = threading.Lock()
+
+    def count(self, key: str, n: int = 1) -> None:
+        with self._lock:
+            self.counters[key] += n
+
+    def add_counts(self, counts: Dict[str, int]) -> None:
+        with self._lock:
+            for key, n in counts.items():
+                self.counters[key] += n
+
+    def add_times(self, times: Dict[str, float]) -> None:
+        with self._lock:
+            for stage, seconds in times.items():
+                self.timers[stage] += seconds
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time a block as part of stage `name`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_times({name: time.perf_counter() - start})
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._start
+
+    def advance(self, n: int = 1) -> None:
+        """Mark `n` work items as done, logging progress if it is due."""
+        with self._lock:
+            self.done += n
+            now = time.perf_counter()
+            due = self.interval and now - self._last_report >= self.interval
+            if due:
+                self._last_report = now
+        if due:
+            logging.info(self.progress_line())
+
+    def progress_line(self) -> str:
+        elapsed = max(self.elapsed, 1e-9)
+        done = f"{self.done}/{self.total}" if self.total is not None else str(self.done)
+        parts = [f"[{self.name}] {done} done in {_format_duration(elapsed)}"]
+        for key in self.rates:
+            parts.append(f"{self.counters.get(key, 0) / elapsed:,.0f} {key}/s")
+        if self.total and self.done:
+            remaining = elapsed / self.done * (self.total - self.done)
+            parts.append(f"ETA {_format_duration(remaining)}")
+        return ", ".join(parts)
+
+    def summary(self) -> dict:
+        elapsed = self.elapsed
+        with self._lock:
+            counters = dict(self.counters)
+            timers = dict(self.timers)
+        return {
+            "name": self.name,
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+            "elapsed_seconds": round(elapsed, 3),
+            "items_done": self.done,
+            "items_total": self.total,
+            "counters": counters,
+            "rates_per_second": {k: round(v / elapsed, 3) for k, v in counters.items()} if elapsed else {},
+            "stage_seconds": {k: round(v, 3) for k, v in sorted(timers.items())},
+        }
+
+    def write(self, path: Path) -> None:
+        """Write summary() as JSON and log where it went."""
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.summary(), indent=2))
+        tmp.replace(path)
+        logging.info(f"{self.progress_line()}; metrics written to {path}")
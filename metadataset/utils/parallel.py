@@ -0,0 +1,34 @@
+from collections import deque
+from concurrent.futures import Executor
+from typing import Callable, Iterable, Iterator, Optional, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+def ordered_map(executor: Executor,
+                fn: Callable[[T], R],
+                items: Iterable[T],
+                window: int,
+                weight: Optional[Callable[[T], int]] = None,
+                budget: Optional[int] = None) -> Iterator[R]:
+    """
+    Like executor.map, but keeps at most `window` tasks in flight so
+    results that are not consumed yet cannot pile up in memory.
+    Results are yielded in input order.
+    :param weight: size of an item, e.g. its bytes
+    :param budget: most total weight of the items in flight; one item
+                   is always let through, however large
+    """
+    pending = deque()
+    held = 0
+    for item in items:
+        size = weight(item) if weight is not None else 0
+        while pending and (len(pending) >= window or (budget is not None and held + size > budget)):
+            future, done_size = pending.popleft()
+            held -= done_size
+            yield future.result()
+        pending.append((executor.submit(fn, item), size))
+        held += size
+    while pending:
+        yield pending.popleft()[0].result()
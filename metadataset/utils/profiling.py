@@ -0,0 +1,98 @@
+import cProfile
+import io
+import logging
+import os
+import pstats
+import sys
+import threading
+from contextlib import contextmanager
+from multiprocessing import util
+from pathlib import Path
+from typing import List, Optional
+
+# Sidecar files written by profiled worker processes: <profile>.<pid>
+WORKER_SUFFIX = ".worker"
+
+
+class Profiler:
+    """
+    cProfile over the main thread and every thread started while it runs.
+    Before Python 3.12 a profiler only sees the thread that enabled it, so
+    each new thread gets its own one and the results are merged on save.
+    """
+
+    def __init__(self):
+        self._profiles: List[cProfile.Profile] = []
+        self._lock = threading.Lock()
+
+    def _start_thread_profile(self, *args) -> None:
+        profile = cProfile.Profile()
+        with self._lock:
+            self._profiles.append(profile)
+        profile.enable()
+
+    def start(self) -> None:
+        self._start_thread_profile()
+        if sys.version_info < (3, 12):
+            threading.setprofile(self._start_thread_profile)
+
+    def stop(self) -> None:
+        threading.setprofile(None)
+        self._profiles[0].disable()
+
+    def stats(self) -> pstats.Stats:
+        with self._lock:
+            stats = pstats.Stats(self._profiles[0])
+            for profile in self._profiles[1:]:
+                stats.add(profile)
+        return stats
+
+
+def _dump_worker(profiler: Profiler, path: Path) -> None:
+    profiler.stop()
+    profiler.stats().dump_stats(f"{path}{WORKER_SUFFIX}{os.getpid()}")
+
+
+def profile_worker(path: Path) -> None:
+    """
+    Profile the rest of this pool worker's life; the profile is written
+    next to `path` when the worker exits and merged by `profiled`.
+    """
+    profiler = Profiler()
+    profiler.start()
+    util.Finalize(None, _dump_worker, args=(profiler, path), exitpriority=10)
+
+
+@contextmanager
+def profiled(path: Optional[Path], top: int = 25):
+    """
+    Profile the block into `path` (pstats format, e.g. for snakeviz or
+    python -m pstats) and log the `top` entries by cumulative time.
+    Does nothing if `path` is None.
+    """
+    if path is None:
+        yield
+        return
+
+    for stale in path.parent.glob(f"{path.name}{WORKER_SUFFIX}*"):
+        stale.unlink()
+
+    profiler = Profiler()
+    profiler.start()
+    try:
+        yield
+    finally:
+        profiler.stop()
+        stats = profiler.stats()
+        for worker_file in sorted(path.parent.glob(f"{path.name}{WORKER_SUFFIX}*")):
+            stats.add(str(worker_file))
+            worker_file.unlink()
+        stats.dump_stats(str(path))
+        logging.info(f"Profile written to {path}")
+
+        stats.sort_stats("cumulative")
+        stream = io.StringIO()
+        stats.stream = stream
+        stats.print_stats(top)
+        logging.info(f"Top {top} functions by cumulative time:\n{stream.getvalue().strip()}")
+
@@ -0,0 +1,65 @@
+import pytest
+
+from metadataset.preprocess.classify import RepliconClassifier, validate_rules
+from metadataset.preprocess.config import DEFAULT_REPLICON_RULES
+
+
+def _first_rule(rules, description: str) -> str:
+    """Reference: the first rule with a keyword anywhere in the description."""
+    text = description.lower()
+    for rtype, keywords in rules.items():
+        if any(keyword.lower() in text for keyword in keywords):
+            return rtype
+    return "unknown"
+
+
+@pytest.mark.parametrize("rules, description, expected", [
+    # A lower-priority keyword containing a higher-priority one
+    ({"viral": ["phage"], "chromosomal": ["prophage region"]}, "E. coli prophage region 3", "viral"),
+    # A lower-priority keyword ending in a prefix of a higher-priority one
+    ({"plasmid": ["plasmid"], "chromosomal": ["complete genome pl"]}, "X complete genome plasmid pA", "plasmid"),
+    # A higher-priority keyword later in the text than a lower-priority one
+    ({"viral": ["virus"], "chromosomal": ["chromosome"]}, "chromosome of a virus host", "viral"),
+    # Keyword case does not matter
+    ({"plasmid": ["PLASMID"], "chromosomal": ["Chromosome"]}, "Plasmid and chromosome", "plasmid"),
+])
+def test_overlapping_keywords_keep_rule_order(rules, description, expected):
+    classifier = RepliconClassifier("bacteria", rules)
+    assert _first_rule(rules, description) == expected
+    assert classifier.replicon_type(description) == expected
+
+
+def test_default_rules_and_labels():
+    classifier = RepliconClassifier("bacteria")
+    cases = {
+        "Escherichia coli strain K-12 chromosome, complete genome": ("chromosomal", "prokaryote", None),
+        "Escherichia coli strain K-12 plasmid pXYZ": ("plasmid", "plasmid", "pXYZ"),
+        "Enterobacteria phage lambda, complete genome": ("viral", "viral", None),
+        "Escherichia coli contig_7": ("unknown", "prokaryote", None),
+    }
+    for description, expected in cases.items():
+        assert tuple(classifier.classify(description)) == expected
+        assert classifier.replicon_type(description) == _first_rule(DEFAULT_REPLICON_RULES, description)
+    assert classifier.plasmid_label("Escherichia coli plasmid", "ACC1.1") == "ACC1.1"
+
+
+def test_cached_and_uncached_agree():
+    cached, uncached = RepliconClassifier("fungi"), RepliconClassifier("fungi", cache_size=0)
+    for description in ["Candida plasmid p1", "Candida chromosome 1", "Candida mitochondrion"] * 2:
+        assert cached.classify(description) == uncached.classify(description)
+
+
+@pytest.mark.parametrize("rules, message", [
+    ({"viral": ["phage", ""]}, "empty or blank keyword"),
+    ({"plasmid": ["plasmid", "   "]}, "empty or blank keyword"),
+    ({"plasmid": ["plasmid", None]}, "empty or blank keyword"),
+    ({"viral": []}, "non-empty list"),
+    ({"viral": "phage"}, "non-empty list"),
+    ({"plasmids": ["plasmid"]}, "Unknown replicon types: plasmids"),
+    (["plasmid"], "must map"),
+])
+def test_invalid_rules_are_refused(rules, message):
+    with pytest.raises(ValueError, match=message):
+        validate_rules(rules)
+    with pytest.raises(ValueError, match=message):
+        RepliconClassifier("bacteria", rules)
@@ -0,0 +1,64 @@
+import pytest
+
+from metadataset.preprocess import BioProcessor, MultiProcessor, PipelineConfig
+from metadataset.preprocess.writer import RecordWriter
+
+
+def _inputs(base_dir, n: int = 4, category: str = "bacteria"):
+    d = base_dir / "train" / category
+    d.mkdir(parents=True)
+    for i in range(n):
+        seq = "".join("ACGT"[(i * 7 + j * j) % 4] for j in range(2000))
+        (d / f"GCA_{i:03d}.fna").write_text(f">ACC{i}.1 Escherichia coli chromosome, complete genome\n{seq}\n")
+
+
+def test_manifest_moves_into_place_after_record_files(tmp_path):
+    _inputs(tmp_path / "in")
+    config = PipelineConfig(base_dir=tmp_path / "in", out_dir=tmp_path / "out", category="bacteria",
+                            manifest_db=True, mash_dedup=False)
+    BioProcessor(config).run()
+
+    meta = tmp_path / "out" / "metadata"
+    manifest = (meta / "bacteria_manifest.csv").read_text().splitlines()
+    assert len(manifest) == 5
+    assert (meta / "bacteria_manifest.sqlite").exists()
+    assert not list(meta.glob("*.tmp"))
+
+
+def test_failed_write_keeps_previous_manifest(tmp_path, monkeypatch):
+    _inputs(tmp_path / "in")
+    config = PipelineConfig(base_dir=tmp_path / "in", out_dir=tmp_path / "out", category="bacteria",
+                            manifest_db=True, mash_dedup=False)
+    BioProcessor(config).run()
+    meta = tmp_path / "out" / "metadata"
+    before = (meta / "bacteria_manifest.csv").read_bytes()
+
+    def fail(self, jobs):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(RecordWriter, "_write_batch", fail)
+    with pytest.raises(OSError):
+        BioProcessor(config).run()
+    assert (meta / "bacteria_manifest.csv").read_bytes() == before
+    assert not list(meta.glob("*.tmp"))
+
+
+def test_failed_multi_category_run_closes_every_processor(tmp_path, monkeypatch):
+    for category in ("bacteria", "fungi"):
+        _inputs(tmp_path / "in", category=category)
+    config = PipelineConfig(base_dir=tmp_path / "in", out_dir=tmp_path / "out", category="",
+                            mash_dedup=False)
+    run = MultiProcessor(config, ["bacteria", "fungi"])
+
+    def fail(self, jobs):
+        raise OSError("disk full")
+
+    closed = []
+    close = BioProcessor.close_outputs
+    monkeypatch.setattr(RecordWriter, "_write_batch", fail)
+    monkeypatch.setattr(BioProcessor, "close_outputs", lambda self: (closed.append(self), close(self)))
+    with pytest.raises(OSError):
+        run.run()
+    assert closed == run.processors[::-1]
+    meta = tmp_path / "out" / "metadata"
+    assert not list(meta.glob("*manifest*"))
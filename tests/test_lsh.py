@@ -0,0 +1,78 @@
+import numpy as np
+
+from metadataset.preprocess.config import PipelineConfig
+from metadataset.preprocess.lsh import LSHIndex, NearDuplicateIndex, band_recall
+from metadataset.preprocess.minhash import MinHashSketcher, jaccard_for_distance, mash_distance
+
+CFG = PipelineConfig(base_dir=".", out_dir=".", category="bacteria")
+
+
+def _mutants(rng, length: int, groups: int, per_group: int, rates):
+    """Random sequences, each followed by copies mutated at a rate drawn from `rates`."""
+    seqs = []
+    for _ in range(groups):
+        base = rng.choice(np.frombuffer(b"ACGT", dtype=np.uint8), length)
+        seqs.append(base.tobytes())
+        for _ in range(per_group):
+            copy = base.copy()
+            hit = rng.random(length) < rng.uniform(*rates)
+            copy[hit] = rng.choice(np.frombuffer(b"ACGT", dtype=np.uint8), int(hit.sum()))
+            seqs.append(copy.tobytes())
+    return seqs
+
+
+def _exact_nearest(sketches, query, threshold):
+    """Brute-force reference: closest sketch within threshold, earliest on ties."""
+    best = None
+    for item, ref in enumerate(sketches):
+        dist = mash_distance(query.hashes, ref.hashes, CFG.kmer_size, CFG.sketch_size)
+        if dist <= threshold and (best is None or dist < best[1]):
+            best = (item, dist)
+    return best
+
+
+def test_default_bands_catch_pairs_at_threshold():
+    jaccard = jaccard_for_distance(CFG.mash_threshold, CFG.kmer_size)
+    assert band_recall(jaccard, CFG.lsh_bands, CFG.lsh_rows) > 1 - 1e-9
+    # The former 64 x 2 default missed about one pair in twenty
+    assert band_recall(jaccard, 64, 2) < 0.95
+
+
+def test_pairs_within_threshold_collide():
+    rng = np.random.default_rng(1)
+    # Short records, mutated to distances just around the threshold; 64 x 2 bands missed 6 of these pairs
+    seqs = _mutants(rng, 2_000, 400, 1, (0.045, 0.06))
+    sketcher = MinHashSketcher(CFG.kmer_size, CFG.sketch_size, bins=CFG.lsh_bands * CFG.lsh_rows)
+    pairs, missed = 0, []
+    for i in range(0, len(seqs), 2):
+        a, b = sketcher.sketch(seqs[i]), sketcher.sketch(seqs[i + 1])
+        if mash_distance(a.hashes, b.hashes, CFG.kmer_size, CFG.sketch_size) > CFG.mash_threshold:
+            continue
+        index = LSHIndex(CFG.lsh_bands, CFG.lsh_rows)
+        index.add(0, a.signature)
+        pairs += 1
+        if 0 not in index.candidates(b.signature):
+            missed.append(i)
+    assert pairs > 300
+    assert missed == []
+
+
+def test_nearest_matches_exact_scan_near_threshold():
+    rng = np.random.default_rng(7)
+    # Mutation rates around the 0.05 threshold, so many pairs land just inside it
+    seqs = _mutants(rng, 20_000, 40, 3, (0.04, 0.055))
+    sketcher = MinHashSketcher(CFG.kmer_size, CFG.sketch_size, bins=CFG.lsh_bands * CFG.lsh_rows)
+    sketches = [sketcher.sketch(seq) for seq in seqs]
+
+    index = NearDuplicateIndex(CFG.kmer_size, CFG.sketch_size, CFG.lsh_bands, CFG.lsh_rows)
+    kept, near = [], 0
+    for i, sketch in enumerate(sketches):
+        expected = _exact_nearest(kept, sketch, CFG.mash_threshold)
+        found = index.nearest(sketch, CFG.mash_threshold, {"train"})
+        assert found == expected, f"record {i}"
+        if found is None:
+            index.add(str(i), "train", sketch)
+            kept.append(sketch)
+        else:
+            near += 1
+    assert near > 40
@@ -0,0 +1,61 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from metadataset.preprocess.seqstats import TETRA_SIZE, AssemblyStats, StatsBuilder, n50
+
+
+@pytest.mark.parametrize("lengths, expected", [
+    ([2, 3, 4, 5, 6, 7, 8, 9, 10], 8),  # 10 + 9 + 8 = 27, half of 54
+    ([1, 1, 1, 10], 10),
+    ([5, 5], 5),
+    ([100], 100),
+    ([100, 300, 200, 250], 250),  # order does not matter: 300 + 250 >= 425
+    ([], 0),
+])
+def test_n50(lengths, expected):
+    assert n50(lengths) == expected
+
+
+def test_assembly_stats_aggregate_manifest_rows():
+    stats = AssemblyStats()
+    rows = [("GCA_1", 1000, 0.5, 3), ("GCA_1", 3000, 0.3, 0), ("GCA_1", 500, 0.6, 1), ("GCA_2", 200, 0.25, 0)]
+    for host, length, gc, ambiguous in rows:
+        stats.add({"host_assembly": host, "length": str(length), "gc": str(gc), "ambiguous": str(ambiguous)})
+    stats.add({"host_assembly": "GCA_3", "length": ""})  # a row without statistics
+    summary = stats.summary()
+    assert summary["GCA_1"] == {
+        "records": 3, "length": 4500, "gc": round((500 + 900 + 300) / 4500, 6),
+        "ambiguous": 4, "largest": 3000, "n50": 3000,
+    }
+    assert summary["GCA_2"]["n50"] == 200
+    assert "GCA_3" not in summary
+
+
+def _tetra(seq: bytes) -> np.ndarray:
+    """Reference tetranucleotide frequencies, AAAA first, TTTT last."""
+    index = {"".join(k).encode(): i for i, k in enumerate(itertools.product("ACGT", repeat=4))}
+    counts = np.zeros(TETRA_SIZE)
+    for i in range(len(seq) - 3):
+        counts[index[seq[i:i + 4]]] += 1
+    return counts / counts.sum()
+
+
+def test_chunked_statistics_match_whole_record():
+    rng = np.random.default_rng(3)
+    seq = rng.choice(np.frombuffer(b"ACGT", dtype=np.uint8), 5000).tobytes()
+    whole = StatsBuilder(tetra=True).update(seq, len(seq) + 7).finish()
+
+    builder = StatsBuilder(tetra=True)
+    cuts = [0, 1, 2, 5, 1000, 1003, 4999, 5000]
+    for start, end in zip(cuts, cuts[1:]):
+        builder.update(seq[start:end], end - start)
+    chunked = builder.finish()
+
+    assert (whole.length, whole.ambiguous) == (5000, 7)
+    assert whole.gc == seq.count(b"G") + seq.count(b"C")
+    assert (chunked.length, chunked.gc, chunked.ambiguous) == (whole.length, whole.gc, 0)
+    np.testing.assert_allclose(whole.tetra, _tetra(seq), rtol=1e-6)
+    np.testing.assert_allclose(chunked.tetra, whole.tetra, rtol=1e-6)
+    assert whole.columns() == {"length": 5000, "gc": f"{whole.gc / 5000:.6f}", "ambiguous": 7}
@@ -0,0 +1,120 @@
+import json
+
+import numpy as np
+import pytest
+
+from metadataset.preprocess import BioProcessor, PipelineConfig, merge_shards
+from metadataset.preprocess.sharding import assign_shards, parse_shard_spec, select_shard
+
+
+def _sized_inputs(tmp_path, sizes):
+    inputs = []
+    for i, size in enumerate(sizes):
+        path = tmp_path / f"f{i}.fna"
+        path.write_bytes(b"A" * size)
+        inputs.append(("train", path))
+    return inputs
+
+
+def _loads(inputs, assignment, count):
+    loads = [0] * count
+    for (_, path), shard in zip(inputs, assignment):
+        loads[shard] += path.stat().st_size
+    return loads
+
+
+def test_assign_shards_largest_first_to_least_loaded(tmp_path):
+    inputs = _sized_inputs(tmp_path, [70, 10, 50, 40, 30, 20, 60])
+    # 70->0, 60->1, 50->2, 40->2, 30->1, 20->0, 10->0
+    assert assign_shards(inputs, 3) == [0, 0, 2, 2, 1, 0, 1]
+    assert _loads(inputs, assign_shards(inputs, 3), 3) == [100, 90, 90]
+
+
+def test_assign_shards_is_balanced_and_order_independent(tmp_path):
+    rng = np.random.default_rng(5)
+    sizes = [int(s) for s in rng.integers(1, 5000, 60)]
+    inputs = _sized_inputs(tmp_path, sizes)
+    for count in (2, 3, 7):
+        assignment = assign_shards(inputs, count)
+        loads = _loads(inputs, assignment, count)
+        # The LPT bound: no shard exceeds the mean load by more than the largest file
+        assert max(loads) <= sum(sizes) / count + max(sizes)
+        # Every node sees the same assignment, whatever order it listed the files in
+        shuffled = [inputs[i] for i in rng.permutation(len(inputs))]
+        by_file = dict(zip((f for _, f in shuffled), assign_shards(shuffled, count)))
+        assert [by_file[f] for _, f in inputs] == assignment
+        # select_shard partitions the inputs and keeps their order
+        chosen = [select_shard(inputs, i, count) for i in range(count)]
+        assert sorted(f for shard in chosen for _, f in shard) == sorted(f for _, f in inputs)
+        assert all(shard == [item for item in inputs if item in shard] for shard in chosen)
+
+
+@pytest.mark.parametrize("spec", ["1", "a/2", "2/2", "-1/2", "0/0"])
+def test_parse_shard_spec_rejects(spec):
+    with pytest.raises(ValueError):
+        parse_shard_spec(spec)
+
+
+def _random_seq(rng, length: int) -> bytes:
+    return rng.choice(np.frombuffer(b"ACGT", dtype=np.uint8), length).tobytes()
+
+
+def _mutate(rng, seq: bytes, rate: float) -> bytes:
+    arr = np.frombuffer(seq, dtype=np.uint8).copy()
+    hit = rng.random(len(arr)) < rate
+    arr[hit] = rng.choice(np.frombuffer(b"ACGT", dtype=np.uint8), int(hit.sum()))
+    return arr.tobytes()
+
+
+def _write_inputs(base_dir):
+    """Train/val/test files with exact copies and near-duplicates across and within files."""
+    rng = np.random.default_rng(11)
+    pool = [_random_seq(rng, int(rng.integers(3000, 9000))) for _ in range(12)]
+    layout = {
+        "train": [[0, 1], [2], [3, 0], [4, 5], [6]],
+        "val": [[1, 7], [8], [2]],
+        "test": [[9, 10], [3, 11]],
+    }
+    near = {("val", 1): 4, ("test", 0): 6}  # files that also get a near-copy of a train record
+    for split, files in layout.items():
+        d = base_dir / split / "bacteria"
+        d.mkdir(parents=True)
+        for i, members in enumerate(files):
+            seqs = [pool[m] for m in members]
+            if (split, i) in near:
+                seqs.append(_mutate(rng, pool[near[split, i]], 0.005))
+            text = "".join(f">{split.upper()}{i}_{j}.1 Escherichia coli {'plasmid p' if j else 'chromosome'}{j}\n"
+                           f"{seq.decode()}\n" for j, seq in enumerate(seqs))
+            (d / f"GCA_{split}{i}.fna").write_text(text)
+
+
+def _outputs(out_dir):
+    meta = out_dir / "metadata"
+    manifest = (meta / "bacteria_manifest.csv").read_text().replace(str(out_dir), "OUT")
+    host_map = json.loads((meta / "bacteria_host_map.json").read_text())
+    clusters = (meta / "bacteria_mash_clusters.tsv").read_text().replace(str(out_dir), "OUT")
+    records = sorted((str(p.relative_to(out_dir)), p.read_bytes())
+                     for p in out_dir.rglob("*") if p.is_file() and "metadata" not in p.parts)
+    return manifest, host_map, clusters, records
+
+
+@pytest.mark.parametrize("output_format", ["files", "shards"])
+def test_merged_shards_match_single_run(tmp_path, output_format):
+    _write_inputs(tmp_path / "in")
+    options = dict(base_dir=tmp_path / "in", category="bacteria", output_format=output_format,
+                   mash_within_split=True)
+
+    single = BioProcessor(PipelineConfig(out_dir=tmp_path / "single", **options))
+    single.run()
+    assert single.stats["skipped_duplicate_md5"] >= 3
+    assert single.stats["skipped_mash_duplicate"] >= 2
+
+    for index in range(3):
+        BioProcessor(PipelineConfig(out_dir=tmp_path / "sharded", shard_index=index, shard_count=3,
+                                    **options)).run()
+    stats = merge_shards(tmp_path / "sharded", "bacteria", 3).stats
+
+    assert _outputs(tmp_path / "sharded") == _outputs(tmp_path / "single")
+    assert {k: v for k, v in stats.items() if k.startswith(("records", "bases", "skipped"))} == \
+        {k: v for k, v in single.stats.items() if k.startswith(("records", "bases", "skipped"))}
+    assert not (tmp_path / "sharded" / "metadata" / "partial").exists()
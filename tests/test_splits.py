@@ -0,0 +1,45 @@
+from concurrent.futures import Future
+
+from metadataset.download.splits import finish_split
+
+FTP = "https://ftp.ncbi.nlm.nih.gov/genomes/all/GCA/000/000/{0}/GCA_000000{0}.1_ASM{0}v1"
+
+
+def _url(n: str) -> str:
+    ftp_path = FTP.format(n)
+    return f"{ftp_path}/{ftp_path.split('/')[-1]}_genomic.fna.gz"
+
+
+def _done(ok: bool) -> Future:
+    future = Future()
+    future.set_result(ok)
+    return future
+
+
+def test_full_download_replaces_failed_list(tmp_path):
+    failed = tmp_path / "bacteria_train_failed.txt"
+    failed.write_text("\n".join([_url("001"), _url("002")]))
+    finish_split("train", [(FTP.format("001"), _done(True)), (FTP.format("003"), _done(False))],
+                 tmp_path, "bacteria")
+    assert failed.read_text().split("\n") == [_url("003")]
+
+    finish_split("train", [(FTP.format("003"), _done(True))], tmp_path, "bacteria")
+    assert not failed.exists()
+
+
+def test_repair_merges_into_failed_list(tmp_path):
+    failed = tmp_path / "bacteria_train_failed.txt"
+    failed.write_text("\n".join([_url("001"), _url("002"), _url("003")]))
+    # Repairs 002 and a genome that was not listed yet; 001 and 003 were not part of it
+    finish_split("train", [(FTP.format("002"), _done(True)), (FTP.format("004"), _done(False))],
+                 tmp_path, "bacteria", merge=True)
+    assert failed.read_text().split("\n") == [_url("001"), _url("003"), _url("004")]
+
+    finish_split("train", [(FTP.format(n), _done(True)) for n in ("001", "003", "004")],
+                 tmp_path, "bacteria", merge=True)
+    assert not failed.exists()
+
+
+def test_repair_without_failed_list(tmp_path):
+    finish_split("val", [(FTP.format("005"), _done(False))], tmp_path, "bacteria", merge=True)
+    assert (tmp_path / "bacteria_val_failed.txt").read_text() == _url("005")
@@ -0,0 +1,115 @@
+import gzip
+import hashlib
+import json
+
+import pytest
+
+from metadataset.download import verify
+from metadataset.download.validate import MIN_CONTIG_LENGTH
+from metadataset.download.verify import check_file, verify_category
+
+CONTIG = "ACGT" * (MIN_CONTIG_LENGTH // 4 + 1)
+GOOD = f">ACC1.1 Escherichia coli chromosome\n{CONTIG}\n".encode()
+
+
+def _name(n: int) -> str:
+    return f"GCA_00000{n}.1_ASM{n}v1"
+
+
+def _layout(base_dir):
+    """One accession per problem verify reports, next to a good .fna.gz and .fna."""
+    raw = base_dir / "raw" / "bacteria" / "train"
+    meta = base_dir / "metadata" / "bacteria"
+    (meta / "checksums").mkdir(parents=True)
+    raw.mkdir(parents=True)
+    files = {
+        1: (".fna.gz", gzip.compress(GOOD)),
+        2: (".fna", GOOD),
+        3: (".fna.gz.tmp", gzip.compress(GOOD)[:50]),
+        4: (".fna", GOOD),
+        5: (".fna", GOOD),
+        7: (".fna.gz", gzip.compress(GOOD)[:-20]),
+        8: (".fna.gz", gzip.compress(GOOD)),
+        9: (".fna", b""),
+        10: (".fna.gz", b"not gzip at all"),
+        11: (".fna", b">ACC11.1 short\n" + CONTIG[:600].encode() + b"\n"),
+    }
+    for n, (suffix, data) in files.items():
+        (raw / f"{_name(n)}_genomic{suffix}").write_bytes(data)
+    (raw / f"{_name(4)}_genomic.fna.gz").write_bytes(gzip.compress(GOOD))
+    for n, md5 in [(1, hashlib.md5((raw / f"{_name(1)}_genomic.fna.gz").read_bytes()).hexdigest()),
+                   (8, "0" * 32)]:
+        (meta / "checksums" / f"{_name(n)}_md5checksums.txt").write_text(f"{md5}  ./{_name(n)}_genomic.fna.gz\n")
+    ledger = [_name(n) for n in (1, 2, 4, 7, 8, 9, 10, 11)]  # 5 never finished
+    (meta / "bacteria_train_completed.txt").write_text("".join(f"{a}\n" for a in ledger))
+    ftp = "https://ftp.ncbi.nlm.nih.gov/genomes/all/GCA/{0}"
+    (meta / "train_ftp_paths.txt").write_text("".join(f"{ftp.format(_name(n))}\n" for n in range(1, 12)))
+    return raw, meta
+
+
+def _problems(rows):
+    return {row["accession"]: row["problem"] for row in rows}
+
+
+def test_verify_reports_each_problem(tmp_path):
+    _layout(tmp_path)
+    rows = verify_category(tmp_path, "bacteria")
+    problems = _problems(rows)
+    assert {a: p.split(" (")[0] for a, p in problems.items()} == {
+        _name(3): "interrupted download",
+        _name(4): "interrupted decompression",
+        _name(5): "not recorded as complete",
+        _name(6): "missing",
+        _name(7): "truncated gzip",
+        _name(8): "checksum mismatch",
+        _name(9): "only 0 bytes",
+        _name(10): "corrupt gzip",
+        _name(11): f"no contig of {MIN_CONTIG_LENGTH} bp",
+    }
+    assert all(row["split"] == "train" and row["ftp_path"].endswith(row["accession"]) for row in rows)
+
+
+def test_check_file(tmp_path):
+    gz = tmp_path / "a_genomic.fna.gz"
+    gz.write_bytes(gzip.compress(GOOD[:40]) + gzip.compress(GOOD[40:]))  # multi-member
+    md5 = hashlib.md5(gz.read_bytes()).hexdigest()
+    assert check_file(gz, md5) is None
+    assert check_file(gz, None) is None
+    assert check_file(gz, "0" * 32).startswith("checksum mismatch")
+    assert check_file(gz, md5, min_length=len(CONTIG) + 1) == \
+        f"no contig of {len(CONTIG) + 1} bp (longest {len(CONTIG)})"
+    assert check_file(tmp_path / "absent_genomic.fna", None).startswith("unreadable")
+
+
+@pytest.fixture
+def checked(monkeypatch):
+    """Paths check_file reads, in the order verify_category asks for them."""
+    paths = []
+    check = verify.check_file
+    monkeypatch.setattr(verify, "check_file", lambda path, *args: (paths.append(path.name), check(path, *args))[1])
+    return paths
+
+
+def _cached(meta):
+    return json.loads((meta / "bacteria_verify_metrics.json").read_text())["counters"].get("files_cached", 0)
+
+
+def test_unchanged_files_are_not_read_again(tmp_path, checked):
+    raw, meta = _layout(tmp_path)
+    first = verify_category(tmp_path, "bacteria")
+    read = len(checked)
+    assert read == 8 and _cached(meta) == 0
+
+    checked.clear()
+    assert verify_category(tmp_path, "bacteria") == first
+    assert checked == [] and _cached(meta) == read
+
+    # A rewritten file is read again, even at the same size
+    (raw / f"{_name(2)}_genomic.fna").write_bytes(GOOD.replace(b">", b"#"))
+    assert _problems(verify_category(tmp_path, "bacteria"))[_name(2)] == "no FASTA header"
+    assert checked == [f"{_name(2)}_genomic.fna"] and _cached(meta) == read - 1
+
+    # So is every file once the contig threshold changes
+    checked.clear()
+    verify_category(tmp_path, "bacteria", min_length=100)
+    assert len(checked) == read